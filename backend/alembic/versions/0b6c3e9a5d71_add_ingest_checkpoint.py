@@ -0,0 +1,30 @@
+"""add ingest_checkpoint
+
+Revision ID: 0b6c3e9a5d71
+Revises: e93b4d7f2c18
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b6c3e9a5d71'
+down_revision: Union[str, None] = 'e93b4d7f2c18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('ingest_checkpoint',
+        sa.Column('journal', sa.String(), nullable=False),
+        sa.Column('seq', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('journal')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('ingest_checkpoint')
@@ -0,0 +1,35 @@
+"""add latest signal indexes
+
+Revision ID: 5a2f8c61e0d4
+Revises: c4e7a1d93b25
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a2f8c61e0d4'
+down_revision: Union[str, None] = 'c4e7a1d93b25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (索引名, 列)，与 TradingSignal.__table_args__ 保持一致
+INDEXES = [
+    ('ix_trading_signals_trade_id', ['trade_id', 'id']),
+    ('ix_trading_signals_title', ['title', 'id']),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.create_index(name, 'trading_signals', columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _ in INDEXES:
+            op.drop_index(name, table_name='trading_signals', postgresql_concurrently=True)
@@ -0,0 +1,55 @@
+"""shift trading_signals timestamps to China local time
+
+Revision ID: 7d2a4f1c6e83
+Revises: 0b6c3e9a5d71
+Create Date: 2026-10-18 20:00:00.000000
+
+旧版本把带时区的中国时间写进 timestamp without time zone 列，PostgreSQL 按会话时区
+（postgres:14 镜像默认 UTC）换算后只保留墙上时间；新版本写入的是不带时区的中国本地时间。
+本迁移把已有的 created_at/closed_at 从服务器时区换算成中国时间，使新旧记录含义一致。
+
+切换步骤：停掉所有旧版本进程 -> alembic upgrade head -> 启动新版本。迁移之后才写入的
+记录已经是中国时间，不能再换算，所以不要在新版本已经写入之后再执行本迁移。
+旧数据的时区默认取迁移会话的 TimeZone 设置，与旧版本写入时不同时用 -x source_tz=UTC 指定。
+策略状态和日汇总由平仓时间推导，这里清空，新版本启动时自动从 trading_signals 重建。
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2a4f1c6e83'
+down_revision: Union[str, None] = '0b6c3e9a5d71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CHINA_TZ = 'Asia/Shanghai'
+COLUMNS = ('created_at', 'closed_at')
+
+
+def source_tz() -> str:
+    tz = context.get_x_argument(as_dictionary=True).get('source_tz')
+    if tz is None:
+        tz = op.get_bind().execute(sa.text("SELECT current_setting('TimeZone')")).scalar()
+    return tz
+
+
+def shift(source: str, target: str):
+    assignments = ', '.join(f'{column} = ({column} AT TIME ZONE :source) AT TIME ZONE :target' for column in COLUMNS)
+    op.execute(sa.text(f'UPDATE trading_signals SET {assignments}').bindparams(source=source, target=target))
+    op.execute('DELETE FROM strategy_state')
+    op.execute('DELETE FROM strategy_daily_stats')
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    shift(source_tz(), CHINA_TZ)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    shift(CHINA_TZ, source_tz())
@@ -0,0 +1,40 @@
+"""add strategy_state
+
+Revision ID: 8b1d5e2c7a90
+Revises: 3f0f79cb98d9
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b1d5e2c7a90'
+down_revision: Union[str, None] = '3f0f79cb98d9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('strategy_state',
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('win_streak', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('lose_streak', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('trade_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('win_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('loss_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_profit', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('peak_profit', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('last_is_profit', sa.Boolean(), nullable=True),
+        sa.Column('last_closed_at', sa.DateTime(), nullable=True),
+        sa.Column('last_signal_id', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('title')
+    )
+    # 应用启动时发现与平仓记录不一致会自动重建；也可以手动执行 python -m app.services.strategy_state backfill
+
+
+def downgrade() -> None:
+    op.drop_table('strategy_state')
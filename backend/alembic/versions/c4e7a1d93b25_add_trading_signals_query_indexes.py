@@ -0,0 +1,39 @@
+"""add trading_signals query indexes
+
+Revision ID: c4e7a1d93b25
+Revises: 8b1d5e2c7a90
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e7a1d93b25'
+down_revision: Union[str, None] = '8b1d5e2c7a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (索引名, 列, 部分索引条件)，与 TradingSignal.__table_args__ 保持一致
+INDEXES = [
+    ('ix_trading_signals_open_trade_id', ['trade_id', 'id'], 'is_close = false'),
+    ('ix_trading_signals_closed_title', ['title', 'closed_at'], 'is_close = true'),
+    ('ix_trading_signals_closed_at', ['closed_at', 'id'], 'is_close = true'),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY 建索引不锁写入，需要在事务外执行
+    with op.get_context().autocommit_block():
+        for name, columns, where in INDEXES:
+            op.create_index(name, 'trading_signals', columns, unique=False,
+                            postgresql_where=sa.text(where), postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _, _ in INDEXES:
+            op.drop_index(name, table_name='trading_signals', postgresql_concurrently=True)
@@ -0,0 +1,35 @@
+"""add strategy_daily_stats
+
+Revision ID: e93b4d7f2c18
+Revises: 5a2f8c61e0d4
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e93b4d7f2c18'
+down_revision: Union[str, None] = '5a2f8c61e0d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('strategy_daily_stats',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('close_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('win_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('lose_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_profit', sa.Float(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('day', 'title')
+    )
+    # 应用启动时发现与平仓记录不一致会自动重建；也可以手动执行 python -m app.services.strategy_state backfill
+
+
+def downgrade() -> None:
+    op.drop_table('strategy_daily_stats')
@@ -1,11 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, BackgroundTasks
-from sqlalchemy.orm import Session
-from typing import List
-from ..database import get_db
-from ..schemas import TradingSignal
-from ..services.trading_service import TradingService
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, BackgroundTasks, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from ..config import settings
+from ..database import AsyncSessionLocal, get_async_db
+from ..schemas import BacktestSweepRequest, TradingSignal
+from ..services.trading_service import TradingService, to_china_local
+from ..services.signal_ingest import signal_ingest
+from ..services.signal_lanes import signal_lanes
+from ..services.backtest_service import BacktestService, to_epoch_ms
+from ..services import backtest_sweep, history_store
+from ..services import export_service
 from ..services.binance_ws import binance_ws
-from fastapi.responses import FileResponse
+from ..services.subscriptions import normalize_symbol, parse_symbols
+from ..services.strategy_state import get_state, list_states
+from ..services.tick_encoder import API_FRAME
+from fastapi.responses import FileResponse, StreamingResponse
 from ..services.image_service import image_service
 from ..services.telegram_service import telegram_service
 from ..models.trading import TradingSignal as TradingSignalModel
@@ -20,11 +30,19 @@ logger = setup_logger("endpoints")
 
 @router.post("/signal")
 @MonitorService.monitor_request
-async def create_signal(signal: TradingSignal, db: Session = Depends(get_db)):
-    """处理交易信号"""
+async def create_signal(signal: TradingSignal, response: Response):
+    """处理交易信号
+
+    信号按 trade_id 进入处理通道，同一交易按到达顺序处理。
+    开启信号接收日志时，信号写入本地日志后即返回 202 和序号，由后台写入数据库。
+    """
     try:
         logger.info(f"Received signal: {signal.__dict__}")
-        result = await TradingService.create_signal(db, signal)
+        if signal_ingest.running:
+            seq = await signal_ingest.submit(signal)
+            response.status_code = 202
+            return {"status": "accepted", "seq": seq}
+        result = await signal_lanes.submit(signal)
         MonitorService.trade_count.inc()
         if result is None:
             return {"message": "No matching open position found"}
@@ -33,12 +51,49 @@ async def create_signal(signal: TradingSignal, db: Session = Depends(get_db)):
         logger.error(f"Error handling signal: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/signals/batch")
+@MonitorService.monitor_request
+async def create_signals_batch(signals: List[TradingSignal]):
+    """批量处理交易信号：按顺序在一个事务内处理，返回每条信号的结果
+
+    经由信号通道处理，与单条信号之间保持同一 trade_id 的到达顺序。
+    """
+    try:
+        logger.info(f"Received signal batch of {len(signals)}")
+        results = await signal_lanes.submit_batch(signals)
+        MonitorService.trade_count.inc(len(signals))
+        return results
+    except Exception as e:
+        logger.error(f"Error handling signal batch: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/signals/ingest/{seq}")
+async def get_ingest_status(seq: int):
+    """信号接收日志中某个序号的处理状态（pending / applied，最近的附带处理结果）"""
+    status = signal_ingest.status(seq)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown sequence number")
+    return status
+
 @router.get("/signals")
 @MonitorService.monitor_request
-async def get_signals(db: Session = Depends(get_db)):
-    """获取所有交易信号"""
+async def get_signals(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[int] = None,
+    open_only: bool = False,
+    strategy: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取每个 trade_id 的最新记录，按 id 倒序
+
+    分页返回（默认每页 100 条），下一页游标在 X-Next-Cursor 响应头里，作为 after 传回取下一页。
+    """
     try:
-        return await TradingService.get_all_signals(db)
+        signals, next_cursor = await TradingService.get_latest_signals(db, limit, after, open_only, strategy)
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = str(next_cursor)
+        return signals
     except Exception as e:
         logger.error(f"Error getting signals: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -64,52 +119,115 @@ async def send_strategy_report(signals: List[TradingSignalModel], strategy_name:
 async def websocket_endpoint(websocket: WebSocket, symbol: str):
     await websocket.accept()
     logger = setup_logger("websocket")
-    
-    async def price_callback(symbol: str, price: float):
-        if websocket.client_state.CONNECTED:  # 检查连接状态
-            try:
-                await websocket.send_json({"symbol": symbol, "price": price})
-            except Exception as e:
-                logger.error(f"Error sending price update: {str(e)}")
-                return False
-            return True
-        return False
 
     try:
-        binance_ws.add_price_callback(symbol, price_callback)
+        # 支持 /api/ws/btc、/api/ws/btc,eth,sol 和通配 /api/ws/all
+        await binance_ws.register(websocket, API_FRAME, parse_symbols(symbol))
         
         while True:
             try:
-                await websocket.receive_text()  # 保持连接活跃
+                # 保持连接活跃，同时接受 SUBSCRIBE / UNSUBSCRIBE 指令
+                data = await websocket.receive_text()
+                await binance_ws.handle_client_message(websocket, data)
             except Exception:
                 break
                 
     except Exception as e:
         logger.error(f"WebSocket error: {str(e)}")
     finally:
-        binance_ws.remove_price_callback(symbol, price_callback)
+        await binance_ws.unregister(websocket)
+
+@router.get("/prices/{symbol}/ticks")
+async def get_price_ticks(symbol: str, since: Optional[int] = None, until: Optional[int] = None,
+                          limit: int = Query(1000, ge=1, le=10000)):
+    """获取交易对的 tick 历史：since / until 为毫秒时间戳，不传 since 时返回最近 limit 条
+
+    早于进程内缓冲区的部分从历史存储读取。
+    """
+    symbol = normalize_symbol(symbol)
+    if binance_ws.ticks.get(symbol) is None and not history_store.has_history(symbol, history_store.TICK):
+        raise HTTPException(status_code=404, detail=f"No ticks recorded for {symbol}")
+    ticks = history_store.history(symbol, history_store.TICK, since, until, limit)
+    return {"symbol": symbol, "count": len(ticks["ts"]), "ts": ticks["ts"].tolist(), "price": ticks["price"].tolist()}
+
+@router.get("/candles/{symbol}")
+async def get_candles(symbol: str, interval: str = "1m", start: Optional[int] = None, end: Optional[int] = None,
+                      limit: int = Query(500, ge=1, le=5000)):
+    """获取 K 线（最旧的在前，最后一根可能尚未收盘）
+
+    start / end 为毫秒时间戳；不传 start 时返回最近 limit 根。早于进程内 K 线的部分从历史存储读取。
+    """
+    symbol = normalize_symbol(symbol)
+    try:
+        if interval not in binance_ws.candles.resolutions and not history_store.has_history(symbol, interval):
+            raise ValueError(f"Unsupported interval: {interval}")
+        candles = history_store.history(symbol, interval, start, end, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows = [dict(zip(candles, values)) for values in zip(*(column.tolist() for column in candles.values()))]
+    return {"symbol": symbol, "interval": interval, "candles": rows}
 
 @router.get("/signals/{strategy_name}/image")
-async def generate_strategy_image(strategy_name: str, db: Session = Depends(get_db)):
-    signals = db.query(TradingSignalModel).filter(TradingSignalModel.title == strategy_name).all()
+async def generate_strategy_image(strategy_name: str, db: AsyncSession = Depends(get_async_db)):
+    signals = (await db.scalars(select(TradingSignalModel).where(TradingSignalModel.title == strategy_name))).all()
     if not signals:
         raise HTTPException(status_code=404, detail="Strategy not found")
     
     image_path = image_service.generate_strategy_image(signals, strategy_name)
     return FileResponse(image_path)
 
+def export_response(stmt, fmt: str, filename: str) -> StreamingResponse:
+    """流式导出响应：行从数据库游标分批读出、编码后立即发送，内存占用与总行数无关"""
+    try:
+        export_service.check_format(fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        export_service.stream(AsyncSessionLocal, stmt, fmt),
+        media_type=export_service.FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    )
+
+@router.get("/signals/export")
+async def export_signals(
+    format: str = "ndjson",
+    strategy: Optional[str] = None,
+    start_time: Optional[str] = None,
+    end_time: Optional[str] = None,
+    closed_only: bool = False
+):
+    """流式导出交易记录（ndjson / csv / parquet），可按策略和开仓时间范围过滤"""
+    try:
+        start = to_china_local(datetime.fromisoformat(start_time.replace('Z', '+00:00'))) if start_time else None
+        end = to_china_local(datetime.fromisoformat(end_time.replace('Z', '+00:00'))) if end_time else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    stmt = export_service.signals_query(strategy, start, end, closed_only)
+    return export_response(stmt, format, f"signals_{strategy or 'all'}")
+
 @router.get("/signals/{title}/history")
-async def get_strategy_history(title: str, db: Session = Depends(get_db)):
-    """获取策略历史记录"""
+async def get_strategy_history(title: str, format: Optional[str] = None,
+                               db: AsyncSession = Depends(get_async_db)):
+    """获取策略历史记录；指定 format（ndjson / csv / parquet）时流式返回"""
+    if format is not None:
+        return export_response(export_service.history_query(title), format, f"{title}_history")
     return await TradingService.get_strategy_history(db, title)
 
 @router.get("/signals/statistics")
 async def get_signals_statistics(
     start_time: str,
     end_time: str,
-    db: Session = Depends(get_db)
+    strategy: Optional[str] = None,
+    include_records: bool = False,
+    records_limit: int = Query(50, ge=1, le=500),
+    records_after: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取时间段内的平仓统计"""
+    """获取时间段内的平仓统计
+
+    include_records 时每个策略附带最近 records_limit 条明细；records_next 是下一页游标，
+    翻页时带上 strategy 和 records_after。
+    """
     try:
         # 移除 'Z' 后缀并添加时区信息
         try:
@@ -126,7 +244,65 @@ async def get_signals_statistics(
         end = end.astimezone(china_tz)
         
         logger.info(f"Querying signals between {start} and {end}")
-        return await TradingService.get_closed_signals_by_timerange(db, start, end)
+        return await TradingService.get_closed_signals_by_timerange(
+            db, start, end, strategy, include_records, records_limit, records_after)
     except ValueError as e:
         logger.error(f"Date parsing error: {e}")
-        raise HTTPException(status_code=400, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e)) 
+
+@router.get("/strategies")
+async def get_strategy_states(db: AsyncSession = Depends(get_async_db)):
+    """所有策略的当前状态：连胜/连亏、胜负次数、累计收益"""
+    return [state.to_dict() for state in await list_states(db)]
+
+@router.get("/strategies/{title}")
+async def get_strategy_state(title: str, db: AsyncSession = Depends(get_async_db)):
+    """单个策略的当前状态（单行查询）"""
+    state = await get_state(db, title)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Strategy not found")
+    return state.to_dict()
+
+@router.get("/strategies/{title}/backtest")
+async def backtest_strategy(
+    title: str,
+    symbol: str,
+    start_time: Optional[str] = None,
+    end_time: Optional[str] = None,
+    interval: str = "1m",
+    fee: float = Query(0.0, ge=0),
+    points: int = Query(500, ge=2, le=5000),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """在保存的行情上重放策略记录的交易：返回胜率、收益、最大回撤、夏普和抽样后的资金曲线"""
+    try:
+        start = to_china_local(datetime.fromisoformat(start_time.replace('Z', '+00:00'))) if start_time else None
+        end = to_china_local(datetime.fromisoformat(end_time.replace('Z', '+00:00'))) if end_time else None
+        result = await BacktestService.run_backtest(db, title, symbol, start, end, interval, fee)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return result.to_dict(points)
+
+@router.post("/backtest/sweep")
+async def backtest_sweep_stream(request: BacktestSweepRequest):
+    """在保存的行情上扫描均线交叉策略的参数网格（进程池并行）
+
+    以 NDJSON 流式返回：每完成一批参数先输出各组合的结果行，再输出一行 {"progress", "total"}。
+    """
+    try:
+        combos = backtest_sweep.parameter_grid(request.grid)
+        if len(combos) > settings.BACKTEST_SWEEP_MAX_COMBINATIONS:
+            raise ValueError(f"Too many combinations: {len(combos)} > {settings.BACKTEST_SWEEP_MAX_COMBINATIONS}")
+        start = to_china_local(datetime.fromisoformat(request.start_time.replace('Z', '+00:00'))) \
+            if request.start_time else None
+        end = to_china_local(datetime.fromisoformat(request.end_time.replace('Z', '+00:00'))) \
+            if request.end_time else None
+        series = BacktestService.price_history(
+            request.symbol, request.interval, to_epoch_ms(start) if start is not None else None,
+            to_epoch_ms(end) if end is not None else None)
+        if not len(series):
+            raise ValueError(f"No price history for {normalize_symbol(request.symbol)} in the requested range")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(backtest_sweep.stream_ndjson(series, request.grid, request.fee),
+                             media_type="application/x-ndjson")
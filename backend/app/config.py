@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from datetime import timedelta
+from typing import Optional
 import logging
 
 # 设置日志级别
@@ -17,6 +18,9 @@ class Settings(BaseSettings):
     DB_POOL_SIZE: int = 20
     DB_MAX_OVERFLOW: int = 10
     DB_POOL_TIMEOUT: int = 30
+    POSITION_INDEX_VERIFY_INTERVAL: float = 300.0  # 未平仓索引与数据库的核对间隔（秒）
+    POSITION_INDEX_SYNC_INTERVAL: float = 0.5  # 从数据库拉取其它 worker 开平仓的间隔（秒）
+    POSITION_INDEX_SYNC_LAG: float = 5.0  # 拉取时的回看窗口（秒），覆盖分配 id/平仓时间之后才提交的事务
     
     # 生产环境配置
     PRODUCTION: bool = True
@@ -28,8 +32,88 @@ class Settings(BaseSettings):
     # 监控配置
     ENABLE_METRICS: bool = True
     METRICS_PORT: int = 9090
+
+    # WebSocket 广播配置
+    BROADCAST_MAX_PENDING: int = 256  # 每个客户端最多排队的交易对数量（按交易对合并，只防订阅过多）
+    BROADCAST_MAX_LAG: float = 2.0  # 最早一条未发出的消息等待超过该时间（秒）即丢弃客户端
+    BROADCAST_SEND_TIMEOUT: float = 5.0  # 单次发送超时（秒），超时即丢弃客户端
+
+    # 上游行情连接配置
+    BINANCE_STREAM_URL: str = "wss://fstream.binance.com/stream"  # combined stream 地址
+    UPSTREAM_MAX_STREAMS_PER_CONNECTION: int = 200  # 单连接 stream 数（交易所上限 1024，留出余量）
+    UPSTREAM_MIN_CONNECTIONS: int = 2  # 至少保持的上游连接数，一条断开时可迁移到另一条
+    UPSTREAM_SUBSCRIBE_BATCH_WINDOW: float = 0.2  # 新订阅合并窗口（秒）
+    UPSTREAM_RECONNECT_DELAY: float = 5.0
+    UPSTREAM_MAX_CONNECTION_AGE: float = 23 * 3600  # 交易所 24 小时强制断开，提前轮换
+
+    # 行情历史配置
+    TICK_BUFFER_CAPACITY: int = 86400  # 每个交易对保留的 tick 数（1 秒一条约一天，约 1.4MB）
+    CANDLE_HISTORY: int = 1000  # 每个交易对每个周期保留的已收盘 K 线数
+    PRICE_MAX_AGE: float = 5.0  # 价格新鲜度上限（秒），超过则等待下一个 tick
+    PRICE_WAIT_TIMEOUT: float = 3.0  # 等待新 tick 的最长时间（秒）
+
+    # 本地历史行情（按 交易对/种类/UTC 日期 分区的列式文件，供回测和图表读取）
+    HISTORY_DIR: str = "history"
+    HISTORY_RECORD_ENABLED: bool = False  # 是否把实时 tick 和收盘 K 线写入历史存储
+    HISTORY_FLUSH_INTERVAL: float = 5.0  # 落盘间隔（秒）
+    HISTORY_CANDLE_INTERVALS: str = "1m,1h"  # 落盘的 K 线周期（逗号分隔）
+
+    # 行情录制与回放
+    FEED_SOURCE: str = "binance"  # binance: 交易所实时行情；replay: 回放录制文件；simulator: 模拟行情
+    FEED_RECORD_ENABLED: bool = False  # 是否录制上游原始消息
+    FEED_RECORD_DIR: str = "feed_records"  # 录制目录，每小时一个文件
+    FEED_REPLAY_PATH: str = "feed_records"  # 回放的录制文件或目录
+    FEED_REPLAY_SPEED: float = 1.0  # 1 为原速，N 为 N 倍速，0 为最快速度
+
+    # 行情模拟（FEED_SOURCE=simulator，用于容量测试）
+    SIMULATOR_MODEL: str = "regime"  # gbm: 几何布朗运动；regime: 平稳/剧烈状态切换
+    SIMULATOR_TICK_RATE: float = 1.0  # 每秒推进的步数，每步所有交易对各一个 tick
+    SIMULATOR_SYMBOLS: int = 0  # 额外生成的合成交易对数量
+    SIMULATOR_CONFIG: str = ""  # 每个交易对 start/drift/vol/low/high 的 JSON 文件
+    SIMULATOR_REGIME_SWITCH_PROB: float = 0.01  # 每步切换状态的概率
+    SIMULATOR_SEED: Optional[int] = None
+
+    # 多 worker 共享价格表（只有一个 worker 连接上游，其它 worker 读共享内存）
+    PRICE_TABLE_ENABLED: bool = True
+    PRICE_TABLE_PATH: str = ""  # 为空时使用 /dev/shm/trading_price_table_<API_PORT>_<应用目录哈希>
+    PRICE_TABLE_CAPACITY: int = 4096  # 最多交易对数量，每个 64 字节
+    PRICE_TABLE_POLL_INTERVAL: float = 0.05  # 非所有者 worker 轮询间隔（秒）
+    PRICE_TABLE_TAKEOVER_INTERVAL: float = 2.0  # 非所有者尝试接管行情的间隔（秒）
+
+    # 信号处理通道（按 trade_id 分片：同一交易按序处理，不同交易并行）
+    SIGNAL_LANES: int = 16
+    SIGNAL_LANE_QUEUE_SIZE: int = 1000  # 每条通道最多排队的信号数，排满时请求等待
+
+    # 止盈止损触发（按 tick 检查 zs_tp_trigger_px / zy_tp_trigger_px，触发时以该 tick 价格平仓）
+    TRIGGER_ENGINE_ENABLED: bool = True
+
+    # 未平仓浮动盈亏（按 tick 向量化计算，策略汇总推送到 /ws/pnl）
+    PNL_ENGINE_ENABLED: bool = True
+    PNL_PUBLISH_INTERVAL: float = 0.5  # 策略汇总的推送间隔（秒），间隔内的变化合并成一次
+
+    # 信号接收日志（开启后 /api/signal 写入本地日志即返回序号，由后台分组提交到数据库）
+    INGEST_ENABLED: bool = False
+    INGEST_JOURNAL_DIR: str = "ingest"  # 所有 worker 共用的日志 signals.journal，无法写入的记录移到 signals.dead
+    INGEST_BATCH_SIZE: int = 500  # 每次分组提交的最大信号数
+    INGEST_COMMIT_WINDOW: float = 0.01  # 攒批等待时间（秒）
+    INGEST_POLL_INTERVAL: float = 0.05  # 写库的 worker 检查其它 worker 新写入日志的间隔（秒）
+    INGEST_TAKEOVER_INTERVAL: float = 1.0  # 其它 worker 尝试接管写库的间隔（秒）
+    INGEST_RETRY_DELAY: float = 1.0  # 写入数据库失败后的重试间隔（秒）
+    INGEST_MAX_ATTEMPTS: int = 3  # 单条记录连续失败这么多次后移入死信文件
+    INGEST_COMPACT_BYTES: int = 64 * 1024 * 1024  # 全部写入后日志超过该大小时截断
+
+    # 回测参数扫描（进程池，行情数组以内存映射文件共享给工作进程）
+    BACKTEST_SWEEP_WORKERS: int = 0  # 工作进程数，0 表示 CPU 核数
+    BACKTEST_SWEEP_MAX_COMBINATIONS: int = 10000  # 单次扫描最多的参数组合数
+    BACKTEST_SWEEP_CONCURRENCY: int = 1  # 每个进程同时运行的扫描数，超出的请求排队
+
+    # 导出与备份
+    EXPORT_CHUNK_SIZE: int = 1000  # 流式导出每批从数据库游标读取的行数
+    BACKUP_DIR: str = "backups"
+    BACKUP_RETENTION_DAYS: int = 7
     
     class Config:
         env_file = ".env"
+        extra = "ignore"
 
 settings = Settings() 
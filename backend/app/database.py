@@ -1,9 +1,11 @@
+from contextlib import asynccontextmanager
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from .config import settings
 
-# 创建数据库引擎
+# 创建数据库引擎（同步引擎只用于建表、迁移和命令行工具）
 engine = create_engine(
     settings.DATABASE_URL,
     echo=True
@@ -12,9 +14,48 @@ engine = create_engine(
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+
+def async_database_url(url: str) -> str:
+    """把同步连接串换成对应的异步驱动：PostgreSQL 用 asyncpg，SQLite 用 aiosqlite"""
+    scheme, sep, rest = url.partition("://")
+    driver = {
+        "postgresql": "postgresql+asyncpg",
+        "postgresql+psycopg2": "postgresql+asyncpg",
+        "postgres": "postgresql+asyncpg",
+        "sqlite": "sqlite+aiosqlite",
+    }.get(scheme, scheme)
+    return f"{driver}{sep}{rest}"
+
+
+# 请求路径上的异步引擎：数据库 I/O 不再阻塞事件循环（行情推送与查询并行）
+_async_url = async_database_url(settings.DATABASE_URL)
+async_engine = create_async_engine(
+    _async_url,
+    **({} if _async_url.startswith("sqlite") else {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_pre_ping": True,
+    })
+)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+
+@asynccontextmanager
+async def get_async_session():
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as session:
+        yield session
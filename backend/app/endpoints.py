@@ -26,11 +26,8 @@ async def receive_signal(signal: dict):
     # 将 currentcy 转换为 USDT 交易对
     trading_pair = f"{currentcy.upper()}USDT"  # 确保转换为大写并加上 USDT 后缀
 
-    # 动态订阅交易对
-    await binance_ws.subscribe_symbol(trading_pair)
-
-    # 查询当前价格
-    price = binance_ws.get_current_price(trading_pair)
+    # 查询当前价格（尚无价格时按需订阅并等待第一个 tick）
+    price = await binance_ws.wait_for_price(trading_pair)
     if price is None:
         raise HTTPException(status_code=404, detail=f"Price not found for {trading_pair}")
 
@@ -5,10 +5,18 @@ from fastapi.responses import JSONResponse
 import time
 from .config import settings
 from .api import endpoints
-from .database import engine, Base, get_db
+from .database import engine, async_engine, Base, get_db, AsyncSessionLocal
 from .middleware.error_handler import error_handler_middleware, validation_exception_handler
 import asyncio
-from .services.binance_ws import binance_ws, BinanceWebSocket
+from .services.binance_ws import binance_ws
+from .services.position_index import position_index
+from .services.signal_ingest import signal_ingest
+from .services.signal_lanes import signal_lanes
+from .services.strategy_state import backfill_if_needed as backfill_strategy_state
+from .services.trigger_engine import trigger_engine
+from .services.pnl_engine import pnl_engine
+from .services.history_store import history_recorder
+from .services.subscriptions import parse_symbols
 from .utils.logger import setup_logger
 from fastapi.staticfiles import StaticFiles
 from fastapi.openapi.docs import (
@@ -37,6 +45,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # 性能监控中间件
@@ -96,14 +105,41 @@ app.mount("/metrics", metrics_app)
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting application...")
-    # 启动 WebSocket 连接
-    global binance_ws
-    binance_ws = BinanceWebSocket()
+    # 启动 WebSocket 连接（/ws 与 /api/ws 共用同一个实例和同一个编码阶段）
     asyncio.create_task(binance_ws.start())
+    # 加载未平仓索引，平仓时不再查询数据库；之后定期拉取其它 worker 提交的开平仓
+    async with AsyncSessionLocal() as db:
+        await position_index.load(db)
+    asyncio.create_task(position_index.watch(AsyncSessionLocal))
+    # 策略状态与日汇总：首次启动（或与平仓记录不一致）时从 trading_signals 重建
+    async with AsyncSessionLocal() as db:
+        await backfill_strategy_state(db)
+    # 信号处理通道：同一 trade_id 按序处理，不同交易并行
+    signal_lanes.start(AsyncSessionLocal)
+    # 止盈止损：每个 tick 检查被穿越的触发价
+    if settings.TRIGGER_ENGINE_ENABLED:
+        trigger_engine.start()
+    # 浮动盈亏：每个 tick 重新估值该交易对的未平仓
+    if settings.PNL_ENGINE_ENABLED:
+        pnl_engine.start()
+    # 历史行情落盘：只在连接上游的 worker 里写入，跟随者接管行情时一并接管
+    if settings.HISTORY_RECORD_ENABLED:
+        binance_ws.on_feed_owner(history_recorder.start)
+    # 信号接收日志：重放上次未入库的信号并启动后台分组提交
+    if settings.INGEST_ENABLED:
+        await signal_ingest.start(AsyncSessionLocal)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down application...")
+    trigger_engine.stop()
+    await pnl_engine.stop()
+    await history_recorder.stop()
+    await binance_ws.stop()
+    if signal_ingest.running:
+        await signal_ingest.stop()
+    await signal_lanes.stop()
+    await async_engine.dispose()
 
 @app.get("/docs", include_in_schema=False)
 async def custom_swagger_ui_html():
@@ -127,6 +163,7 @@ async def websocket_endpoint(websocket: WebSocket):
                 # 保持连接活跃
                 data = await websocket.receive_text()
                 logger.info(f"Received message from client: {data}")
+                await binance_ws.handle_client_message(websocket, data)
             except WebSocketDisconnect:
                 logger.info("WebSocket client disconnected")
                 break
@@ -137,4 +174,41 @@ async def websocket_endpoint(websocket: WebSocket):
         logger.error(f"Error in websocket endpoint: {e}")
     finally:
         logger.info("Unregistering WebSocket client")
-        await binance_ws.unregister(websocket) 
\ No newline at end of file
+        await binance_ws.unregister(websocket) 
+
+@app.websocket("/ws/pnl")
+async def pnl_websocket_endpoint(websocket: WebSocket):
+    """各策略未平仓的浮动盈亏汇总：连接时推送全部策略，之后按策略合并推送变化"""
+    await websocket.accept()
+    try:
+        pnl_engine.register(websocket)
+        while True:
+            try:
+                await websocket.receive_text()
+            except WebSocketDisconnect:
+                break
+            except Exception as e:
+                logger.error(f"PnL WebSocket error: {e}")
+                break
+    finally:
+        pnl_engine.unregister(websocket)
+
+@app.websocket("/ws/candles")
+async def candles_websocket_endpoint(websocket: WebSocket, interval: str = "1m", symbols: str = "all"):
+    """K 线收盘事件推送，例如 /ws/candles?interval=1m&symbols=btc,eth"""
+    if interval not in binance_ws.candles.resolutions:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    try:
+        await binance_ws.register_candles(websocket, interval, parse_symbols(symbols))
+        while True:
+            try:
+                await websocket.receive_text()
+            except WebSocketDisconnect:
+                break
+            except Exception as e:
+                logger.error(f"Candle WebSocket error: {e}")
+                break
+    finally:
+        await binance_ws.unregister_candles(websocket, interval)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ARRAY
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Date, DateTime, Float, ARRAY, JSON, Index
 from ..database import Base
 
 class TradingSignal(Base):
@@ -9,7 +9,7 @@ class TradingSignal(Base):
     title = Column(String)
     currentcy = Column(String)  # 改回 currentcy 以匹配请求
     zs_tp_trigger_px = Column(Float, nullable=True)
-    zy_tp_trigger_px = Column(ARRAY(Float), nullable=True)
+    zy_tp_trigger_px = Column(ARRAY(Float).with_variant(JSON(), "sqlite"), nullable=True)  # SQLite（测试）没有数组类型
     lever = Column(Integer, nullable=True)
     side = Column(String, nullable=True)
     is_close = Column(Boolean, default=False)
@@ -20,4 +20,57 @@ class TradingSignal(Base):
     profit_percentage = Column(Float, nullable=True)  # 获利百分比
     is_profit = Column(Boolean, nullable=True)  # 是否盈利
     win_streak = Column(Integer, default=0)  # 连胜次数
-    lose_streak = Column(Integer, default=0)  # 连亏次数 
\ No newline at end of file
+    lose_streak = Column(Integer, default=0)  # 连亏次数
+
+    # 按查询建立的部分索引（迁移 c4e7a1d93b25）：
+    # 平仓按 trade_id 找未平仓记录；策略历史按 (title, closed_at)；统计/回放按 closed_at 范围
+    # 信号列表（迁移 5a2f8c61e0d4）：判断是否为 trade_id 的最新记录、按策略分页
+    __table_args__ = (
+        Index("ix_trading_signals_open_trade_id", trade_id, id,
+              postgresql_where=is_close == False, sqlite_where=is_close == False),
+        Index("ix_trading_signals_closed_title", title, closed_at,
+              postgresql_where=is_close == True, sqlite_where=is_close == True),
+        Index("ix_trading_signals_closed_at", closed_at, id,
+              postgresql_where=is_close == True, sqlite_where=is_close == True),
+        Index("ix_trading_signals_trade_id", trade_id, id),
+        Index("ix_trading_signals_title", title, id),
+    )
+
+class StrategyState(Base):
+    """每个策略的当前状态，随每次平仓在同一事务内更新"""
+    __tablename__ = "strategy_state"
+
+    title = Column(String, primary_key=True)
+    win_streak = Column(Integer, default=0, nullable=False)  # 当前连胜次数
+    lose_streak = Column(Integer, default=0, nullable=False)  # 当前连亏次数
+    trade_count = Column(Integer, default=0, nullable=False)  # 平仓次数
+    win_count = Column(Integer, default=0, nullable=False)
+    loss_count = Column(Integer, default=0, nullable=False)
+    total_profit = Column(Float, default=0.0, nullable=False)  # 累计获利百分比
+    peak_profit = Column(Float, default=0.0, nullable=False)  # 累计获利百分比的历史最高值
+    last_is_profit = Column(Boolean, nullable=True)  # 最近一次平仓是否盈利
+    last_closed_at = Column(DateTime, nullable=True)
+    last_signal_id = Column(Integer, nullable=True)  # 最近一次平仓的 trading_signals.id
+
+    def to_dict(self) -> dict:
+        return {column.name: getattr(self, column.name) for column in self.__table__.columns}
+
+
+class StrategyDailyStats(Base):
+    """按策略和平仓日期（中国时区）汇总的平仓统计，随每次平仓在同一事务内累加"""
+    __tablename__ = "strategy_daily_stats"
+
+    day = Column(Date, primary_key=True)  # 主键以日期开头，按日期范围查询直接走主键
+    title = Column(String, primary_key=True)
+    close_count = Column(Integer, default=0, nullable=False)
+    win_count = Column(Integer, default=0, nullable=False)  # is_profit 为真的平仓次数
+    lose_count = Column(Integer, default=0, nullable=False)  # 其余平仓（含未计算盈亏的）
+    total_profit = Column(Float, default=0.0, nullable=False)  # 获利百分比之和
+
+
+class IngestCheckpoint(Base):
+    """信号日志已写入 trading_signals 的最大序号，与写入在同一事务内推进"""
+    __tablename__ = "ingest_checkpoint"
+
+    journal = Column(String, primary_key=True)  # 日志名（每个 worker 一个）
+    seq = Column(BigInteger, nullable=False, default=0)
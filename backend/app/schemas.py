@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 # 开仓信号 schema
@@ -38,6 +38,15 @@ class TradingSignal(BaseModel):
     class Config:
         from_attributes = True
 
+# 回测参数扫描：grid 为参数名 -> 取值列表（fast、slow、side、lever、stop、take）
+class BacktestSweepRequest(BaseModel):
+    symbol: str
+    interval: str = "1m"
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    fee: float = 0.0
+    grid: Dict[str, List[Any]]
+
 # 用户相关的 schema
 class UserBase(BaseModel):
     username: str
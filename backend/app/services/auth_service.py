@@ -3,7 +3,8 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional
 from ..models.user import User
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = "your-secret-key"  # 在生产环境中应该使用环境变量
@@ -38,8 +39,8 @@ class AuthService:
             return None
 
     @staticmethod
-    async def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
-        user = db.query(User).filter(User.username == username).first()
+    async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
+        user = await db.scalar(select(User).where(User.username == username))
         if not user or not AuthService.verify_password(password, user.hashed_password):
             return None
         return user 
\ No newline at end of file
@@ -1,31 +1,314 @@
-from datetime import datetime, timedelta
-import pandas as pd
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional, Tuple, Union
 import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.trading import TradingSignal as TradingSignalModel
+from .binance_ws import binance_ws
+from .history_store import TICK, has_history, history
+from .subscriptions import normalize_symbol
+from .trading_service import CHINA_TZ
+from ..utils.logger import setup_logger
+
+logger = setup_logger("backtest_service")
+
+YEAR_MS = 365 * 24 * 3600 * 1000
+
+
+def to_epoch_ms(value: datetime) -> int:
+    """数据库里的时间是不带时区的中国时间，行情时间戳是 UTC 毫秒"""
+    if value.tzinfo is None:
+        value = CHINA_TZ.localize(value)
+    return int(value.timestamp() * 1000)
+
+
+def sma(values: np.ndarray, window: int) -> np.ndarray:
+    """简单移动平均（前 window-1 个为 nan），用累加和一次算出"""
+    out = np.full(len(values), np.nan)
+    if window <= len(values):
+        sums = np.cumsum(np.concatenate(([0.0], values)))
+        out[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return out
+
+
+class PriceSeries:
+    """一个交易对的行情数组：毫秒时间戳 + OHLC；tick 行情的四个价格相同"""
+
+    def __init__(self, ts: np.ndarray, close: np.ndarray, open: np.ndarray = None,
+                 high: np.ndarray = None, low: np.ndarray = None):
+        self.ts = np.asarray(ts, dtype=np.int64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.open = self.close if open is None else np.asarray(open, dtype=np.float64)
+        self.high = self.close if high is None else np.asarray(high, dtype=np.float64)
+        self.low = self.close if low is None else np.asarray(low, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    @classmethod
+    def from_candles(cls, candles) -> "PriceSeries":
+        count = len(candles)
+        return cls(np.fromiter((c.open_time for c in candles), np.int64, count),
+                   np.fromiter((c.close for c in candles), np.float64, count),
+                   np.fromiter((c.open for c in candles), np.float64, count),
+                   np.fromiter((c.high for c in candles), np.float64, count),
+                   np.fromiter((c.low for c in candles), np.float64, count))
+
+    @classmethod
+    def from_ticks(cls, ticks) -> "PriceSeries":
+        """由 TickSlice（环形缓冲区上的一段或两段视图）拼成连续数组"""
+        if not ticks.segments:
+            return cls(np.zeros(0, dtype=np.int64), np.zeros(0))
+        return cls(np.concatenate([ts for ts, _ in ticks.segments]),
+                   np.concatenate([price for _, price in ticks.segments]))
+
+    def between(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> "PriceSeries":
+        lo = 0 if start_ms is None else int(np.searchsorted(self.ts, start_ms, side="left"))
+        hi = len(self.ts) if end_ms is None else int(np.searchsorted(self.ts, end_ms, side="right"))
+        return PriceSeries(self.ts[lo:hi], self.close[lo:hi], self.open[lo:hi], self.high[lo:hi], self.low[lo:hi])
+
+    def index_at(self, ts_ms: np.ndarray) -> np.ndarray:
+        """每个时间点所在的 K 线（开盘时间 <= 该时间的最后一根），早于第一根的取第一根"""
+        return np.clip(np.searchsorted(self.ts, ts_ms, side="right") - 1, 0, max(len(self.ts) - 1, 0))
+
+    def periods_per_year(self) -> float:
+        if len(self.ts) < 2:
+            return 0.0
+        step = float(np.median(np.diff(self.ts)))
+        return YEAR_MS / step if step > 0 else 0.0
+
+
+class Trades:
+    """一组交易的列数组：进出场所在的 K 线下标、方向（1 / -1）、杠杆
+
+    exit_price 为空时在出场 K 线的收盘价成交，止损/止盈出场时为触发价。
+    """
+
+    def __init__(self, entry: np.ndarray, exit: np.ndarray, sign: np.ndarray, lever: np.ndarray,
+                 exit_price: Optional[np.ndarray] = None):
+        self.entry = np.asarray(entry, dtype=np.int64)
+        self.exit = np.asarray(exit, dtype=np.int64)
+        self.sign = np.asarray(sign, dtype=np.float64)
+        self.lever = np.asarray(lever, dtype=np.float64)
+        self.exit_price = None if exit_price is None else np.asarray(exit_price, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.entry)
+
+
+class BacktestResult:
+    def __init__(self, series: PriceSeries, trades: Trades, trade_returns: np.ndarray,
+                 returns: np.ndarray, equity: np.ndarray, drawdown: np.ndarray, stats: dict):
+        self.series = series
+        self.trades = trades
+        self.trade_returns = trade_returns
+        self.returns = returns
+        self.equity = equity
+        self.drawdown = drawdown
+        self.stats = stats
+
+    def to_dict(self, points: int = 500) -> dict:
+        """统计指标 + 抽样后的资金曲线（最多 points 个点，保留最后一个）"""
+        step = max(1, -(-len(self.equity) // points))
+        picks = np.unique(np.append(np.arange(0, len(self.equity), step), len(self.equity) - 1)) \
+            if len(self.equity) else np.zeros(0, dtype=np.int64)
+        return {
+            **self.stats,
+            'equity_curve': {'ts': self.series.ts[picks].tolist(), 'equity': self.equity[picks].tolist(),
+                             'drawdown': self.drawdown[picks].tolist()},
+        }
+
+
+Rule = Union[np.ndarray, Callable[[PriceSeries], np.ndarray]]
+
 
 class BacktestService:
+    """向量化回测：交易（规则生成的或数据库里记录的）全部换算成 K 线下标，
+    持仓、逐根收益、资金曲线、回撤和夏普都是整列运算，没有逐根循环。
+
+    成交价为信号所在 K 线的收盘价；收益按杠杆放大，单根 K 线亏完保证金时权益归零。
+    """
+
+    @staticmethod
+    def rules_to_trades(series: PriceSeries, entry: Rule, exit: Rule, side: str = "buy",
+                        lever: float = 1.0) -> Trades:
+        """entry / exit 是布尔数组或由 PriceSeries 生成布尔数组的函数：
+        空仓时 entry 为真的 K 线开仓，持仓时 exit 为真的 K 线平仓（同时为真时以 exit 为准）"""
+        entry = np.asarray(entry(series) if callable(entry) else entry, dtype=bool)
+        exit = np.asarray(exit(series) if callable(exit) else exit, dtype=bool)
+        n = len(series)
+        # 最近一次事件决定持仓：entry -> 1，exit -> 0，之前没有事件 -> 0
+        events = np.where(exit, 0, np.where(entry, 1, -1))
+        last = np.maximum.accumulate(np.where(events >= 0, np.arange(n), -1)) if n else np.zeros(0, np.int64)
+        state = np.where(last >= 0, events[np.maximum(last, 0)], 0)
+        change = np.diff(np.concatenate(([0], state, [0])))
+        entries = np.flatnonzero(change == 1)
+        exits = np.flatnonzero(change == -1)
+        exits = np.minimum(exits, n - 1)  # 到最后仍持仓的在最后一根平仓
+        sign = -1.0 if side == "sell" else 1.0
+        return Trades(entries, exits, np.full(len(entries), sign), np.full(len(entries), float(lever)))
+
+    @staticmethod
+    def signals_to_trades(series: PriceSeries, opened_at: Iterable[datetime], closed_at: Iterable[Optional[datetime]],
+                          sides: Iterable[Optional[str]], levers: Iterable[Optional[int]]) -> Tuple[Trades, int]:
+        """把记录的开平仓时间换算到 K 线下标；未平仓的（或平仓晚于最后一根的）在最后一根平仓
+
+        开仓时间不在行情范围内的记录没有可用的开仓价，跳过；返回 (交易, 跳过的条数)。
+        """
+        opened_ms = np.fromiter((to_epoch_ms(t) for t in opened_at), np.int64)
+        closed = list(closed_at)
+        last = int(series.ts[-1]) if len(series) else 0
+        closed_ms = np.fromiter((to_epoch_ms(t) if t is not None else last for t in closed), np.int64, len(closed))
+        sign = np.fromiter((-1.0 if side == "sell" else 1.0 for side in sides), np.float64)
+        lever = np.fromiter((lever or 1 for lever in levers), np.float64)
+        covered = (opened_ms >= series.ts[0]) & (opened_ms <= last) if len(series) \
+            else np.zeros(len(opened_ms), bool)
+        trades = Trades(series.index_at(opened_ms[covered]), series.index_at(closed_ms[covered]),
+                        sign[covered], lever[covered])
+        return trades, int(len(opened_ms) - covered.sum())
+
+    @staticmethod
+    def apply_stops(series: PriceSeries, trades: Trades, stop_loss: Optional[float] = None,
+                    take_profit: Optional[float] = None) -> Trades:
+        """按距开仓价的比例加上止损/止盈：持仓期间最先触及的 K 线出场，成交价为触发价（跳空时为开盘价）
+
+        同一根 K 线同时触及两者时按止损处理。所有交易的持仓区间展开成一个扁平数组，
+        一次向量运算判断每根 K 线是否触及，再按交易取第一个触及的位置，不逐笔循环。
+        """
+        if stop_loss is None and take_profit is None:
+            return trades
+        close, high, low, open_ = series.close, series.high, series.low, series.open
+        exit = trades.exit.copy()
+        exit_price = close[exit].copy() if trades.exit_price is None else trades.exit_price.copy()
+
+        # 持仓区间 (entry, exit] 展开：group 是每根 K 线所属的交易，bar 是 K 线下标
+        length = np.maximum(trades.exit - trades.entry, 0)
+        counts = length[length > 0]
+        group = np.repeat(np.flatnonzero(length), counts)
+        offset = np.arange(len(group)) - np.repeat(np.cumsum(counts) - counts, counts)
+        bar = trades.entry[group] + 1 + offset
+
+        direction = np.where(trades.sign > 0, 1.0, -1.0)
+        entry_price = close[trades.entry]
+        stop_level = entry_price * (1.0 - direction * stop_loss) if stop_loss is not None \
+            else np.full(len(trades), np.nan)
+        take_level = entry_price * (1.0 + direction * take_profit) if take_profit is not None \
+            else np.full(len(trades), np.nan)
+        d = direction[group]
+        against = np.where(d > 0, low[bar], high[bar])
+        favour = np.where(d > 0, high[bar], low[bar])
+        hit_stop = (against - stop_level[group]) * d <= 0 if stop_loss is not None else np.zeros(len(bar), bool)
+        hit_take = (favour - take_level[group]) * d >= 0 if take_profit is not None else np.zeros(len(bar), bool)
+
+        hits = np.flatnonzero(hit_stop | hit_take)
+        if len(hits):
+            # group 按交易升序排列，每笔交易第一次出现的位置就是最先触及的 K 线
+            _, first = np.unique(group[hits], return_index=True)
+            k = hits[first]
+            t, b = group[k], bar[k]
+            exit[t] = b
+            long = d[k] > 0
+            gap = open_[b]
+            stop_fill = np.where(long, np.minimum(stop_level[t], gap), np.maximum(stop_level[t], gap))
+            take_fill = np.where(long, np.maximum(take_level[t], gap), np.minimum(take_level[t], gap))
+            exit_price[t] = np.where(hit_stop[k], stop_fill, take_fill)
+        return Trades(trades.entry, exit, trades.sign, trades.lever, exit_price)
+
     @staticmethod
-    async def run_backtest(strategy_id: str, start_date: datetime, end_date: datetime):
-        try:
-            # 获取历史数据
-            historical_data = await DataService.get_historical_data(start_date, end_date)
-            
-            # 运行回测
-            results = []
-            for data in historical_data:
-                signal = await StrategyService.generate_signal(data)
-                if signal:
-                    profit = await BacktestService.calculate_profit(signal, data)
-                    results.append(profit)
-            
-            # 计算统计指标
-            stats = {
-                'total_trades': len(results),
-                'win_rate': len([r for r in results if r > 0]) / len(results),
-                'avg_profit': np.mean(results),
-                'sharpe_ratio': np.mean(results) / np.std(results) if len(results) > 1 else 0
-            }
-            
-            return stats
-        except Exception as e:
-            logger.error(f"Backtest failed: {e}")
-            raise 
\ No newline at end of file
+    def run(series: PriceSeries, trades: Trades, fee: float = 0.0, allocation: float = 1.0) -> BacktestResult:
+        """按交易计算资金曲线和统计指标
+
+        fee 为单边手续费率（按名义价值），allocation 为每笔交易占用的权益比例；
+        同时持有的多笔交易敞口叠加。
+        """
+        n = len(series)
+        close = series.close
+        weight = trades.sign * trades.lever * allocation
+
+        exit_price = close[trades.exit] if trades.exit_price is None else trades.exit_price
+
+        # 每笔交易的收益（杠杆后、扣除双边手续费）
+        trade_returns = trades.sign * trades.lever * (exit_price / close[trades.entry] - 1.0) \
+            - 2.0 * fee * trades.lever if len(trades) else np.zeros(0)
+
+        # 每根 K 线收盘后的敞口：进场处加、出场处减，再做累加
+        delta = np.bincount(trades.entry, weights=weight, minlength=n) \
+            - np.bincount(trades.exit, weights=weight, minlength=n)
+        exposure = np.cumsum(delta)
+        cost = np.bincount(trades.entry, weights=fee * trades.lever * allocation, minlength=n) \
+            + np.bincount(trades.exit, weights=fee * trades.lever * allocation, minlength=n)
+
+        returns = np.zeros(n)
+        if n > 1:
+            returns[1:] = exposure[:-1] * (close[1:] / close[:-1] - 1.0)
+        if trades.exit_price is not None and len(trades):
+            # 不在收盘价出场的交易：出场那根 K 线的收益改为从前一根收盘到成交价
+            held = trades.exit > trades.entry
+            previous = close[np.maximum(trades.exit - 1, 0)]
+            returns += np.bincount(trades.exit[held], minlength=n, weights=(
+                weight * (exit_price - close[trades.exit]) / previous)[held])
+        returns -= cost
+        equity = np.cumprod(np.maximum(1.0 + returns, 0.0))
+        peak = np.maximum.accumulate(equity)
+        drawdown = np.divide(equity, peak, out=np.zeros(n), where=peak > 0) - 1.0
+
+        periods = series.periods_per_year()
+        std = float(np.std(returns)) if n > 1 else 0.0
+        stats = {
+            'total_trades': int(len(trades)),
+            'win_rate': float(np.mean(trade_returns > 0)) if len(trades) else 0.0,
+            'avg_profit': float(np.mean(trade_returns)) if len(trades) else 0.0,
+            'total_return': float(equity[-1] - 1.0) if n else 0.0,
+            'max_drawdown': float(-drawdown.min()) if n else 0.0,
+            'sharpe_ratio': float(np.mean(returns) / std * np.sqrt(periods)) if std > 0 else 0.0,
+        }
+        return BacktestResult(series, trades, trade_returns, returns, equity, drawdown, stats)
+
+    @staticmethod
+    def price_history(symbol: str, interval: str = "1m", start_ms: Optional[int] = None,
+                      end_ms: Optional[int] = None) -> PriceSeries:
+        """历史存储里的行情加上进程内的最新行情：interval 为 K 线周期，或 "tick" 表示逐笔"""
+        if interval != TICK and interval not in binance_ws.candles.resolutions \
+                and not has_history(symbol, interval):
+            raise ValueError(f"Unsupported interval: {interval}")
+        columns = history(symbol, interval, start_ms, end_ms)
+        if interval == TICK:
+            return PriceSeries(columns["ts"], columns["price"])
+        return PriceSeries(columns["open_time"], columns["close"], columns["open"], columns["high"], columns["low"])
+
+    @staticmethod
+    async def run_backtest(db: AsyncSession, title: str, symbol: str, start: Optional[datetime] = None,
+                           end: Optional[datetime] = None, interval: str = "1m", fee: float = 0.0) -> BacktestResult:
+        """在保存的行情上重放某个策略记录的交易（只取该交易对、开仓时间在区间内的）
+
+        start / end 为不带时区的中国时间（与时间列相同）。信号里的交易对可能只写了基础币种
+        （例如 BTC），两种写法都算。
+        """
+        full = normalize_symbol(symbol)
+        stmt = select(
+            TradingSignalModel.created_at, TradingSignalModel.closed_at,
+            TradingSignalModel.side, TradingSignalModel.lever
+        ).where(
+            TradingSignalModel.title == title,
+            func.upper(TradingSignalModel.currentcy).in_([full[:-len("USDT")], full]),
+            TradingSignalModel.created_at.isnot(None)
+        ).order_by(TradingSignalModel.created_at)
+        if start is not None:
+            stmt = stmt.where(TradingSignalModel.created_at >= start)
+        if end is not None:
+            stmt = stmt.where(TradingSignalModel.created_at <= end)
+        rows: List = (await db.execute(stmt)).all()
+
+        series = BacktestService.price_history(
+            symbol, interval, to_epoch_ms(start) if start is not None else None,
+            to_epoch_ms(end) if end is not None else None)
+        if not len(series):
+            raise ValueError(f"No price history for {full} in the requested range")
+        trades, skipped = BacktestService.signals_to_trades(
+            series, (r.created_at for r in rows), [r.closed_at for r in rows],
+            (r.side for r in rows), (r.lever for r in rows))
+        logger.info(f"Backtest {title} on {symbol}: {len(trades)} trades over {len(series)} bars, "
+                    f"{skipped} signals outside the price history skipped")
+        result = BacktestService.run(series, trades, fee)
+        result.stats['skipped_signals'] = skipped
+        return result
@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import numbers
+import os
+import shutil
+import sys
+import tempfile
+import time
+import weakref
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional
+import numpy as np
+from ..config import settings
+from .backtest_service import BacktestService, PriceSeries, sma
+from ..utils.logger import setup_logger
+
+logger = setup_logger("backtest_sweep")
+
+# 可扫描的参数及默认值：均线交叉开仓（fast 上穿 slow），杠杆，止损/止盈距离（开仓价的比例）
+DEFAULTS = {"fast": 20, "slow": 50, "side": "buy", "lever": 1.0, "stop": None, "take": None}
+ARRAYS = ("ts", "open", "high", "low", "close")
+
+_series: Optional[PriceSeries] = None  # 工作进程里映射的行情
+# 每个事件循环一个信号量：限制本进程同时运行的扫描数
+_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+def _valid(name: str, value) -> bool:
+    if name in ("fast", "slow"):
+        return isinstance(value, numbers.Integral) and not isinstance(value, bool) and value >= 1
+    if name == "side":
+        return value in ("buy", "sell")
+    if name == "lever":
+        return _is_number(value) and value > 0
+    return value is None or (_is_number(value) and value > 0)  # stop / take
+
+
+def parameter_grid(grid: Dict[str, List]) -> List[dict]:
+    """参数网格的笛卡尔积；未知参数、不是列表或取值类型不对时抛出 ValueError"""
+    unknown = set(grid) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {sorted(unknown)}")
+    for name, values in grid.items():
+        if not isinstance(values, (list, tuple)) or not values:
+            raise ValueError(f"Sweep parameter {name} needs a non-empty list of values")
+        invalid = [value for value in values if not _valid(name, value)]
+        if invalid:
+            raise ValueError(f"Invalid values for sweep parameter {name}: {invalid}")
+    keys = list(grid)
+    return [{**DEFAULTS, **dict(zip(keys, values))} for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def share_series(series: PriceSeries, directory: str):
+    """把行情数组写成 .npy，工作进程以只读 mmap 打开，共享同一份页缓存而不是各自收到一份 pickle 副本"""
+    for name in ARRAYS:
+        np.save(os.path.join(directory, f"{name}.npy"), getattr(series, name))
+
+
+def load_shared_series(directory: str) -> PriceSeries:
+    arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+    return PriceSeries(arrays["ts"], arrays["close"], arrays["open"], arrays["high"], arrays["low"])
+
+
+def pool_context():
+    """进程池的启动方式：不用 fork，避免复制调用方（例如 uvicorn worker）的事件循环、连接和文件锁"""
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+
+def sweep_slots() -> asyncio.Semaphore:
+    """本进程同时运行的扫描数上限 BACKTEST_SWEEP_CONCURRENCY，超出的排队等待"""
+    loop = asyncio.get_running_loop()
+    slots = _slots.get(loop)
+    if slots is None:
+        slots = _slots[loop] = asyncio.Semaphore(settings.BACKTEST_SWEEP_CONCURRENCY)
+    return slots
+
+
+def _init_worker(directory: str):
+    global _series
+    _series = load_shared_series(directory)
+
+
+def run_params(series: PriceSeries, params: dict, fee: float = 0.0) -> dict:
+    """一组参数的回测结果（参数 + 统计指标）"""
+    fast, slow = int(params["fast"]), int(params["slow"])
+    fast_ma, slow_ma = sma(series.close, fast), sma(series.close, slow)
+    trades = BacktestService.rules_to_trades(series, fast_ma > slow_ma, fast_ma < slow_ma,
+                                             params["side"], float(params["lever"]))
+    trades = BacktestService.apply_stops(series, trades, params["stop"], params["take"])
+    return {**params, **BacktestService.run(series, trades, fee).stats}
+
+
+def _run_chunk(chunk: List[dict], fee: float) -> List[dict]:
+    return [run_params(_series, params, fee) for params in chunk]
+
+
+class Sweep:
+    """在进程池上并行跑参数网格
+
+    行情数组只写一次到临时目录，每个工作进程启动时映射进来；任务只传参数，
+    结果按完成顺序逐批返回。用作上下文管理器，退出时关闭进程池并删除临时文件。
+    """
+
+    def __init__(self, series: PriceSeries, workers: int = None, fee: float = 0.0, chunk_size: int = None):
+        self.series = series
+        self.workers = workers or settings.BACKTEST_SWEEP_WORKERS or os.cpu_count() or 1
+        self.fee = fee
+        self.chunk_size = chunk_size
+        self.directory: Optional[str] = None
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> "Sweep":
+        self.directory = tempfile.mkdtemp(prefix="backtest-sweep-")
+        share_series(self.series, self.directory)
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=pool_context(), initializer=_init_worker,
+                                            initargs=(self.directory,))
+        return self
+
+    def __exit__(self, *exc):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _submit(self, combos: List[dict]) -> List[Future]:
+        # 每个工作进程大约分到 4 批：批次越少开销越小，越多则负载越均衡、进度越细
+        size = self.chunk_size or max(1, len(combos) // (self.workers * 4))
+        return [self.executor.submit(_run_chunk, combos[i:i + size], self.fee) for i in range(0, len(combos), size)]
+
+    def results(self, grid: Dict[str, List], progress: Callable[[int, int], None] = None) -> Iterator[dict]:
+        """按完成顺序逐条产出结果；progress(已完成, 总数) 在每批完成后调用"""
+        combos = parameter_grid(grid)
+        done = 0
+        for future in as_completed(self._submit(combos)):
+            rows = future.result()
+            done += len(rows)
+            if progress is not None:
+                progress(done, len(combos))
+            yield from rows
+
+    async def aresults(self, grid: Dict[str, List]) -> AsyncIterator[dict]:
+        """results 的异步版本，不阻塞事件循环；每批结果之后产出一条 {"progress", "total"}"""
+        combos = parameter_grid(grid)
+        done = 0
+        for future in asyncio.as_completed([asyncio.wrap_future(f) for f in self._submit(combos)]):
+            rows = await future
+            done += len(rows)
+            for row in rows:
+                yield row
+            yield {"progress": done, "total": len(combos)}
+
+
+async def stream_ndjson(series: PriceSeries, grid: Dict[str, List], fee: float = 0.0,
+                        workers: int = None) -> AsyncIterator[bytes]:
+    """HTTP 流式响应：每行一条结果或进度；进程池的启动和关闭放到线程里，不阻塞事件循环
+
+    每个扫描都会占满所有核，本进程同时只运行 BACKTEST_SWEEP_CONCURRENCY 个，其余排队。
+    """
+    async with sweep_slots():
+        sweep = Sweep(series, workers, fee)
+        await asyncio.to_thread(sweep.__enter__)
+        try:
+            async for row in sweep.aresults(grid):
+                yield (json.dumps(row) + "\n").encode()
+        finally:
+            # 客户端断开时取消尚未开始的批次
+            await asyncio.to_thread(sweep.__exit__, None, None, None)
+
+
+def load_npz(path: str) -> PriceSeries:
+    """CLI 输入：包含 ts、close（可选 open/high/low）数组的 .npz 文件"""
+    data = np.load(path)
+    return PriceSeries(data["ts"], data["close"], *(data[name] if name in data else None
+                                                     for name in ("open", "high", "low")))
+
+
+def parse_values(text: str) -> list:
+    """"1,2,5" -> [1, 2, 5]；"none" 表示不设置"""
+    values = []
+    for part in text.split(","):
+        part = part.strip()
+        if part.lower() == "none":
+            values.append(None)
+        else:
+            try:
+                values.append(json.loads(part))
+            except ValueError:
+                values.append(part)
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回测参数扫描，结果以 NDJSON 逐行输出")
+    parser.add_argument("prices", nargs="?", help="行情 .npz 文件（ts、close，可选 open/high/low）")
+    parser.add_argument("--symbol", help="不给 .npz 时从历史存储读取该交易对")
+    parser.add_argument("--interval", default="1m", help="历史存储中的 K 线周期")
+    parser.add_argument("--start", type=int, help="起始毫秒时间戳")
+    parser.add_argument("--end", type=int, help="结束毫秒时间戳")
+    for name in DEFAULTS:
+        parser.add_argument(f"--{name}", type=parse_values, help=f"逗号分隔的取值（默认 {DEFAULTS[name]}）")
+    parser.add_argument("--fee", type=float, default=0.0, help="单边手续费率")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数（默认 CPU 核数）")
+    args = parser.parse_args()
+
+    grid = {name: getattr(args, name) for name in DEFAULTS if getattr(args, name) is not None}
+    if args.prices:
+        series = load_npz(args.prices)
+    elif args.symbol:
+        series = BacktestService.price_history(args.symbol, args.interval, args.start, args.end)
+    else:
+        parser.error("give a .npz file or --symbol")
+    if not len(series):
+        parser.error("no price data")
+    started = time.perf_counter()
+
+    def progress(done: int, total: int):
+        print(f"{done}/{total} ({done / (time.perf_counter() - started):.1f}/s)", file=sys.stderr)
+
+    with Sweep(series, args.workers, args.fee) as sweep:
+        for row in sweep.results(grid, progress):
+            print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,54 @@
 import json
 import os
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..models.trading import TradingSignal as TradingSignalModel
 from ..config import settings
+from .export_service import stream_rows
 from ..utils.logger import setup_logger
 
 logger = setup_logger("backup_service")
 
 class BackupService:
     @staticmethod
-    async def backup_database(db: Session):
+    async def backup_database(db: AsyncSession):
         try:
             # 确保备份目录存在
             os.makedirs(settings.BACKUP_DIR, exist_ok=True)
             
-            # 获取所有数据
-            signals = db.query(TradingSignalModel).all()
-            backup_data = [{
-                'trade_id': s.trade_id,
-                'title': s.title,
-                'currentcy': s.currentcy,
-                'open_price': s.open_price,
-                'close_price': s.close_price,
-                'profit_percentage': s.profit_percentage,
-                'created_at': s.created_at.isoformat(),
-                'closed_at': s.closed_at.isoformat() if s.closed_at else None
-            } for s in signals]
-            
-            # 创建备份文件
+            # 创建备份文件：按批从数据库游标读取并写入，不一次性加载全部记录
             filename = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
             filepath = os.path.join(settings.BACKUP_DIR, filename)
-            
+
+            stmt = select(
+                TradingSignalModel.trade_id, TradingSignalModel.title, TradingSignalModel.currentcy,
+                TradingSignalModel.open_price, TradingSignalModel.close_price,
+                TradingSignalModel.profit_percentage, TradingSignalModel.created_at, TradingSignalModel.closed_at
+            ).order_by(TradingSignalModel.id)
+            count = 0
             with open(filepath, 'w') as f:
-                json.dump(backup_data, f, indent=2)
+                f.write('[')
+                async for rows in stream_rows(db, stmt):
+                    for s in rows:
+                        f.write(',\n' if count else '\n')
+                        f.write(json.dumps({
+                            'trade_id': s.trade_id,
+                            'title': s.title,
+                            'currentcy': s.currentcy,
+                            'open_price': s.open_price,
+                            'close_price': s.close_price,
+                            'profit_percentage': s.profit_percentage,
+                            'created_at': s.created_at.isoformat() if s.created_at else None,
+                            'closed_at': s.closed_at.isoformat() if s.closed_at else None
+                        }))
+                        count += 1
+                f.write('\n]\n')
             
             # 清理旧备份
             await BackupService.cleanup_old_backups()
             
-            logger.info(f"Database backup created: {filename}")
+            logger.info(f"Database backup created: {filename} ({count} records)")
             return filepath
         except Exception as e:
             logger.error(f"Backup failed: {e}")
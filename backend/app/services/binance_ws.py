@@ -1,10 +1,19 @@
 import asyncio
 import json
-import random
-from typing import Dict, Set, Callable
+import time
+from typing import Dict, Set, Callable, Iterable, List, Optional, Tuple
 from ..config import settings
 from ..utils.logger import setup_logger
-import websockets
+from .broadcaster import PriceBroadcaster, PriceCallback
+from .subscriptions import WILDCARD, normalize_symbol
+from .candles import Candle, CandleAggregator
+from .feed_recorder import FeedRecorder, ReplaySource
+from .monitor_service import MonitorService
+from .price_simulator import PriceSimulator
+from .price_table import SharedPriceFollower, SharedPriceTable
+from .tick_buffer import TickStore
+from .tick_encoder import EncodedBar, EncodedTick, KLINE_FRAME, WS_FRAME
+from .upstream import UpstreamConnectionManager
 import logging
 
 logger = logging.getLogger("binance_ws")
@@ -15,217 +24,311 @@ class BinanceWebSocket:
         self.base_symbols = ["BTC", "ETH", "XRP", "SOL", "RUNE", "1000PEPE", "W"]
         # 转换为 USDT 交易对
         self.symbols = [f"{symbol}USDT".lower() for symbol in self.base_symbols]
-        self.ws = None
+        self.upstream = UpstreamConnectionManager(on_message=self.handle_raw)
+        self.recorder = None
+        # 多 worker 时只有持有共享价格表 owner 锁的进程连接上游
+        self.shared_table: Optional[SharedPriceTable] = None
+        # 成为行情所有者（启动时拿到 owner 锁或之后接管）时调用，例如历史行情落盘
+        self.owner_listeners: List[Callable[[], None]] = []
+        self._feed_started = False
         self.prices = {}
+        self.price_times: Dict[str, float] = {}  # 每个价格的接收时间（Unix 秒）
+        self._price_waiters: Dict[str, List[asyncio.Future]] = {}
+        self.ticks = TickStore()
+        self.candles = CandleAggregator()
+        # 每个周期一个广播器，K 线收盘事件推送到 /ws/candles
+        self.candle_broadcasters = {interval: PriceBroadcaster() for interval in self.candles.resolutions}
+        self.candles.add_listener(self._publish_candle)
         self.logger = setup_logger("binance_ws")
-        self.connected_clients = set()
-        # 初始化基准价格
-        self.base_prices = {
-            'BTCUSDT': 52000.0,
-            'ETHUSDT': 3200.0,
-            'XRPUSDT': 0.55
-        }
-        # 记录每个交易对的趋势
-        self.trends = {}
-        # 修改更新间隔为1秒
-        self.update_interval = 1
-        self.current_prices = {}  # 添加存储当前价格的字典
-        self.latest_prices = {}
-
-    async def connect(self):
-        """建立 WebSocket 连接"""
-        while True:
-            try:
-                self.ws = await websockets.connect('wss://fstream.binance.com/ws')
-                self.logger.info("Connected to Binance WebSocket")
-                
-                # 订阅所有交易对的标记价格更新
-                subscription = {
-                    "method": "SUBSCRIBE",
-                    "params": [f"{symbol}@markPrice@1s" for symbol in self.symbols],
-                    "id": 1
-                }
-                
-                await self.ws.send(json.dumps(subscription))
-                self.logger.info("Subscription sent")
-                
-                # 开始接收消息
-                await self.receive_messages()
-                
-            except websockets.exceptions.ConnectionClosed:
-                self.logger.error("Binance WebSocket connection closed")
-            except Exception as e:
-                self.logger.error(f"Connection error: {e}")
-            
-            # 重连前等待
-            await asyncio.sleep(5)
-            self.logger.info("Attempting to reconnect...")
+        self.broadcaster = PriceBroadcaster()
+        # 按交易对索引的订阅表（客户端通道和内部回调共用）
+        self.subscriptions = self.broadcaster.registry
+        self.callbacks: Dict[Callable, PriceCallback] = {}
 
-    async def receive_messages(self):
-        while True:
-            try:
-                message = await self.ws.recv()
-                data = json.loads(message)
-                self.logger.debug(f"Received message: {data}")
-
-                if 's' in data and 'p' in data:
-                    symbol = data['s']
-                    price = float(data['p'])
-                    self.prices[symbol] = price
-
-                    # 只在接收到开仓信号或平仓信号时输出价格日志
-                    if 'is_close' in data or 'trade_id' in data:
-                        self.logger.info(f"Price updated for {symbol}: {price}")
-
-                    # 广播价格更新给所有连接的客户端
-                    for client in self.connected_clients.copy():
-                        try:
-                            message = {
-                                's': symbol,
-                                'p': str(price)
-                            }
-                            await client.send_json(message)
-                            self.logger.debug(f"Successfully sent price update to client: {symbol}={price}")
-                        except Exception as e:
-                            self.logger.error(f"Failed to send price update to client: {e}")
-                            self.connected_clients.remove(client)
-            except Exception as e:
-                self.logger.error(f"Error in receive_messages: {e}")
-                break
-
-    async def register(self, websocket):
-        self.connected_clients.add(websocket)
-        self.logger.info(f"Client registered, total clients: {len(self.connected_clients)}")
-        self.logger.info("Sending initial prices to new client")
-        # 发送当前价格
-        for symbol, price in self.prices.items():
-            try:
-                message = {
-                    's': symbol,
-                    'p': str(price)
-                }
-                self.logger.info(f"Sending initial message to client: {message}")
-                await websocket.send_json(message)
-                self.logger.info(f"Sent initial price to new client: {symbol}={price}")
-            except Exception as e:
-                self.logger.error(f"Error sending initial price: {e}")
-                self.connected_clients.remove(websocket)
-                raise  # 重新抛出异常，让上层处理连接问题
+    def handle_raw(self, raw, data: dict):
+        """上游连接收到的一条消息（combined stream 已解包为 data）"""
+        self.logger.debug(f"Received message: {data}")
+        if self.recorder is not None:
+            self.recorder.record(raw)
+        self.handle_message(data)
+
+    def handle_message(self, data: dict):
+        """处理一条上游消息：更新价格并入队广播，不等待任何客户端"""
+        if 's' in data and 'p' in data:
+            symbol = data['s']
+            price = float(data['p'])
+            received_at = time.time()
+            self.prices[symbol] = price
+            self.price_times[symbol] = received_at
+            waiters = self._price_waiters.pop(symbol, None)
+            if waiters:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(price)
+            # 记录行情历史并更新 K 线：优先使用交易所事件时间 E（毫秒）
+            ts = int(data.get('E') or time.time() * 1000)
+            self.ticks.record(symbol, ts, price)
+            self.candles.update(symbol, ts, price)
+            if self.shared_table is not None and self.shared_table.is_owner:
+                self.shared_table.write(symbol, price, received_at, ts)
+
+            # 只在接收到开仓信号或平仓信号时输出价格日志
+            if 'is_close' in data or 'trade_id' in data:
+                self.logger.info(f"Price updated for {symbol}: {price}")
+
+            # 广播价格更新给所有连接的客户端（只入队，由各客户端写任务发送）
+            self.broadcaster.publish(EncodedTick(symbol, price))
+
+    async def register(self, websocket, variant: str = WS_FRAME, symbols: Iterable[str] = (WILDCARD,)):
+        self.broadcaster.add(websocket, variant, symbols)
+        self.logger.info("Client registered, queueing initial prices")
+        await self._ensure_upstream(symbols)
+        self._send_initial_prices(websocket, symbols)
 
     async def unregister(self, websocket):
-        self.connected_clients.remove(websocket)
+        self.broadcaster.remove(websocket)
+
+    async def register_candles(self, websocket, interval: str, symbols: Iterable[str] = (WILDCARD,)):
+        """订阅某个周期的 K 线收盘事件"""
+        self.candle_broadcasters[interval].add(websocket, KLINE_FRAME, symbols)
+        await self._ensure_upstream(symbols)
+
+    async def unregister_candles(self, websocket, interval: str):
+        self.candle_broadcasters[interval].remove(websocket)
+
+    def _publish_candle(self, symbol: str, interval: str, candle: Candle):
+        self.candle_broadcasters[interval].publish(EncodedBar(symbol, interval, candle))
+
+    async def subscribe_client(self, websocket, symbols: Iterable[str]):
+        """在已连接的客户端上追加订阅交易对"""
+        channel = self.broadcaster.channels.get(websocket)
+        if channel is None:
+            return
+        self.subscriptions.subscribe_many(channel, symbols)
+        await self._ensure_upstream(symbols)
+        self._send_initial_prices(websocket, symbols)
+
+    def unsubscribe_client(self, websocket, symbols: Iterable[str]):
+        channel = self.broadcaster.channels.get(websocket)
+        if channel is None:
+            return
+        for symbol in symbols:
+            self.subscriptions.unsubscribe(channel, symbol)
+
+    async def handle_client_message(self, websocket, text: str):
+        """处理客户端发来的订阅指令：{"method": "SUBSCRIBE" | "UNSUBSCRIBE", "params": ["btcusdt", ...]}"""
+        try:
+            request = json.loads(text)
+        except ValueError:
+            return
+        if not isinstance(request, dict) or not isinstance(request.get('params'), list):
+            return
+        symbols = [normalize_symbol(str(symbol)) for symbol in request['params']]
+        method = str(request.get('method', '')).upper()
+        if method == 'SUBSCRIBE':
+            await self.subscribe_client(websocket, symbols)
+        elif method == 'UNSUBSCRIBE':
+            self.unsubscribe_client(websocket, symbols)
+
+    def _send_initial_prices(self, websocket, symbols: Iterable[str]):
+        symbols = [normalize_symbol(symbol) for symbol in symbols]
+        if WILDCARD in symbols:
+            symbols = list(self.prices)
+        for symbol in symbols:
+            price = self.prices.get(symbol)
+            if price is not None:
+                self.broadcaster.publish_to(websocket, EncodedTick(symbol, price))
+
+    async def _ensure_upstream(self, symbols: Iterable[str]):
+        """客户端订阅了尚未跟踪的交易对时，向上游追加订阅"""
+        for symbol in symbols:
+            symbol = normalize_symbol(symbol)
+            if symbol != WILDCARD:
+                await self.subscribe_symbol(symbol.lower())
 
     async def start(self):
-        """启动 WebSocket 服务"""
-        while True:
+        """启动行情源
+
+        多个 worker 共享一张价格表：抢到 owner 锁的 worker 连接上游并写表，
+        其它 worker 轮询价格表，所有者退出后由其中一个接管。
+        """
+        if settings.PRICE_TABLE_ENABLED:
+            self.shared_table = SharedPriceTable()
+            if not self.shared_table.try_acquire_owner():
+                await self._follow_shared_table()
+            MonitorService.price_table_owner.set(1)
+            self._became_owner()
+            serving = asyncio.create_task(self._serve_shared_table())
             try:
-                await self.connect()
+                await self._run_feed()
+            finally:
+                serving.cancel()
+        else:
+            self._became_owner()
+            await self._run_feed()
+
+    def on_feed_owner(self, callback: Callable[[], None]):
+        """注册成为行情所有者时的回调；本进程已经是所有者时立即调用"""
+        self.owner_listeners.append(callback)
+        if self._feed_started:
+            callback()
+
+    def _became_owner(self):
+        self._feed_started = True
+        for callback in list(self.owner_listeners):
+            try:
+                callback()
             except Exception as e:
-                self.logger.error(f"Connection error in start: {e}")
-            await asyncio.sleep(5)  # 重连间隔
+                self.logger.error(f"Feed owner callback failed: {e}")
+
+    async def _run_feed(self):
+        """默认按单连接上限把所有交易对分片到多条上游连接，也可回放录制文件或运行模拟行情"""
+        if settings.FEED_SOURCE == "replay":
+            await ReplaySource().run(self)
+            return
+        if settings.FEED_SOURCE == "simulator":
+            await PriceSimulator().run(self)
+            return
+        if settings.FEED_RECORD_ENABLED:
+            self.recorder = FeedRecorder()
+        await self.upstream.run([self._stream_name(symbol) for symbol in self.symbols])
+
+    async def _follow_shared_table(self):
+        """非所有者：把共享价格表的变化送入本进程的处理路径，直到接管行情"""
+        self.logger.info("Following the shared price table")
+        follower = SharedPriceFollower(self.shared_table, self._apply_shared_price)
+        last_attempt = time.monotonic()
+        while True:
+            follower.poll()
+            await asyncio.sleep(follower.interval)
+            if time.monotonic() - last_attempt >= settings.PRICE_TABLE_TAKEOVER_INTERVAL:
+                last_attempt = time.monotonic()
+                if self.shared_table.try_acquire_owner():
+                    self.logger.info("Took over the upstream feed")
+                    return
+
+    def _apply_shared_price(self, symbol: str, price: float, received_at: float, event_ts: int):
+        self.handle_message({'s': symbol, 'p': price, 'E': event_ts})
+        # 新鲜度以所有者收到 tick 的时间为准，而不是本进程轮询到的时间
+        self.price_times[symbol] = received_at
+
+    async def _serve_shared_table(self):
+        """所有者：写心跳，并替其它 worker 订阅它们请求的交易对"""
+        while True:
+            self.shared_table.heartbeat()
+            for symbol in self.shared_table.take_requests():
+                await self.subscribe_symbol(symbol.lower())
+            await asyncio.sleep(settings.PRICE_TABLE_POLL_INTERVAL)
+
+    @property
+    def _following(self) -> bool:
+        return self.shared_table is not None and not self.shared_table.is_owner
+
+    @property
+    def owns_feed(self) -> bool:
+        """本进程是否连接上游（没有共享价格表时总是）"""
+        return not self._following
+
+    async def stop(self):
+        self._feed_started = False
+        await self.upstream.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.shared_table is not None:
+            self.shared_table.close()
+            self.shared_table = None
+            MonitorService.price_table_owner.set(0)
+
+    @staticmethod
+    def _stream_name(symbol: str) -> str:
+        return f"{symbol.lower()}@markPrice@1s"
 
     def get_current_price(self, symbol: str) -> float:
         """获取当前价格"""
-        # 移除可能存在的 USDT 后缀
-        symbol = symbol.upper().replace('USDT', '')
-        # 添加 USDT 后缀并转换为大写
-        symbol = f"{symbol}USDT".upper()
-        
+        snapshot = self.get_price_snapshot(symbol)
+        if snapshot is None:
+            self.logger.warning(f"No price found for {normalize_symbol(symbol)}")
+            return None
+        return snapshot[0]
+
+    def get_price_snapshot(self, symbol: str) -> Optional[Tuple[float, float]]:
+        """当前价格及其接收时间 (price, received_at)
+
+        非所有者 worker 直接读共享价格表，所有 worker 拿到的是同一个价格。
+        """
+        symbol = normalize_symbol(symbol)
+        if self._following:
+            shared = self.shared_table.read(symbol)
+            if shared is not None:
+                return shared
         price = self.prices.get(symbol)
         if price is None:
-            self.logger.warning(f"No price found for {symbol}")
-        return price
+            return None
+        return price, self.price_times.get(symbol, 0.0)
 
-    async def simulate_price_updates(self, symbol: str):
-        """模拟价格更新"""
-        symbol_upper = symbol.upper()
-        while True:
-            try:
-                # 更新趋势
-                trend = self.trends[symbol_upper]
-                trend['steps'] += 1
-                if trend['steps'] >= trend['max_steps']:
-                    trend['direction'] = -trend['direction']
-                    trend['strength'] = random.uniform(0.0001, 0.001)
-                    trend['steps'] = 0
-                    trend['max_steps'] = random.randint(10, 30)
-
-                # 生成价格波动
-                base_price = self.base_prices[symbol_upper]
-                trend_change = trend['direction'] * trend['strength']
-                random_change = random.uniform(-0.0005, 0.0005)
-                total_change = trend_change + random_change
-
-                # 更新价格
-                self.base_prices[symbol_upper] *= (1 + total_change)
-                
-                # 确保价格在合理范围内
-                if symbol_upper == 'BTCUSDT':
-                    self.base_prices[symbol_upper] = max(min(self.base_prices[symbol_upper], 55000), 49000)
-                elif symbol_upper == 'ETHUSDT':
-                    self.base_prices[symbol_upper] = max(min(self.base_prices[symbol_upper], 3500), 2900)
-                elif symbol_upper == 'XRPUSDT':
-                    self.base_prices[symbol_upper] = max(min(self.base_prices[symbol_upper], 0.65), 0.45)
-
-                # 保存并广播价格
-                self.prices[symbol_upper] = round(self.base_prices[symbol_upper], 8)
-                self.logger.info(f"Simulated price for {symbol_upper}: {self.prices[symbol_upper]}")
-                await self.broadcast_price(symbol)
-                
-                await asyncio.sleep(self.update_interval)  # 每1秒更新一次
-                
-            except Exception as e:
-                self.logger.error(f"Error in price simulation for {symbol_upper}: {e}")
-                await asyncio.sleep(self.update_interval)
-
-    async def broadcast_price(self, symbol: str):
-        symbol_upper = symbol.upper()
-        if symbol_upper in self.prices:
-            price = self.prices[symbol_upper]
-            callbacks = self.callbacks
-            for callback in callbacks:
-                try:
-                    await callback(symbol_upper, price)
-                except Exception as e:
-                    self.logger.error(f"Error in callback for {symbol_upper}: {str(e)}")
+    async def wait_for_price(self, symbol: str, max_age: float = None, timeout: float = None) -> Optional[float]:
+        """获取足够新的价格
+
+        价格在 max_age 秒内收到则立即返回；否则按需订阅该交易对并等待下一个 tick，
+        超过 timeout 仍未收到时返回已有的旧价格（可能为 None）。
+        """
+        symbol = normalize_symbol(symbol)
+        max_age = settings.PRICE_MAX_AGE if max_age is None else max_age
+        timeout = settings.PRICE_WAIT_TIMEOUT if timeout is None else timeout
+
+        snapshot = self.get_price_snapshot(symbol)
+        if snapshot is not None and time.time() - snapshot[1] <= max_age:
+            return snapshot[0]
+        if snapshot is None:
+            MonitorService.price_missing_total.inc()
+        else:
+            MonitorService.price_stale_total.inc()
+
+        await self.subscribe_symbol(symbol.lower())
+        waiter = asyncio.get_running_loop().create_future()
+        self._price_waiters.setdefault(symbol, []).append(waiter)
+        started = time.monotonic()
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            MonitorService.price_wait_timeouts_total.inc()
+            snapshot = self.get_price_snapshot(symbol)
+            price = snapshot[0] if snapshot is not None else None
+            self.logger.warning(f"No fresh price for {symbol} within {timeout}s, using {price}")
+            return price
+        finally:
+            MonitorService.price_wait_seconds.observe(time.monotonic() - started)
+            waiters = self._price_waiters.get(symbol)
+            if waiters and waiter in waiters:
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._price_waiters[symbol]
 
     def add_price_callback(self, symbol: str, callback: Callable):
-        if symbol not in self.callbacks:
-            self.callbacks.append(callback)
+        """订阅某个交易对（或通配频道 "*"）的价格：callback(symbol, price)"""
+        subscriber = self.callbacks.get(callback)
+        if subscriber is None:
+            subscriber = self.callbacks[callback] = PriceCallback(callback)
+        self.subscriptions.subscribe(subscriber, symbol)
 
     def remove_price_callback(self, symbol: str, callback: Callable):
-        if symbol in self.callbacks:
-            self.callbacks.remove(callback)
-
-    async def start_price_updates(self, symbol: str):
-        while True:
-            try:
-                # 生成模拟价格
-                price = self.generate_simulated_price(symbol)
-                self.current_prices[symbol] = price  # 保存当前价格
-                self.logger.info(f"Simulated price for {symbol}: {price}")
-                
-                # 调用所有回调
-                callbacks = self.callbacks
-                for callback in list(callbacks):
-                    if not await callback(symbol, price):
-                        callbacks.remove(callback)
-                        
-                await asyncio.sleep(1)
-            except Exception as e:
-                self.logger.error(f"Error in price updates for {symbol}: {e}")
-                await asyncio.sleep(1)
+        subscriber = self.callbacks.get(callback)
+        if subscriber is None:
+            return
+        self.subscriptions.unsubscribe(subscriber, symbol)
+        if not self.subscriptions.symbols_of(subscriber):
+            del self.callbacks[callback]
 
     async def subscribe_symbol(self, symbol: str):
-        """动态订阅交易对"""
+        """动态订阅交易对（短时间内的多个新订阅会合并成一个 SUBSCRIBE 帧）"""
+        symbol = symbol.lower()
         if symbol not in self.symbols:
             self.symbols.append(symbol)
-            subscription = {
-                "method": "SUBSCRIBE",
-                "params": [f"{symbol}@markPrice@1s"],
-                "id": 1
-            }
-            await self.ws.send(json.dumps(subscription))
-            self.logger.info(f"Subscribed to {symbol} mark price updates.")
+            if self._following:
+                # 由行情所有者代为订阅，价格经共享价格表到达
+                self.shared_table.request(symbol.upper())
+            else:
+                self.upstream.subscribe([self._stream_name(symbol)])
+            self.logger.info(f"Subscribing to {symbol} mark price updates.")
 
 binance_ws = BinanceWebSocket() 
\ No newline at end of file
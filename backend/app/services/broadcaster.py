@@ -0,0 +1,201 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+from ..config import settings
+from ..utils.logger import setup_logger
+from .monitor_service import MonitorService
+from .subscriptions import SubscriptionRegistry, WILDCARD
+from .tick_encoder import WS_FRAME
+
+logger = setup_logger("broadcaster")
+
+
+class ClientChannel:
+    """单个客户端的发送通道：有界队列 + 独立写任务
+
+    队列按 key（交易对）合并，慢客户端只会收到每个交易对的最新价格。
+    队列里放的是 EncodedTick，发送时取该客户端协议格式的预编码文本。
+    合并后队列长度最多是交易对数量，所以溢出按积压时间判断：最早一条未发出的
+    消息（被覆盖时保留最初的入队时间）等待超过 max_lag 秒即丢弃该客户端。
+    """
+
+    def __init__(self, websocket, broadcaster: "PriceBroadcaster", max_pending: int, send_timeout: float,
+                 variant: str = WS_FRAME, max_lag: float = None):
+        self.websocket = websocket
+        self.variant = variant
+        self.broadcaster = broadcaster
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        self.max_lag = max_lag or settings.BROADCAST_MAX_LAG
+        self.pending: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()  # key -> (消息, 最初入队时间)
+        self.wakeup = asyncio.Event()
+        self.closed = False
+        self.sent_count = 0
+        self.conflated_count = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._writer())
+
+    def offer(self, message: Any) -> bool:
+        """放入一条消息，永不阻塞；返回 False 表示客户端已被丢弃"""
+        if self.closed:
+            return False
+        key = message.key
+        now = time.monotonic()
+        if self.pending and now - next(iter(self.pending.values()))[1] > self.max_lag:
+            self.broadcaster.drop(self, "lagging")
+            return False
+        queued = self.pending.get(key)
+        if queued is not None:
+            # 同一交易对尚未发出的旧价格直接被最新价格覆盖，保留原位置和入队时间
+            self.pending[key] = (message, queued[1])
+            self.conflated_count += 1
+            MonitorService.ws_conflated_total.inc()
+        else:
+            if len(self.pending) >= self.max_pending:
+                self.broadcaster.drop(self, "overflow")
+                return False
+            self.pending[key] = (message, now)
+            MonitorService.ws_queue_depth.inc()
+        self.wakeup.set()
+        return True
+
+    async def _writer(self):
+        try:
+            while not self.closed:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                while self.pending and not self.closed:
+                    _, (message, _) = self.pending.popitem(last=False)
+                    MonitorService.ws_queue_depth.dec()
+                    try:
+                        await asyncio.wait_for(self._send(message), self.send_timeout)
+                    except asyncio.TimeoutError:
+                        self.broadcaster.drop(self, "timeout")
+                        return
+                    except Exception as e:
+                        logger.debug(f"Send failed, dropping client: {e}")
+                        self.broadcaster.drop(self, "error")
+                        return
+                    self.sent_count += 1
+        except asyncio.CancelledError:
+            pass
+
+    async def _send(self, message: Any):
+        await self.websocket.send_text(message.frame(self.variant))
+
+    def discard_pending(self):
+        if self.pending:
+            MonitorService.ws_queue_depth.dec(len(self.pending))
+            self.pending.clear()
+
+
+class PriceCallback:
+    """把普通回调包装成订阅者：callback(symbol, price)
+
+    回调在行情路径上同步执行，必须足够轻；协程回调会放到后台任务中执行，
+    任务在完成前保存在 tasks 里，避免被垃圾回收。
+    """
+
+    def __init__(self, callback: Callable):
+        self.callback = callback
+        self.tasks: Set[asyncio.Task] = set()
+
+    def offer(self, message: Any) -> bool:
+        try:
+            result = self.callback(message.symbol, message.price)
+            if asyncio.iscoroutine(result):
+                task = asyncio.create_task(self._await(result))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+        except Exception as e:
+            logger.error(f"Error in price callback for {message.symbol}: {e}")
+        return True
+
+    async def _await(self, coro):
+        try:
+            await coro
+        except Exception as e:
+            logger.error(f"Error in price callback: {e}")
+
+
+class PriceBroadcaster:
+    """价格扇出：上游读取方只做入队，实际发送由每个客户端自己的写任务完成
+
+    投递目标由订阅表决定：每条行情只会到达该交易对和通配频道的订阅者。
+    """
+
+    def __init__(self, max_pending: int = None, send_timeout: float = None, max_lag: float = None):
+        self.max_pending = max_pending or settings.BROADCAST_MAX_PENDING
+        self.send_timeout = send_timeout or settings.BROADCAST_SEND_TIMEOUT
+        self.max_lag = max_lag or settings.BROADCAST_MAX_LAG
+        self.channels: Dict[Any, ClientChannel] = {}
+        self.closing: Set[asyncio.Task] = set()  # 正在关闭的连接
+        self.registry = SubscriptionRegistry()
+
+    def add(self, websocket, variant: str = WS_FRAME, symbols: Iterable[str] = (WILDCARD,)) -> ClientChannel:
+        channel = ClientChannel(websocket, self, self.max_pending, self.send_timeout, variant, self.max_lag)
+        self.channels[websocket] = channel
+        self.registry.subscribe_many(channel, symbols)
+        channel.start()
+        MonitorService.ws_clients.inc()
+        logger.info(f"Client added, total clients: {len(self.channels)}")
+        return channel
+
+    def remove(self, websocket):
+        channel = self.channels.pop(websocket, None)
+        if channel is None:
+            return
+        self._close_channel(channel)
+        logger.info(f"Client removed, total clients: {len(self.channels)}")
+
+    def drop(self, channel: ClientChannel, reason: str):
+        """按策略丢弃卡住的客户端（队列溢出、发送超时或发送失败）"""
+        if channel.closed:
+            return
+        if self.channels.get(channel.websocket) is channel:
+            del self.channels[channel.websocket]
+        self._close_channel(channel)
+        MonitorService.ws_dropped_total.labels(reason=reason).inc()
+        logger.warning(f"Dropped client ({reason}), total clients: {len(self.channels)}")
+        task = asyncio.create_task(self._close_socket(channel.websocket))
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
+
+    def _close_channel(self, channel: ClientChannel):
+        if channel.closed:
+            return
+        channel.closed = True
+        self.registry.unsubscribe_all(channel)
+        channel.discard_pending()
+        channel.wakeup.set()
+        if channel.task is not None and channel.task is not asyncio.current_task():
+            channel.task.cancel()
+        MonitorService.ws_clients.dec()
+
+    async def _close_socket(self, websocket):
+        try:
+            await asyncio.wait_for(websocket.close(), self.send_timeout)
+        except Exception:
+            pass
+
+    def publish(self, message: Any):
+        """向该交易对的订阅者入队一条消息，不等待任何发送"""
+        for subscriber in self.registry.subscribers(message.key):
+            subscriber.offer(message)
+
+    def publish_to(self, websocket, message: Any):
+        """只向单个客户端入队，例如新客户端的初始价格"""
+        channel = self.channels.get(websocket)
+        if channel is not None:
+            channel.offer(message)
+
+    def stats(self) -> dict:
+        depths = [len(c.pending) for c in self.channels.values()]
+        return {
+            'clients': len(self.channels),
+            'queued': sum(depths),
+            'max_queue_depth': max(depths) if depths else 0,
+        }
@@ -0,0 +1,107 @@
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+from ..config import settings
+from ..utils.logger import setup_logger
+
+logger = setup_logger("candles")
+
+# 支持的周期（秒）
+RESOLUTIONS = {
+    "1s": 1,
+    "1m": 60,
+    "5m": 300,
+    "1h": 3600,
+}
+
+
+class Candle:
+    """一根 K 线；markPrice 不带成交量，count 为该周期内的 tick 数"""
+
+    __slots__ = ('open_time', 'open', 'high', 'low', 'close', 'count')
+
+    def __init__(self, open_time: int, price: float):
+        self.open_time = open_time
+        self.open = self.high = self.low = self.close = price
+        self.count = 1
+
+    def to_dict(self) -> dict:
+        return {
+            'open_time': self.open_time,
+            'open': self.open,
+            'high': self.high,
+            'low': self.low,
+            'close': self.close,
+            'count': self.count,
+        }
+
+
+class CandleSeries:
+    """单个交易对单个周期：当前未收盘的 K 线 + 有界的已收盘 K 线"""
+
+    __slots__ = ('interval_ms', 'current', 'closed')
+
+    def __init__(self, interval_ms: int, history: int):
+        self.interval_ms = interval_ms
+        self.current: Optional[Candle] = None
+        self.closed: Deque[Candle] = deque(maxlen=history)
+
+
+class CandleAggregator:
+    """由 tick 增量生成多周期 K 线，每个 tick 对每个周期都是 O(1) 更新
+
+    K 线在下一个周期的第一个 tick 到达时收盘，并通知所有监听者。
+    """
+
+    def __init__(self, resolutions: Dict[str, int] = None, history: int = None):
+        self.resolutions = resolutions or RESOLUTIONS
+        self.history = history or settings.CANDLE_HISTORY
+        self.series: Dict[str, Dict[str, CandleSeries]] = {}
+        self.listeners: List[Callable[[str, str, Candle], None]] = []
+
+    def add_listener(self, callback: Callable[[str, str, Candle], None]):
+        """K 线收盘回调：callback(symbol, interval, candle)"""
+        self.listeners.append(callback)
+
+    def update(self, symbol: str, ts: int, price: float):
+        series_by_interval = self.series.get(symbol)
+        if series_by_interval is None:
+            series_by_interval = self.series[symbol] = {
+                interval: CandleSeries(seconds * 1000, self.history)
+                for interval, seconds in self.resolutions.items()
+            }
+        for interval, series in series_by_interval.items():
+            open_time = ts - ts % series.interval_ms
+            candle = series.current
+            if candle is None:
+                series.current = Candle(open_time, price)
+            elif open_time > candle.open_time:
+                series.closed.append(candle)
+                series.current = Candle(open_time, price)
+                self._emit(symbol, interval, candle)
+            else:
+                # 同一周期（或迟到的 tick）并入当前 K 线
+                if price > candle.high:
+                    candle.high = price
+                elif price < candle.low:
+                    candle.low = price
+                candle.close = price
+                candle.count += 1
+
+    def _emit(self, symbol: str, interval: str, candle: Candle):
+        for callback in self.listeners:
+            try:
+                callback(symbol, interval, candle)
+            except Exception as e:
+                logger.error(f"Error in candle listener for {symbol} {interval}: {e}")
+
+    def candles(self, symbol: str, interval: str, limit: int = None, include_current: bool = True) -> List[Candle]:
+        """最近的 K 线（最旧的在前）"""
+        series = self.series.get(symbol, {}).get(interval)
+        if series is None:
+            return []
+        result = list(series.closed)
+        if include_current and series.current is not None:
+            result.append(series.current)
+        if limit is not None:
+            result = result[-limit:]
+        return result
@@ -0,0 +1,178 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Callable, List, Optional
+from sqlalchemy import ARRAY, Boolean, DateTime, Float, Integer, JSON, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..models.trading import TradingSignal as TradingSignalModel
+from ..utils.logger import setup_logger
+
+logger = setup_logger("export_service")
+
+COLUMNS = list(TradingSignalModel.__table__.columns)
+FIELDS = [column.name for column in COLUMNS]
+
+# 格式 -> 响应的 media type
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def signals_query(title: Optional[str] = None, start_time: Optional[datetime] = None,
+                  end_time: Optional[datetime] = None, closed_only: bool = False):
+    """导出的查询：只取列（不构造 ORM 对象），按 id 顺序"""
+    stmt = select(*COLUMNS)
+    if title is not None:
+        stmt = stmt.where(TradingSignalModel.title == title)
+    if closed_only:
+        stmt = stmt.where(TradingSignalModel.is_close == True)
+    if start_time is not None:
+        stmt = stmt.where(TradingSignalModel.created_at >= start_time)
+    if end_time is not None:
+        stmt = stmt.where(TradingSignalModel.created_at <= end_time)
+    return stmt.order_by(TradingSignalModel.id)
+
+
+def history_query(title: str):
+    """策略历史（已平仓，按平仓时间倒序），与 TradingService.get_strategy_history 相同"""
+    return select(*COLUMNS).where(
+        TradingSignalModel.title == title,
+        TradingSignalModel.is_close == True
+    ).order_by(TradingSignalModel.closed_at.desc())
+
+
+async def stream_rows(db: AsyncSession, stmt, chunk_size: int = None) -> AsyncIterator[List]:
+    """用服务端游标分批读取，每次只在内存里保留一批行"""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    result = await db.stream(stmt.execution_options(yield_per=chunk_size))
+    async for rows in result.partitions():
+        yield rows
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+async def ndjson_chunks(rows: AsyncIterator[List]) -> AsyncIterator[bytes]:
+    async for chunk in rows:
+        yield "".join(
+            json.dumps({field: _json_value(row[i]) for i, field in enumerate(FIELDS)}, ensure_ascii=False) + "\n"
+            for row in chunk
+        ).encode()
+
+
+async def csv_chunks(rows: AsyncIterator[List]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    async for chunk in rows:
+        for row in chunk:
+            # 数组列写成 JSON 文本，其余按 CSV 常规写法
+            writer.writerow([json.dumps(value) if isinstance(value, list) else _json_value(value) for value in row])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink:
+    """只写的文件对象：ParquetWriter 写入的字节先攒在这里，每批之后取走"""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_schema():
+    import pyarrow as pa
+
+    def arrow_type(column):
+        if isinstance(column.type, (ARRAY, JSON)):
+            return pa.list_(pa.float64())
+        if isinstance(column.type, Boolean):
+            return pa.bool_()
+        if isinstance(column.type, Integer):
+            return pa.int64()
+        if isinstance(column.type, Float):
+            return pa.float64()
+        if isinstance(column.type, DateTime):
+            return pa.timestamp("us")
+        return pa.string()
+
+    return pa.schema([(column.name, arrow_type(column)) for column in COLUMNS])
+
+
+async def parquet_chunks(rows: AsyncIterator[List]) -> AsyncIterator[bytes]:
+    """每批行写成一个 row group，写完即把这部分字节发出去；文件尾（footer）在最后发出"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+    try:
+        async for chunk in rows:
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema))
+            data = sink.take()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+ENCODERS = {"ndjson": ndjson_chunks, "csv": csv_chunks, "parquet": parquet_chunks}
+
+
+def check_format(fmt: str):
+    """不支持的格式或缺少可选依赖时抛出 ValueError"""
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("Parquet export requires pyarrow")
+
+
+def encode(db: AsyncSession, stmt, fmt: str, chunk_size: int = None) -> AsyncIterator[bytes]:
+    """把查询结果按格式编码成字节块，行到达一批就发出一批"""
+    return ENCODERS[fmt](stream_rows(db, stmt, chunk_size))
+
+
+async def stream(session_factory: Callable[[], AsyncSession], stmt, fmt: str) -> AsyncIterator[bytes]:
+    """StreamingResponse 的响应体：会话在生成器里打开，整个传输期间持有服务端游标"""
+    count = 0
+    async with session_factory() as db:
+        async for data in encode(db, stmt, fmt):
+            count += 1
+            yield data
+    logger.info(f"Export finished: {fmt}, {count} chunks")
@@ -0,0 +1,169 @@
+import argparse
+import asyncio
+import glob
+import json
+import mmap
+import os
+import struct
+import time
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Tuple
+from ..config import settings
+from ..utils.logger import setup_logger
+from .upstream import unwrap_stream_message
+
+logger = setup_logger("feed_recorder")
+
+# 文件格式：8 字节文件头，之后每条记录为 <接收时间 ns:int64><长度:uint32><原始消息 UTF-8>
+FILE_MAGIC = b"FEEDLOG1"
+RECORD_HEADER = struct.Struct("<qI")
+
+
+def chunk_name(ts_ns: int) -> str:
+    """按 UTC 小时分块的文件名"""
+    hour = datetime.fromtimestamp(ts_ns / 1e9, tz=timezone.utc)
+    return f"feed-{hour:%Y%m%d-%H}.bin"
+
+
+class FeedRecorder:
+    """把每条上游原始消息追加到按小时分块的日志文件"""
+
+    def __init__(self, directory: str = None, flush_interval: float = 1.0):
+        self.directory = directory or settings.FEED_RECORD_DIR
+        self.flush_interval = flush_interval
+        self._file = None
+        self._chunk: Optional[str] = None
+        self._last_flush = 0.0
+        self.count = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def record(self, raw, ts_ns: int = None):
+        if ts_ns is None:
+            ts_ns = time.time_ns()
+        payload = raw.encode("utf-8") if isinstance(raw, str) else bytes(raw)
+        chunk = chunk_name(ts_ns)
+        if chunk != self._chunk:
+            self._open(chunk)
+        self._file.write(RECORD_HEADER.pack(ts_ns, len(payload)))
+        self._file.write(payload)
+        self.count += 1
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self._file.flush()
+            self._last_flush = now
+
+    def _open(self, chunk: str):
+        self.close()
+        path = os.path.join(self.directory, chunk)
+        # 重新打开已有分块（例如崩溃重启）时先截掉末尾写了一半的记录，否则之后的记录都会错位
+        valid = complete_length(path) if os.path.exists(path) else 0
+        self._file = open(path, "ab")
+        self._file.truncate(valid)
+        if valid == 0:
+            self._file.write(FILE_MAGIC)
+        self._chunk = chunk
+        logger.info(f"Recording feed to {path}")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._chunk = None
+
+
+def complete_length(path: str) -> int:
+    """文件中完整记录的结束位置；文件头不完整或不是录制文件时返回 0"""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if size < len(FILE_MAGIC) or f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            return 0
+        offset = len(FILE_MAGIC)
+        while offset + RECORD_HEADER.size <= size:
+            f.seek(offset)
+            _, length = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+            end = offset + RECORD_HEADER.size + length
+            if end > size:
+                break
+            offset = end
+        return offset
+
+
+def read_records(path: str) -> Iterator[Tuple[int, bytes]]:
+    """通过 mmap 顺序读取一个分块文件的记录；末尾写了一半的记录会被忽略"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size <= len(FILE_MAGIC):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(FILE_MAGIC)] != FILE_MAGIC:
+                raise ValueError(f"{path} is not a feed recording")
+            offset = len(FILE_MAGIC)
+            size = len(mm)
+            while offset + RECORD_HEADER.size <= size:
+                ts_ns, length = RECORD_HEADER.unpack_from(mm, offset)
+                start = offset + RECORD_HEADER.size
+                if start + length > size:
+                    break
+                yield ts_ns, mm[start:start + length]
+                offset = start + length
+
+
+def recording_files(path: str) -> List[str]:
+    """单个文件，或目录下按时间排序的所有分块"""
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "feed-*.bin")))
+    return [path]
+
+
+class ReplaySource:
+    """把录制的行情按原始节奏（或 N 倍速 / 最快速度）送入同一条处理路径
+
+    speed=1 为原速，speed=N 为 N 倍速，speed=0 为不等待、尽快回放。
+    """
+
+    def __init__(self, path: str = None, speed: float = None, yield_every: int = 1000):
+        self.path = path or settings.FEED_REPLAY_PATH
+        self.speed = settings.FEED_REPLAY_SPEED if speed is None else speed
+        self.yield_every = yield_every
+        self.count = 0
+
+    async def run(self, feed):
+        """feed 需要提供 handle_raw(raw, data)，即 BinanceWebSocket 的上游消息入口"""
+        loop = asyncio.get_running_loop()
+        first_ts = None
+        started = loop.time()
+        logger.info(f"Replaying {self.path} at {'max' if not self.speed else f'{self.speed}x'} speed")
+        for path in recording_files(self.path):
+            for ts_ns, payload in read_records(path):
+                if self.speed > 0:
+                    if first_ts is None:
+                        first_ts = ts_ns
+                    delay = started + (ts_ns - first_ts) / 1e9 / self.speed - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                elif self.count % self.yield_every == 0:
+                    # 最快速度回放时也要定期让出事件循环，让客户端写任务有机会发送
+                    await asyncio.sleep(0)
+                raw = payload.decode("utf-8")
+                data = unwrap_stream_message(json.loads(raw))
+                if data is not None:
+                    feed.handle_raw(raw, data)
+                self.count += 1
+        logger.info(f"Replay finished, {self.count} messages")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="行情录制文件信息")
+    parser.add_argument("path", help="录制文件或目录")
+    args = parser.parse_args()
+    for path in recording_files(args.path):
+        count, first, last = 0, None, None
+        for ts_ns, _ in read_records(path):
+            count += 1
+            first = ts_ns if first is None else first
+            last = ts_ns
+        span = (last - first) / 1e9 if count else 0
+        print(f"{os.path.basename(path)}: {count} messages over {span:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
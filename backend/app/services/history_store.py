@@ -0,0 +1,473 @@
+import argparse
+import asyncio
+import fcntl
+import io
+import os
+import re
+import shutil
+import zipfile
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from ..config import settings
+from .binance_ws import binance_ws
+from .candles import Candle
+from .subscriptions import normalize_symbol
+from ..utils.logger import setup_logger
+
+logger = setup_logger("history_store")
+
+TICK = "tick"
+DAY_MS = 24 * 3600 * 1000
+
+# 每种数据的列及类型；第一列为时间（毫秒），分区内按时间升序
+TICK_COLUMNS = (("ts", np.int64), ("price", np.float64))
+CANDLE_COLUMNS = (("open_time", np.int64), ("open", np.float64), ("high", np.float64), ("low", np.float64),
+                  ("close", np.float64), ("volume", np.float64), ("count", np.int64))
+
+Columns = Dict[str, np.ndarray]
+
+_NAME = re.compile(r"^[A-Za-z0-9]+$")
+
+
+def schema(kind: str) -> Tuple[Tuple[str, type], ...]:
+    """kind 为 "tick" 或 K 线周期（1m、1h、1d ...）"""
+    return TICK_COLUMNS if kind == TICK else CANDLE_COLUMNS
+
+
+def day_of(ts_ms: int) -> str:
+    """UTC 日期分区名"""
+    return datetime.fromtimestamp(ts_ms // DAY_MS * 86400, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def empty_columns(kind: str) -> Columns:
+    return {name: np.zeros(0, dtype=dtype) for name, dtype in schema(kind)}
+
+
+def concat_columns(kind: str, parts: List[Columns]) -> Columns:
+    """只有一段时原样返回（不复制）"""
+    parts = [part for part in parts if len(part[schema(kind)[0][0]])]
+    if not parts:
+        return empty_columns(kind)
+    if len(parts) == 1:
+        return parts[0]
+    return {name: np.concatenate([part[name] for part in parts]) for name, _ in schema(kind)}
+
+
+class HistorySlice:
+    """一段按时间顺序的历史数据：每个日分区一段只读 memmap 视图，不复制数据"""
+
+    def __init__(self, kind: str, segments: List[Columns]):
+        self.kind = kind
+        time_column = schema(kind)[0][0]
+        self.segments = [segment for segment in segments if len(segment[time_column])]
+
+    def __len__(self) -> int:
+        return sum(len(next(iter(segment.values()))) for segment in self.segments)
+
+    def columns(self) -> Columns:
+        """合并成连续数组（只有一个分区时仍是视图）"""
+        return concat_columns(self.kind, self.segments)
+
+
+class HistoryStore:
+    """本地历史行情，按 交易对/种类/UTC 日期 分区的列式文件
+
+    目录结构 {directory}/{symbol}/{kind}/{YYYY-MM-DD}/{column}.bin，每列是定长的原始数组，
+    读取时以 np.memmap 只读映射，区间读取只打开涉及的日期分区，返回映射上的视图。
+    追加只在文件末尾写；各列行数取最小值，写了一半的尾部被忽略，下次追加前截断。
+    追加的数据早于分区末尾时（补录、导入重叠区间）整体合并重写该分区。
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or settings.HISTORY_DIR
+
+    def _kind_dir(self, symbol: str, kind: str) -> str:
+        symbol = normalize_symbol(symbol)
+        if not _NAME.match(symbol) or not _NAME.match(kind):
+            raise ValueError(f"Invalid history partition: {symbol}/{kind}")
+        return os.path.join(self.directory, symbol, kind)
+
+    def symbols(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if _NAME.match(name))
+
+    def kinds(self, symbol: str) -> List[str]:
+        path = os.path.join(self.directory, normalize_symbol(symbol))
+        return sorted(os.listdir(path)) if os.path.isdir(path) else []
+
+    def days(self, symbol: str, kind: str) -> List[str]:
+        path = self._kind_dir(symbol, kind)
+        if not os.path.isdir(path):
+            return []
+        return sorted(name for name in os.listdir(path) if not name.startswith("."))
+
+    # 分区读写
+
+    @staticmethod
+    def _rows(partition: str, kind: str) -> int:
+        sizes = []
+        for name, dtype in schema(kind):
+            path = os.path.join(partition, f"{name}.bin")
+            sizes.append(os.path.getsize(path) // np.dtype(dtype).itemsize if os.path.exists(path) else 0)
+        return min(sizes)
+
+    def _open(self, partition: str, kind: str) -> Columns:
+        rows = self._rows(partition, kind)
+        if not rows:
+            return empty_columns(kind)
+        return {name: np.memmap(os.path.join(partition, f"{name}.bin"), dtype=dtype, mode="r", shape=(rows,))
+                for name, dtype in schema(kind)}
+
+    def _append(self, partition: str, kind: str, columns: Columns):
+        os.makedirs(partition, exist_ok=True)
+        rows = self._rows(partition, kind)
+        for name, dtype in schema(kind):
+            with open(os.path.join(partition, f"{name}.bin"), "ab") as f:
+                f.truncate(rows * np.dtype(dtype).itemsize)
+                f.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+
+    def _rewrite(self, partition: str, kind: str, columns: Columns):
+        """先写到临时目录再换入，读者手里已映射的旧文件不受影响"""
+        parent, day = os.path.split(partition)
+        staging = os.path.join(parent, f".{day}.new")
+        retired = os.path.join(parent, f".{day}.old")
+        shutil.rmtree(staging, ignore_errors=True)
+        self._append(staging, kind, columns)
+        if os.path.isdir(partition):
+            shutil.rmtree(retired, ignore_errors=True)
+            os.rename(partition, retired)
+        os.rename(staging, partition)
+        shutil.rmtree(retired, ignore_errors=True)
+
+    def write(self, symbol: str, kind: str, columns: Columns) -> int:
+        """按日期分区写入，返回写入行数；K 线以 open_time 去重，新数据覆盖旧数据"""
+        names = schema(kind)
+        time_column = names[0][0]
+        columns = {name: np.asarray(columns[name], dtype=dtype) for name, dtype in names}
+        count = len(columns[time_column])
+        if not count:
+            return 0
+        order = np.argsort(columns[time_column], kind="stable")
+        columns = {name: values[order] for name, values in columns.items()}
+        days = columns[time_column] // DAY_MS
+        bounds = np.flatnonzero(np.diff(days)) + 1
+        base = self._kind_dir(symbol, kind)
+        for lo, hi in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [count]))):
+            part = {name: values[lo:hi] for name, values in columns.items()}
+            partition = os.path.join(base, day_of(int(part[time_column][0])))
+            existing = self._open(partition, kind)
+            last = existing[time_column][-1] if len(existing[time_column]) else None
+            first = part[time_column][0]
+            if last is None or first > last or (kind == TICK and first == last):
+                self._append(partition, kind, part)
+            else:
+                self._rewrite(partition, kind, self._merge(kind, existing, part))
+        return count
+
+    @staticmethod
+    def _merge(kind: str, existing: Columns, new: Columns) -> Columns:
+        time_column = schema(kind)[0][0]
+        merged = {name: np.concatenate((existing[name], new[name])) for name, _ in schema(kind)}
+        order = np.argsort(merged[time_column], kind="stable")
+        merged = {name: values[order] for name, values in merged.items()}
+        if kind != TICK:
+            # 同一根 K 线保留最后写入的（排序稳定，新数据在后）
+            times = merged[time_column]
+            keep = np.append(times[1:] != times[:-1], True)
+            merged = {name: values[keep] for name, values in merged.items()}
+        return merged
+
+    def read(self, symbol: str, kind: str, start_ms: int = None, end_ms: int = None,
+             limit: int = None) -> HistorySlice:
+        """时间在 [start_ms, end_ms] 内的数据；只打开区间涉及的日期分区
+
+        给了 start_ms 时取区间内最早的 limit 条，否则取最近的 limit 条。
+        """
+        time_column = schema(kind)[0][0]
+        days = self.days(symbol, kind)
+        if start_ms is not None:
+            days = [day for day in days if day >= day_of(start_ms)]
+        if end_ms is not None:
+            days = [day for day in days if day <= day_of(end_ms)]
+        newest_first = start_ms is None and limit is not None
+        base = self._kind_dir(symbol, kind)
+        segments: List[Columns] = []
+        remaining = limit
+        for day in (reversed(days) if newest_first else days):
+            columns = self._open(os.path.join(base, day), kind)
+            times = columns[time_column]
+            lo = 0 if start_ms is None else int(np.searchsorted(times, start_ms, side="left"))
+            hi = len(times) if end_ms is None else int(np.searchsorted(times, end_ms, side="right"))
+            if remaining is not None:
+                if newest_first:
+                    lo = max(lo, hi - remaining)
+                else:
+                    hi = min(hi, lo + remaining)
+                remaining -= max(0, hi - lo)
+            if hi > lo:
+                segment = {name: values[lo:hi] for name, values in columns.items()}
+                if newest_first:
+                    segments.insert(0, segment)
+                else:
+                    segments.append(segment)
+            if remaining is not None and remaining <= 0:
+                break
+        return HistorySlice(kind, segments)
+
+    def last_time(self, symbol: str, kind: str) -> Optional[int]:
+        latest = self.read(symbol, kind, limit=1).columns()
+        times = latest[schema(kind)[0][0]]
+        return int(times[-1]) if len(times) else None
+
+
+# 存储与进程内行情合并
+
+def candle_columns(candles: List[Candle]) -> Columns:
+    """markPrice 聚合的 K 线没有成交量，volume 记为 0"""
+    count = len(candles)
+    return {
+        "open_time": np.fromiter((c.open_time for c in candles), np.int64, count),
+        "open": np.fromiter((c.open for c in candles), np.float64, count),
+        "high": np.fromiter((c.high for c in candles), np.float64, count),
+        "low": np.fromiter((c.low for c in candles), np.float64, count),
+        "close": np.fromiter((c.close for c in candles), np.float64, count),
+        "volume": np.zeros(count),
+        "count": np.fromiter((c.count for c in candles), np.int64, count),
+    }
+
+
+def live_columns(symbol: str, kind: str) -> Columns:
+    """进程内的行情（tick 环形缓冲区 / 聚合中的 K 线），复制成列数组"""
+    symbol = normalize_symbol(symbol)
+    if kind == TICK:
+        buffer = binance_ws.ticks.get(symbol)
+        segments = buffer.since().segments if buffer is not None else []
+        return concat_columns(kind, [{"ts": ts, "price": price} for ts, price in segments])
+    if kind not in binance_ws.candles.resolutions:
+        return empty_columns(kind)
+    return candle_columns(binance_ws.candles.candles(symbol, kind))
+
+
+def history(symbol: str, kind: str, start_ms: int = None, end_ms: int = None, limit: int = None,
+            store: "HistoryStore" = None) -> Columns:
+    """落盘的历史 + 进程内的最新行情：进程内数据覆盖的时间段以它为准，更早的从存储读取
+
+    limit 的含义与 HistoryStore.read 相同。
+    """
+    store = store or history_store
+    time_column = schema(kind)[0][0]
+    live = live_columns(symbol, kind)
+    times = live[time_column]
+    lo = 0 if start_ms is None else int(np.searchsorted(times, start_ms, side="left"))
+    hi = len(times) if end_ms is None else int(np.searchsorted(times, end_ms, side="right"))
+    live = {name: values[lo:hi] for name, values in live.items()}
+
+    stored_end = end_ms
+    if len(times):
+        stored_end = int(times[0]) - 1 if end_ms is None else min(end_ms, int(times[0]) - 1)
+    stored = store.read(symbol, kind, start_ms, stored_end, limit).columns()
+    merged = concat_columns(kind, [stored, live])
+    if limit is not None:
+        merged = {name: values[:limit] if start_ms is not None else values[-limit:]
+                  for name, values in merged.items()}
+    return merged
+
+
+def has_history(symbol: str, kind: str, store: "HistoryStore" = None) -> bool:
+    return bool((store or history_store).days(symbol, kind))
+
+
+# 交易所 K 线 CSV 导入
+
+def kline_file_info(path: str) -> Tuple[Optional[str], Optional[str]]:
+    """从 BTCUSDT-1m-2024-01-01.csv / .zip 这样的文件名取交易对和周期"""
+    match = re.match(r"^([A-Za-z0-9]+)-([0-9]+[smhdwM])-", os.path.basename(path))
+    return (match.group(1), match.group(2)) if match else (None, None)
+
+
+def read_kline_csv(source) -> Columns:
+    """交易所 K 线 CSV：open_time, open, high, low, close, volume, close_time, quote_volume, count, ...
+
+    有无表头均可；open_time 为微秒（较新的现货数据）时换算成毫秒。
+    """
+    import pandas as pd
+
+    frame = pd.read_csv(source, header=None, usecols=[0, 1, 2, 3, 4, 5, 8])
+    if len(frame) and not str(frame.iat[0, 0]).strip().lstrip("-").isdigit():
+        frame = frame.iloc[1:]
+    open_time = frame[0].astype(np.int64).to_numpy()
+    if len(open_time) and open_time.max() > 10 ** 14:
+        open_time = open_time // 1000
+    return {
+        "open_time": open_time,
+        "open": frame[1].astype(np.float64).to_numpy(),
+        "high": frame[2].astype(np.float64).to_numpy(),
+        "low": frame[3].astype(np.float64).to_numpy(),
+        "close": frame[4].astype(np.float64).to_numpy(),
+        "volume": frame[5].astype(np.float64).to_numpy(),
+        "count": frame[8].astype(np.int64).to_numpy(),
+    }
+
+
+def import_klines(store: HistoryStore, path: str, symbol: str = None, interval: str = None) -> int:
+    """导入一个 K 线 CSV（或包含 CSV 的 zip），返回行数；交易对和周期默认取自文件名"""
+    file_symbol, file_interval = kline_file_info(path)
+    symbol = symbol or file_symbol
+    interval = interval or file_interval
+    if not symbol or not interval:
+        raise ValueError(f"Cannot tell symbol/interval of {path}, pass them explicitly")
+    if path.endswith(".zip"):
+        count = 0
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                if name.endswith(".csv"):
+                    count += store.write(symbol, interval, read_kline_csv(io.BytesIO(archive.read(name))))
+        return count
+    return store.write(symbol, interval, read_kline_csv(path))
+
+
+# 实时行情落盘
+
+class HistoryRecorder:
+    """把实时 tick 和收盘的 K 线定期追加到历史存储
+
+    tick 不在行情路径上复制：每次落盘时按环形缓冲区的累计写入数取出新增部分；
+    K 线由聚合器的收盘回调攒批。只在行情所有者 worker 里启动（跟随者只有轮询到的 tick），
+    flock 防止没有共享价格表时多个 worker 同时写入。
+    """
+
+    def __init__(self, store: HistoryStore = None, flush_interval: float = None, intervals: List[str] = None):
+        self.store = store or history_store
+        self.flush_interval = flush_interval or settings.HISTORY_FLUSH_INTERVAL
+        self.intervals = intervals if intervals is not None else \
+            [part.strip() for part in settings.HISTORY_CANDLE_INTERVALS.split(",") if part.strip()]
+        self.written: Dict[str, int] = {}
+        self.pending: Dict[Tuple[str, str], List[Candle]] = {}
+        self._lock_fd: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> bool:
+        """拿到写入锁时开始落盘并返回 True；其它 worker 已在写入时返回 False"""
+        if self.running:
+            return True
+        os.makedirs(self.store.directory, exist_ok=True)
+        fd = os.open(os.path.join(self.store.directory, ".recorder.lock"), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            logger.info("Another worker is recording price history")
+            return False
+        self._lock_fd = fd
+        # 只记录启动之后的行情
+        self.written = {symbol: buffer.total for symbol, buffer in binance_ws.ticks.buffers.items()}
+        binance_ws.candles.add_listener(self._on_candle)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Recording price history to {self.store.directory}")
+        return True
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        binance_ws.candles.listeners.remove(self._on_candle)
+        await self.flush()
+        fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        os.close(self._lock_fd)
+        self._lock_fd = None
+
+    def _on_candle(self, symbol: str, interval: str, candle: Candle):
+        if interval in self.intervals:
+            self.pending.setdefault((symbol, interval), []).append(candle)
+
+    def collect(self) -> List[Tuple[str, str, Columns]]:
+        """取出上次落盘之后的新数据（复制，环形缓冲区之后会被覆盖）"""
+        batches = []
+        for symbol, buffer in list(binance_ws.ticks.buffers.items()):
+            new = buffer.total - self.written.get(symbol, 0)
+            if new <= 0:
+                continue
+            if new > buffer.count:
+                logger.warning(f"History recorder fell behind on {symbol}, {new - buffer.count} ticks lost")
+                new = buffer.count
+            self.written[symbol] = buffer.total
+            ticks = buffer.since(limit=new)
+            batches.append((symbol, TICK, {"ts": np.concatenate([ts for ts, _ in ticks.segments]),
+                                           "price": np.concatenate([price for _, price in ticks.segments])}))
+        pending, self.pending = self.pending, {}
+        for (symbol, interval), candles in pending.items():
+            batches.append((symbol, interval, candle_columns(candles)))
+        return batches
+
+    def _write(self, batches: List[Tuple[str, str, Columns]]):
+        for symbol, kind, columns in batches:
+            try:
+                self.store.write(symbol, kind, columns)
+            except Exception as e:
+                logger.error(f"Error writing {kind} history for {symbol}: {e}")
+
+    async def flush(self):
+        batches = self.collect()
+        if batches:
+            await asyncio.to_thread(self._write, batches)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地历史行情：导入交易所 K 线 CSV，查看已有分区")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("import", help="导入 K 线 CSV / zip 文件或目录")
+    load.add_argument("paths", nargs="+")
+    load.add_argument("--symbol", help="交易对（默认取自文件名）")
+    load.add_argument("--interval", help="K 线周期（默认取自文件名）")
+    load.add_argument("--dir", help="存储目录（默认 HISTORY_DIR）")
+    info = commands.add_parser("info", help="列出已有的交易对、种类和日期范围")
+    info.add_argument("--dir", help="存储目录（默认 HISTORY_DIR）")
+    args = parser.parse_args()
+
+    store = HistoryStore(args.dir)
+    if args.command == "import":
+        files = []
+        for path in args.paths:
+            if os.path.isdir(path):
+                files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                    if name.endswith((".csv", ".zip"))))
+            else:
+                files.append(path)
+        total = 0
+        for path in files:
+            count = import_klines(store, path, args.symbol, args.interval)
+            total += count
+            print(f"{os.path.basename(path)}: {count} rows")
+        print(f"Imported {total} rows from {len(files)} files into {store.directory}")
+    else:
+        for symbol in store.symbols():
+            for kind in store.kinds(symbol):
+                days = store.days(symbol, kind)
+                rows = sum(store._rows(os.path.join(store._kind_dir(symbol, kind), day), kind) for day in days)
+                print(f"{symbol} {kind}: {rows} rows, {len(days)} days ({days[0]} .. {days[-1]})" if days
+                      else f"{symbol} {kind}: empty")
+
+
+# 创建单例实例
+history_store = HistoryStore()
+history_recorder = HistoryRecorder()
+
+
+if __name__ == "__main__":
+    main()
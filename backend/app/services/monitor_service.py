@@ -1,4 +1,4 @@
-from prometheus_client import Counter, Histogram
+from prometheus_client import Counter, Gauge, Histogram
 import time
 from functools import wraps
 from ..utils.logger import setup_logger
@@ -11,6 +11,48 @@ class MonitorService:
     request_latency = Histogram('http_request_duration_seconds', 'HTTP request latency')
     error_count = Counter('error_total', 'Total errors')
     trade_count = Counter('trade_signals_total', 'Total trade signals')
+
+    # WebSocket 价格扇出
+    ws_clients = Gauge('ws_clients', 'Connected WebSocket price clients')
+    ws_queue_depth = Gauge('ws_client_queue_depth', 'Messages queued across all WebSocket client queues')
+    ws_conflated_total = Counter('ws_conflated_messages_total', 'Queued prices replaced by a newer price for the same symbol')
+    ws_dropped_total = Counter('ws_dropped_clients_total', 'WebSocket clients dropped by the broadcaster', ['reason'])
+
+    # 上游行情连接
+    upstream_connections = Gauge('upstream_connections', 'Open upstream market data connections')
+    upstream_streams = Gauge('upstream_streams', 'Streams assigned across upstream connections')
+    upstream_reconnects_total = Counter('upstream_reconnects_total', 'Upstream connection drops')
+    upstream_subscribe_frames_total = Counter('upstream_subscribe_frames_total', 'SUBSCRIBE/UNSUBSCRIBE frames sent upstream')
+    upstream_duplicates_total = Counter('upstream_duplicate_messages_total', 'Messages dropped as duplicates during stream migration')
+
+    # 价格查询
+    price_missing_total = Counter('price_lookup_missing_total', 'Price lookups with no price for the symbol yet')
+    price_stale_total = Counter('price_lookup_stale_total', 'Price lookups where the last price was older than the freshness bound')
+    price_wait_timeouts_total = Counter('price_wait_timeouts_total', 'Price lookups that hit the deadline waiting for a tick')
+    price_wait_seconds = Histogram('price_wait_seconds', 'Time spent waiting for a fresh tick')
+    price_table_owner = Gauge('price_table_owner', 'Whether this worker owns the upstream feed and writes the shared price table')
+
+    # 未平仓索引
+    position_index_mismatches_total = Counter('position_index_mismatches_total', 'Consistency checks that found the open-position index out of sync with the database')
+
+    # 止盈止损触发
+    triggers_armed = Gauge('triggers_armed', 'Open positions with a stop-loss or take-profit level being watched')
+    triggers_fired_total = Counter('triggers_fired_total', 'Stop-loss / take-profit levels crossed by a tick', ['kind'])
+
+    # 浮动盈亏
+    pnl_positions = Gauge('pnl_positions', 'Open positions tracked by the PnL engine')
+    pnl_tick_seconds = Histogram('pnl_tick_seconds', 'Time to revalue all open positions of a symbol on a tick',
+                                 buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05))
+
+    # 信号处理通道
+    signal_lane_depth = Gauge('signal_lane_depth', 'Signals queued in each processing lane', ['lane'])
+    signal_lane_wait_seconds = Histogram('signal_lane_wait_seconds', 'Time a signal waits in its lane before processing starts')
+    signal_lane_service_seconds = Histogram('signal_lane_service_seconds', 'Time spent processing a signal in its lane')
+
+    # 信号接收日志
+    ingest_pending = Gauge('ingest_pending_signals', 'Journaled signals not yet committed to the database')
+    ingest_applied_total = Counter('ingest_applied_signals_total', 'Journaled signals committed to the database')
+    ingest_dead_letter_total = Counter('ingest_dead_letter_signals_total', 'Journaled signals moved to the dead-letter file')
     
     @staticmethod
     def monitor_request(func):
@@ -0,0 +1,202 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+from ..config import settings
+from .binance_ws import binance_ws
+from .broadcaster import PriceBroadcaster
+from .monitor_service import MonitorService
+from .position_index import OpenPosition, position_index
+from .subscriptions import WILDCARD, normalize_symbol
+from .tick_encoder import PNL_FRAME, EncodedPnl
+from ..utils.logger import setup_logger
+
+logger = setup_logger("pnl_engine")
+
+
+class PnlEngine:
+    """所有未平仓的浮动盈亏
+
+    未平仓按交易对排序后存成列数组（开仓价、方向、杠杆、策略），每个交易对占一段连续区间，
+    一个 tick 只对该交易对的区间做一次向量运算，并把变化量按策略累加到策略汇总上。
+    仓位变化（开仓/平仓/重新加载）只标记失效，下一个 tick 或推送时整体重建。
+    策略汇总按 PNL_PUBLISH_INTERVAL 推送到 /ws/pnl，按策略合并。
+    每个 worker 为自己的 /ws/pnl 客户端各算一份：仓位来自本进程的未平仓索引，其它 worker 的开平仓
+    由 position_index.sync 拉取（延迟约 POSITION_INDEX_SYNC_INTERVAL 秒），行情来自上游或共享价格表，
+    因此每个 worker 看到的都是全部未平仓。
+
+    盈亏口径与平仓的 profit_percentage 相同：价格变动百分比，做空取反；lever_pnl 再乘以杠杆。
+    """
+
+    def __init__(self):
+        self.positions: Dict[str, OpenPosition] = {}
+        self.broadcaster = PriceBroadcaster()
+        self.titles: List[str] = []
+        self.entry = np.zeros(0)
+        self.sign = np.zeros(0)
+        self.lever = np.zeros(0)
+        self.strategy_id = np.zeros(0, dtype=np.int64)
+        self.pnl = np.zeros(0)
+        # 交易对 -> (起点, 终点, 区间内的策略 id, 区间内每个仓位在这些策略中的下标)
+        self.ranges: Dict[str, Tuple[int, int, np.ndarray, np.ndarray]] = {}
+        self.pnl_sum = np.zeros(0)
+        self.lever_pnl_sum = np.zeros(0)
+        self.open_count = np.zeros(0, dtype=np.int64)
+        self.dirty: Set[int] = set()
+        self.removed: Set[str] = set()
+        self._stale = True
+        self._publisher: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._publisher is not None
+
+    def start(self):
+        if self.running:
+            return
+        self._load()
+        position_index.add_listener(self._on_position)
+        binance_ws.add_price_callback(WILDCARD, self.on_tick)
+        self._publisher = asyncio.create_task(self._publish_loop())
+
+    async def stop(self):
+        if not self.running:
+            return
+        binance_ws.remove_price_callback(WILDCARD, self.on_tick)
+        position_index.listeners.remove(self._on_position)
+        self._publisher.cancel()
+        try:
+            await self._publisher
+        except asyncio.CancelledError:
+            pass
+        self._publisher = None
+
+    # 仓位
+
+    @staticmethod
+    def _usable(position: OpenPosition) -> bool:
+        return bool(position.currentcy and position.open_price)
+
+    def _load(self):
+        self.positions = {trade_id: position for trade_id, position in position_index.positions.items()
+                          if self._usable(position)}
+        self._stale = True
+
+    def _on_position(self, event: str, position: Optional[OpenPosition]):
+        if event == "load":
+            self._load()
+        elif event == "open":
+            if self._usable(position):
+                self.positions[position.trade_id] = position
+                self._stale = True
+        elif self.positions.pop(position.trade_id, None) is not None:
+            self._stale = True
+
+    def _build(self):
+        """按交易对排序重建列数组，用各交易对的最新价格计算初始盈亏和策略汇总"""
+        positions = sorted(self.positions.values(), key=lambda p: normalize_symbol(p.currentcy))
+        count = len(positions)
+        titles = sorted({p.title or "" for p in positions})
+        title_ids = {title: i for i, title in enumerate(titles)}
+
+        self.entry = np.fromiter((p.open_price for p in positions), np.float64, count)
+        self.sign = np.fromiter((-1.0 if p.side == "sell" else 1.0 for p in positions), np.float64, count)
+        self.lever = np.fromiter((p.lever or 1 for p in positions), np.float64, count)
+        self.strategy_id = np.fromiter((title_ids[p.title or ""] for p in positions), np.int64, count)
+        self.pnl = np.zeros(count)
+
+        ranges = {}
+        start = 0
+        while start < count:
+            symbol = normalize_symbol(positions[start].currentcy)
+            end = start
+            while end < count and normalize_symbol(positions[end].currentcy) == symbol:
+                end += 1
+            strategies, inverse = np.unique(self.strategy_id[start:end], return_inverse=True)
+            ranges[symbol] = (start, end, strategies, inverse)
+            price = binance_ws.prices.get(symbol)
+            if price is not None:
+                self.pnl[start:end] = self._pnl(start, end, price)
+            start = end
+        self.ranges = ranges
+
+        self.pnl_sum = np.bincount(self.strategy_id, weights=self.pnl, minlength=len(titles))
+        self.lever_pnl_sum = np.bincount(self.strategy_id, weights=self.pnl * self.lever, minlength=len(titles))
+        self.open_count = np.bincount(self.strategy_id, minlength=len(titles))
+        self.removed |= set(self.titles) - set(titles)
+        self.removed -= set(titles)
+        self.titles = titles
+        self.dirty = set(range(len(titles)))
+        self._stale = False
+        MonitorService.pnl_positions.set(count)
+
+    def _pnl(self, start: int, end: int, price: float) -> np.ndarray:
+        return self.sign[start:end] * (price / self.entry[start:end] - 1.0) * 100.0
+
+    # 行情
+
+    def on_tick(self, symbol: str, price: float):
+        """行情路径上同步执行：一次向量运算更新该交易对所有仓位的盈亏和相关策略的汇总"""
+        started = time.perf_counter()
+        if self._stale:
+            self._build()
+            return
+        span = self.ranges.get(symbol)
+        if span is None:
+            return
+        start, end, strategies, inverse = span
+        pnl = self._pnl(start, end, price)
+        delta = pnl - self.pnl[start:end]
+        self.pnl[start:end] = pnl
+        self.pnl_sum[strategies] += np.bincount(inverse, weights=delta, minlength=len(strategies))
+        self.lever_pnl_sum[strategies] += np.bincount(inverse, weights=delta * self.lever[start:end],
+                                                      minlength=len(strategies))
+        self.dirty.update(strategies.tolist())
+        MonitorService.pnl_tick_seconds.observe(time.perf_counter() - started)
+
+    # 汇总与推送
+
+    def aggregate(self, strategy: int) -> dict:
+        count = int(self.open_count[strategy])
+        total = float(self.pnl_sum[strategy])
+        return {"strategy": self.titles[strategy], "open": count, "pnl": total,
+                "avg_pnl": total / count if count else 0.0, "lever_pnl": float(self.lever_pnl_sum[strategy])}
+
+    def snapshot(self) -> List[dict]:
+        """所有策略当前的浮动盈亏汇总"""
+        if self._stale:
+            self._build()
+        return [self.aggregate(i) for i in range(len(self.titles))]
+
+    def publish(self):
+        """推送有变化的策略；不再有未平仓的策略推送一条归零的汇总"""
+        if self._stale:
+            self._build()
+        for title in self.removed:
+            self.broadcaster.publish(EncodedPnl(title, {"strategy": title, "open": 0, "pnl": 0.0,
+                                                        "avg_pnl": 0.0, "lever_pnl": 0.0}))
+        self.removed = set()
+        for strategy in self.dirty:
+            self.broadcaster.publish(EncodedPnl(self.titles[strategy], self.aggregate(strategy)))
+        self.dirty = set()
+
+    async def _publish_loop(self):
+        while True:
+            await asyncio.sleep(settings.PNL_PUBLISH_INTERVAL)
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error(f"Error publishing PnL: {e}")
+
+    def register(self, websocket):
+        """新客户端先收到所有策略的当前汇总，之后只收到变化"""
+        self.broadcaster.add(websocket, PNL_FRAME)
+        for row in self.snapshot():
+            self.broadcaster.publish_to(websocket, EncodedPnl(row["strategy"], row))
+
+    def unregister(self, websocket):
+        self.broadcaster.remove(websocket)
+
+
+# 创建单例实例
+pnl_engine = PnlEngine()
@@ -0,0 +1,240 @@
+import asyncio
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..models.trading import TradingSignal as TradingSignalModel
+from .monitor_service import MonitorService
+from ..utils.logger import setup_logger
+
+logger = setup_logger("position_index")
+
+PENDING_KEY = "position_index_pending"
+
+
+def take_profit_level(levels) -> Optional[float]:
+    """zy_tp_trigger_px 是数组列，触发时取第一档"""
+    return levels[0] if levels else None
+
+
+class OpenPosition:
+    """平仓、止盈止损触发和浮动盈亏计算需要的开仓字段"""
+    __slots__ = ("id", "trade_id", "title", "currentcy", "side", "open_price", "stop_loss", "take_profit", "lever")
+
+    def __init__(self, id: int, trade_id: str, title: Optional[str], currentcy: Optional[str],
+                 side: Optional[str], open_price: Optional[float],
+                 stop_loss: Optional[float] = None, take_profit: Optional[float] = None,
+                 lever: Optional[int] = None):
+        self.id = id
+        self.trade_id = trade_id
+        self.title = title
+        self.currentcy = currentcy
+        self.side = side
+        self.open_price = open_price
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.lever = lever
+
+    @classmethod
+    def from_row(cls, row) -> "OpenPosition":
+        return cls(row.id, row.trade_id, row.title, row.currentcy, row.side, row.open_price,
+                   row.zs_tp_trigger_px, take_profit_level(row.zy_tp_trigger_px), row.lever)
+
+    @classmethod
+    def from_values(cls, values: dict) -> "OpenPosition":
+        """由开仓记录的列值（TradingService._open_values）构造"""
+        return cls(values.get('id'), values['trade_id'], values['title'], values['currentcy'], values['side'],
+                   values['open_price'], values['zs_tp_trigger_px'], take_profit_level(values['zy_tp_trigger_px']),
+                   values['lever'])
+
+    def key(self) -> tuple:
+        return (self.id, self.trade_id, self.title, self.currentcy, self.side, self.open_price,
+                self.stop_loss, self.take_profit, self.lever)
+
+
+# 构造 OpenPosition 需要查询的列
+OPEN_POSITION_COLUMNS = (
+    TradingSignalModel.id, TradingSignalModel.trade_id, TradingSignalModel.title, TradingSignalModel.currentcy,
+    TradingSignalModel.side, TradingSignalModel.open_price, TradingSignalModel.zs_tp_trigger_px,
+    TradingSignalModel.zy_tp_trigger_px, TradingSignalModel.lever,
+)
+
+
+class OpenPositionIndex:
+    """按 trade_id 索引的未平仓记录
+
+    写穿式：事务内的变更先挂在 Session 上，提交成功后才应用到索引，回滚则丢弃，
+    因此索引只反映已提交的数据。索引未命中时调用方应回退到数据库查询。
+    索引是进程内的：多个 worker 时其它进程提交的开平仓由 sync 每 POSITION_INDEX_SYNC_INTERVAL 秒
+    从数据库拉取（按主键和 closed_at 部分索引的增量查询），同样通知监听者；verify 定期做全量核对。
+    """
+
+    def __init__(self):
+        self.positions: Dict[str, OpenPosition] = {}
+        self.loaded = False
+        self.listeners: List[Callable[[str, Optional[OpenPosition]], None]] = []
+        self.max_id = 0  # 已见过的最大记录 id
+        self.max_closed_at: Optional[datetime] = None  # 已见过的最大平仓时间
+        self.id_marks: Deque[Tuple[float, int]] = deque()  # (monotonic 时间, 当时的 max_id)，用于回看
+        self.closed_here: Dict[int, float] = {}  # 本进程最近平仓的记录 id -> monotonic 时间
+
+    def add_listener(self, callback: Callable[[str, Optional[OpenPosition]], None]):
+        """索引变化回调：callback("open" | "close", position)，重新加载后 callback("load", None)"""
+        self.listeners.append(callback)
+
+    def _notify(self, event: str, position: Optional[OpenPosition]):
+        for callback in self.listeners:
+            try:
+                callback(event, position)
+            except Exception as e:
+                logger.error(f"Error in position index listener: {e}")
+
+    async def load(self, db: AsyncSession):
+        """启动时从数据库加载（同一 trade_id 有多条未平仓记录时取 id 最小的一条）"""
+        positions: Dict[str, OpenPosition] = {}
+        rows = await db.execute(select(*OPEN_POSITION_COLUMNS).where(
+            TradingSignalModel.is_close == False
+        ).order_by(TradingSignalModel.trade_id, TradingSignalModel.id))  # 按部分索引的顺序扫描
+        for row in rows:
+            positions.setdefault(row.trade_id, OpenPosition.from_row(row))
+        self.positions = positions
+        self.max_id = (await db.scalar(select(func.max(TradingSignalModel.id)))) or 0
+        self.max_closed_at = await db.scalar(select(func.max(TradingSignalModel.closed_at)).where(
+            TradingSignalModel.is_close == True))
+        self.id_marks = deque([(time.monotonic(), self.max_id)])
+        self.loaded = True
+        logger.info(f"Loaded {len(self.positions)} open positions")
+        self._notify("load", None)
+
+    def get_open(self, trade_id: str) -> Optional[OpenPosition]:
+        return self.positions.get(trade_id)
+
+    # 事务内登记，提交后应用
+
+    def stage_open(self, db: AsyncSession, position: OpenPosition):
+        db.info.setdefault(PENDING_KEY, []).append(("open", position))
+
+    def stage_close(self, db: AsyncSession, position: OpenPosition):
+        db.info.setdefault(PENDING_KEY, []).append(("close", position))
+
+    def discard(self, trade_id: str):
+        """索引里的记录已在数据库中平仓（例如由其它进程），直接移除"""
+        position = self.positions.pop(trade_id, None)
+        if position is not None:
+            self.closed_here[position.id] = time.monotonic()
+            self._notify("close", position)
+
+    def _after_commit(self, session: Session):
+        for op in session.info.pop(PENDING_KEY, ()):
+            if op[0] == "open":
+                if op[1].trade_id not in self.positions:
+                    self.positions[op[1].trade_id] = op[1]
+                    self._notify("open", op[1])
+            else:
+                position = op[1]
+                self.closed_here[position.id] = time.monotonic()
+                current = self.positions.get(position.trade_id)
+                if current is not None and current.id == position.id:
+                    del self.positions[position.trade_id]
+                    self._notify("close", current)
+
+    def _after_rollback(self, session: Session):
+        session.info.pop(PENDING_KEY, None)
+
+    # 多进程同步
+
+    async def sync(self, db: AsyncSession) -> int:
+        """应用其它进程已提交的开平仓，返回索引的变化数
+
+        开仓：id 大于 POSITION_INDEX_SYNC_LAG 秒前的 max_id 的未平仓记录；平仓：closed_at 不早于
+        已见最大平仓时间减去同样回看窗口的记录。回看窗口覆盖先分配 id / 先写平仓时间、后提交的事务，
+        窗口内重复看到的记录按 id 核对后忽略；本进程刚平仓的记录不会因为查询快照较旧而被加回。
+        """
+        lag = settings.POSITION_INDEX_SYNC_LAG
+        now = time.monotonic()
+        # 回看起点：不晚于 lag 秒前的最后一个水位（都比它新时用最早的水位）
+        while len(self.id_marks) > 1 and now - self.id_marks[1][0] >= lag:
+            self.id_marks.popleft()
+        low_id = self.id_marks[0][1] if self.id_marks else self.max_id
+        for position_id, closed in list(self.closed_here.items()):
+            if now - closed > 2 * lag:
+                del self.closed_here[position_id]
+
+        opened = (await db.execute(select(*OPEN_POSITION_COLUMNS, TradingSignalModel.is_close).where(
+            TradingSignalModel.id > low_id
+        ).order_by(TradingSignalModel.id))).all()
+        closed_since = self.max_closed_at - timedelta(seconds=lag) if self.max_closed_at is not None else None
+        closed_query = select(TradingSignalModel.id, TradingSignalModel.trade_id, TradingSignalModel.closed_at).where(
+            TradingSignalModel.is_close == True)
+        if closed_since is not None:
+            closed_query = closed_query.where(TradingSignalModel.closed_at >= closed_since)
+        closed = (await db.execute(closed_query)).all()
+
+        changes = 0
+        for row in opened:
+            self.max_id = max(self.max_id, row.id)
+            if not row.is_close and row.trade_id not in self.positions and row.id not in self.closed_here:
+                position = self.positions[row.trade_id] = OpenPosition.from_row(row)
+                self._notify("open", position)
+                changes += 1
+        for row in closed:
+            if row.closed_at is not None and (self.max_closed_at is None or row.closed_at > self.max_closed_at):
+                self.max_closed_at = row.closed_at
+            current = self.positions.get(row.trade_id)
+            if current is not None and current.id == row.id:
+                del self.positions[row.trade_id]
+                self._notify("close", current)
+                changes += 1
+        if not self.id_marks or self.id_marks[-1][1] != self.max_id:
+            self.id_marks.append((now, self.max_id))
+        return changes
+
+    # 一致性检查
+
+    async def verify(self, db: AsyncSession) -> Dict[str, List]:
+        """对比索引与数据库，返回不一致的 trade_id；全部为空列表表示一致"""
+        expected = OpenPositionIndex()
+        await expected.load(db)
+        report = {
+            "missing": sorted(set(expected.positions) - set(self.positions)),
+            "extra": sorted(set(self.positions) - set(expected.positions)),
+            "mismatched": sorted(
+                trade_id for trade_id in set(expected.positions) & set(self.positions)
+                if expected.positions[trade_id].key() != self.positions[trade_id].key()
+            ),
+        }
+        if any(report.values()):
+            logger.warning(f"Position index out of sync with database: {report}")
+        return report
+
+    async def watch(self, session_factory: Callable[[], AsyncSession], interval: float = None,
+                    sync_interval: float = None):
+        """定期拉取其它进程的开平仓；每 interval 秒核对一次索引与数据库，发现不一致时重新加载"""
+        interval = settings.POSITION_INDEX_VERIFY_INTERVAL if interval is None else interval
+        sync_interval = settings.POSITION_INDEX_SYNC_INTERVAL if sync_interval is None else sync_interval
+        last_verify = time.monotonic()
+        while True:
+            await asyncio.sleep(sync_interval)
+            try:
+                async with session_factory() as db:
+                    if time.monotonic() - last_verify < interval:
+                        await self.sync(db)
+                        continue
+                    last_verify = time.monotonic()
+                    report = await self.verify(db)
+                    if any(report.values()):
+                        MonitorService.position_index_mismatches_total.inc()
+                        await self.load(db)
+            except Exception as e:
+                logger.error(f"Position index check failed: {e}")
+
+
+position_index = OpenPositionIndex()
+
+# 所有 Session（包括 AsyncSession 底层的同步 Session）提交/回滚时应用或丢弃登记的变更（没有登记变更的 Session 不受影响）
+event.listen(Session, "after_commit", position_index._after_commit)
+event.listen(Session, "after_rollback", position_index._after_rollback)
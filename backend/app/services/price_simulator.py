@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from ..config import settings
+from ..utils.logger import setup_logger
+
+logger = setup_logger("price_simulator")
+
+SECONDS_PER_YEAR = 365 * 86400
+GBM = "gbm"
+REGIME = "regime"
+
+# 默认参数：start 初始价，drift/vol 为年化漂移和波动率，low/high 为价格边界
+DEFAULT_PARAMS = {
+    "BTCUSDT": {"start": 52000.0, "drift": 0.0, "vol": 0.6, "low": 49000.0, "high": 55000.0},
+    "ETHUSDT": {"start": 3200.0, "drift": 0.0, "vol": 0.75, "low": 2900.0, "high": 3500.0},
+    "XRPUSDT": {"start": 0.55, "drift": 0.0, "vol": 0.9, "low": 0.45, "high": 0.65},
+    "SOLUSDT": {"start": 150.0, "drift": 0.0, "vol": 1.0, "low": 100.0, "high": 200.0},
+    "RUNEUSDT": {"start": 5.0, "drift": 0.0, "vol": 1.2, "low": 3.0, "high": 8.0},
+    "1000PEPEUSDT": {"start": 0.01, "drift": 0.0, "vol": 1.5, "low": 0.005, "high": 0.02},
+    "WUSDT": {"start": 0.4, "drift": 0.0, "vol": 1.3, "low": 0.2, "high": 0.8},
+}
+SYNTHETIC_PARAMS = {"start": 100.0, "drift": 0.0, "vol": 0.8, "low": 50.0, "high": 200.0}
+
+# 状态切换模型的两个状态：平稳 / 剧烈，分别放大波动率和漂移
+REGIME_VOL = np.array([1.0, 3.0])
+REGIME_DRIFT = np.array([1.0, -2.0])
+
+
+def load_params(path: str = None, synthetic: int = None) -> Dict[str, dict]:
+    """每个交易对的模拟参数：JSON 文件中的交易对覆盖默认值，再追加 synthetic 个合成交易对"""
+    path = settings.SIMULATOR_CONFIG if path is None else path
+    synthetic = settings.SIMULATOR_SYMBOLS if synthetic is None else synthetic
+    params = {symbol: dict(values) for symbol, values in DEFAULT_PARAMS.items()}
+    if path:
+        with open(path) as f:
+            for symbol, values in json.load(f).items():
+                params[symbol.upper()] = {**params.get(symbol.upper(), SYNTHETIC_PARAMS), **values}
+    for i in range(synthetic):
+        params[f"SIM{i:05d}USDT"] = dict(SYNTHETIC_PARAMS)
+    return params
+
+
+class PriceSimulator:
+    """向量化行情模拟器：每一步用一次 NumPy 批量运算推进所有交易对
+
+    model=gbm 为几何布朗运动；model=regime 在平稳/剧烈两个状态间按马尔可夫链切换。
+    价格在对数空间内被边界反射，不会贴在边界上。
+    """
+
+    def __init__(self, params: Dict[str, dict] = None, model: str = None, tick_rate: float = None,
+                 switch_prob: float = None, seed: Optional[int] = None, yield_every: int = 1000):
+        params = load_params() if params is None else params
+        self.symbols: List[str] = list(params)
+        column = lambda key: np.array([float(params[s][key]) for s in self.symbols])
+        self.prices = column("start")
+        self.drift = column("drift")
+        self.vol = column("vol")
+        self.log_low = np.log(column("low"))
+        self.log_high = np.log(column("high"))
+        self.model = model or settings.SIMULATOR_MODEL
+        if self.model not in (GBM, REGIME):
+            raise ValueError(f"Unknown simulator model: {self.model}")
+        self.tick_rate = tick_rate or settings.SIMULATOR_TICK_RATE
+        self.switch_prob = settings.SIMULATOR_REGIME_SWITCH_PROB if switch_prob is None else switch_prob
+        self.rng = np.random.default_rng(settings.SIMULATOR_SEED if seed is None else seed)
+        self.regimes = np.zeros(len(self.symbols), dtype=np.int8)
+        self.yield_every = yield_every
+        self.steps = 0
+        self.late_steps = 0
+
+    def step(self, dt: float = None) -> np.ndarray:
+        """推进 dt 秒（默认一个 tick 间隔），返回所有交易对的新价格"""
+        dt = (1.0 / self.tick_rate if dt is None else dt) / SECONDS_PER_YEAR
+        drift, vol = self.drift, self.vol
+        if self.model == REGIME:
+            switched = self.rng.random(len(self.regimes)) < self.switch_prob
+            self.regimes ^= switched.astype(np.int8)
+            drift = drift * REGIME_DRIFT[self.regimes]
+            vol = vol * REGIME_VOL[self.regimes]
+        shocks = self.rng.standard_normal(len(self.prices))
+        log_prices = np.log(self.prices) + (drift - 0.5 * vol * vol) * dt + vol * np.sqrt(dt) * shocks
+        # 对数空间内反射边界，再截断防止一步跨过整个区间
+        log_prices = np.where(log_prices > self.log_high, 2 * self.log_high - log_prices, log_prices)
+        log_prices = np.where(log_prices < self.log_low, 2 * self.log_low - log_prices, log_prices)
+        self.prices = np.exp(np.clip(log_prices, self.log_low, self.log_high))
+        self.steps += 1
+        return self.prices
+
+    def publish(self, feed, ts_ms: int, start: int = 0, end: int = None):
+        """把当前价格逐个交易对送入 feed.handle_message（与上游行情相同的处理和广播路径）"""
+        for symbol, price in zip(self.symbols[start:end], self.prices[start:end].tolist()):
+            feed.handle_message({'s': symbol, 'p': price, 'E': ts_ms})
+
+    async def run(self, feed, steps: int = None):
+        """按 tick_rate 持续推进并推送；steps 为 None 时一直运行"""
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.tick_rate
+        logger.info(f"Simulating {len(self.symbols)} symbols ({self.model}) at {self.tick_rate} steps/s")
+        next_step = loop.time()
+        done = 0
+        while steps is None or done < steps:
+            self.step()
+            ts_ms = int(time.time() * 1000)
+            for start in range(0, len(self.symbols), self.yield_every):
+                self.publish(feed, ts_ms, start, start + self.yield_every)
+                # 大批量推送时定期让出事件循环，让客户端写任务有机会发送
+                await asyncio.sleep(0)
+            done += 1
+            next_step += interval
+            delay = next_step - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                # 一步的计算和推送超过了 tick 间隔，不追赶，从当前时间重新计时
+                self.late_steps += 1
+                next_step = loop.time()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量化行情模拟器容量测试")
+    parser.add_argument("--symbols", type=int, default=5000, help="合成交易对数量")
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--model", choices=[GBM, REGIME], default=REGIME)
+    args = parser.parse_args()
+
+    from .binance_ws import BinanceWebSocket
+
+    simulator = PriceSimulator(load_params(path="", synthetic=args.symbols), model=args.model, seed=0)
+    started = time.perf_counter()
+    for _ in range(args.steps):
+        simulator.step()
+    step_time = (time.perf_counter() - started) / args.steps
+
+    feed = BinanceWebSocket()
+    started = time.perf_counter()
+    simulator.publish(feed, int(time.time() * 1000))
+    publish_time = time.perf_counter() - started
+    count = len(simulator.symbols)
+    print(f"{count} symbols: step {step_time * 1e3:.2f} ms, "
+          f"ingest {publish_time * 1e3:.1f} ms ({count / publish_time:,.0f} ticks/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+from ..config import settings
+from ..utils.logger import setup_logger
+
+logger = setup_logger("price_table")
+
+# 固定布局：64 字节文件头 + capacity 个 64 字节槽位
+#   文件头: magic | version | capacity | count(已分配槽位数) | heartbeat(行情所有者心跳, Unix 秒)
+#   槽位:   seq | price | received_at | event_ts | requested | symbol
+# 每个槽位只有行情所有者进程写入，用 seqlock 保证读者无锁读到一致的数据：
+# 写入前 seq 变为奇数，写完变为偶数；读者读到相同的偶数 seq 才算读成功。
+MAGIC = b"PRICETB1"
+VERSION = 1
+HEADER = struct.Struct("<8sIII4xd")
+HEADER_SIZE = 64
+SLOT_SIZE = 64
+SEQ = struct.Struct("<Q")
+RECORD = struct.Struct("<Qddq")  # seq, price, received_at, event_ts
+DATA = struct.Struct("<ddq")
+REQUESTED = struct.Struct("<I")
+REQUESTED_OFFSET = 32
+SYMBOL_OFFSET = 40
+SYMBOL_SIZE = 24
+COUNT_OFFSET = 16
+HEARTBEAT_OFFSET = 24
+# 连续读到写入中的槽位这么多次后让出 CPU：写进程可能在写到一半时被调度走
+SPIN_LIMIT = 64
+# 读一个槽位最多尝试的次数；所有者在两次写 seq 之间退出时槽位会一直是奇数，不能无限等待
+READ_RETRIES = 1024
+
+
+def default_path() -> str:
+    """未配置时按端口和应用目录区分，同一台机器上的多个部署不会共用一张表"""
+    if settings.PRICE_TABLE_PATH:
+        return settings.PRICE_TABLE_PATH
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(directory, f"trading_price_table_{settings.API_PORT}_{zlib.crc32(app_dir.encode()):08x}")
+
+
+class SharedPriceTable:
+    """跨 uvicorn worker 共享的价格表（mmap 文件）
+
+    只有持有 owner 锁的进程连接上游并写入价格，其它 worker 无锁读取。
+    """
+
+    def __init__(self, path: str = None, capacity: int = None):
+        self.path = path or default_path()
+        self.capacity = capacity or settings.PRICE_TABLE_CAPACITY
+        self.size = HEADER_SIZE + self.capacity * SLOT_SIZE
+        self._owner_fd: Optional[int] = None
+        self._index: Dict[str, int] = {}
+        self._indexed = 0
+        self._init_file()
+        self._fd = os.open(self.path, os.O_RDWR)
+        self.mm = mmap.mmap(self._fd, self.size)
+
+    def _init_file(self):
+        """首次使用（或布局不一致）时初始化文件，用文件锁避免多个 worker 同时初始化"""
+        with open(self.path + ".lock", "a+b") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    valid = False
+                    if os.fstat(fd).st_size == self.size:
+                        magic, version, capacity, _, _ = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+                        valid = magic == MAGIC and version == VERSION and capacity == self.capacity
+                    if not valid:
+                        os.ftruncate(fd, 0)
+                        os.ftruncate(fd, self.size)
+                        os.pwrite(fd, HEADER.pack(MAGIC, VERSION, self.capacity, 0, 0.0), 0)
+                finally:
+                    os.close(fd)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def close(self):
+        self.release_owner()
+        self.mm.close()
+        os.close(self._fd)
+
+    # 行情所有者
+
+    def try_acquire_owner(self) -> bool:
+        """尝试成为行情所有者（非阻塞）；所有者进程退出时锁自动释放"""
+        if self._owner_fd is not None:
+            return True
+        fd = os.open(self.path + ".owner", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._owner_fd = fd
+        self.heartbeat()
+        logger.info(f"Process {os.getpid()} owns the price feed")
+        return True
+
+    def release_owner(self):
+        if self._owner_fd is not None:
+            fcntl.flock(self._owner_fd, fcntl.LOCK_UN)
+            os.close(self._owner_fd)
+            self._owner_fd = None
+
+    @property
+    def is_owner(self) -> bool:
+        return self._owner_fd is not None
+
+    def heartbeat(self):
+        struct.pack_into("<d", self.mm, HEARTBEAT_OFFSET, time.time())
+
+    def last_heartbeat(self) -> float:
+        return struct.unpack_from("<d", self.mm, HEARTBEAT_OFFSET)[0]
+
+    # 槽位索引
+
+    def _count(self) -> int:
+        return struct.unpack_from("<I", self.mm, COUNT_OFFSET)[0]
+
+    def _refresh_index(self):
+        count = self._count()
+        for slot in range(self._indexed, count):
+            offset = HEADER_SIZE + slot * SLOT_SIZE + SYMBOL_OFFSET
+            symbol = bytes(self.mm[offset:offset + SYMBOL_SIZE]).rstrip(b"\0").decode()
+            self._index[symbol] = slot
+        self._indexed = count
+
+    def slot_of(self, symbol: str) -> Optional[int]:
+        slot = self._index.get(symbol)
+        if slot is None:
+            self._refresh_index()
+            slot = self._index.get(symbol)
+        return slot
+
+    def _allocate(self, symbol: str) -> int:
+        """分配槽位：先写交易对名再增加 count，读者看到 count 时名字已就绪"""
+        encoded = symbol.encode()
+        if len(encoded) > SYMBOL_SIZE:
+            raise ValueError(f"Symbol too long for price table: {symbol}")
+        with open(self.path + ".lock", "a+b") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                slot = self.slot_of(symbol)
+                if slot is not None:
+                    return slot
+                count = self._count()
+                if count >= self.capacity:
+                    raise RuntimeError("Price table is full")
+                offset = HEADER_SIZE + count * SLOT_SIZE
+                self.mm[offset + SYMBOL_OFFSET:offset + SYMBOL_OFFSET + SYMBOL_SIZE] = encoded.ljust(SYMBOL_SIZE, b"\0")
+                struct.pack_into("<I", self.mm, COUNT_OFFSET, count + 1)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self._refresh_index()
+        return self._index[symbol]
+
+    # 读写
+
+    def write(self, symbol: str, price: float, received_at: float, event_ts: int = 0):
+        """只允许行情所有者调用"""
+        slot = self.slot_of(symbol)
+        if slot is None:
+            slot = self._allocate(symbol)
+        offset = HEADER_SIZE + slot * SLOT_SIZE
+        seq = SEQ.unpack_from(self.mm, offset)[0]
+        if seq & 1:
+            # 上一个所有者写到一半时退出，接管后从下一个偶数继续
+            seq += 1
+        SEQ.pack_into(self.mm, offset, seq + 1)
+        DATA.pack_into(self.mm, offset + 8, price, received_at, event_ts)
+        SEQ.pack_into(self.mm, offset, seq + 2)
+
+    def _read_slot(self, slot: int) -> Optional[Tuple[int, float, float, int]]:
+        """一致地读出槽位；READ_RETRIES 次仍在写入中（所有者可能已退出）时返回 None，视为无新数据"""
+        offset = HEADER_SIZE + slot * SLOT_SIZE
+        for attempt in range(1, READ_RETRIES + 1):
+            seq, price, received_at, event_ts = RECORD.unpack_from(self.mm, offset)
+            if not seq & 1 and SEQ.unpack_from(self.mm, offset)[0] == seq:
+                return seq, price, received_at, event_ts
+            if attempt % SPIN_LIMIT == 0:
+                os.sched_yield()
+        logger.warning(f"Price table slot {slot} stuck mid-write, treating it as stale")
+        return None
+
+    def read(self, symbol: str) -> Optional[Tuple[float, float]]:
+        """无锁读取 (price, received_at)；还没有价格时返回 None"""
+        slot = self.slot_of(symbol)
+        if slot is None:
+            return None
+        record = self._read_slot(slot)
+        if record is None or record[0] == 0:
+            return None
+        return record[1], record[2]
+
+    def changed_since(self, versions: List[int]) -> List[Tuple[str, float, float, int]]:
+        """自上次调用以来更新过的槽位；versions 由调用方保存，每个槽位一个 seq"""
+        self._refresh_index()
+        names = {slot: symbol for symbol, slot in self._index.items()}
+        changed = []
+        for slot in range(self._indexed):
+            if slot >= len(versions):
+                versions.append(0)
+            offset = HEADER_SIZE + slot * SLOT_SIZE
+            if SEQ.unpack_from(self.mm, offset)[0] == versions[slot]:
+                continue
+            record = self._read_slot(slot)
+            if record is None:
+                continue
+            seq, price, received_at, event_ts = record
+            versions[slot] = seq
+            if seq:
+                changed.append((names[slot], price, received_at, event_ts))
+        return changed
+
+    # 非所有者 worker 请求订阅
+
+    def request(self, symbol: str):
+        """登记一个需要订阅的交易对，由行情所有者轮询后订阅"""
+        slot = self.slot_of(symbol)
+        if slot is None:
+            slot = self._allocate(symbol)
+        REQUESTED.pack_into(self.mm, HEADER_SIZE + slot * SLOT_SIZE + REQUESTED_OFFSET, 1)
+
+    def take_requests(self) -> List[str]:
+        self._refresh_index()
+        requested = []
+        for symbol, slot in self._index.items():
+            offset = HEADER_SIZE + slot * SLOT_SIZE + REQUESTED_OFFSET
+            if REQUESTED.unpack_from(self.mm, offset)[0]:
+                REQUESTED.pack_into(self.mm, offset, 0)
+                requested.append(symbol)
+        return requested
+
+
+class SharedPriceFollower:
+    """非所有者 worker：轮询共享价格表，把变化的价格送入本进程的处理路径"""
+
+    def __init__(self, table: SharedPriceTable, on_price: Callable[[str, float, float, int], None],
+                 interval: float = None):
+        self.table = table
+        self.on_price = on_price
+        self.interval = interval or settings.PRICE_TABLE_POLL_INTERVAL
+        self.versions: List[int] = []
+
+    def poll(self) -> int:
+        changed = self.table.changed_since(self.versions)
+        for symbol, price, received_at, event_ts in changed:
+            self.on_price(symbol, price, received_at, event_ts)
+        return len(changed)
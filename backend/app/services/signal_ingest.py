@@ -0,0 +1,531 @@
+import asyncio
+import fcntl
+import itertools
+import json
+import os
+import struct
+import zlib
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..models.trading import IngestCheckpoint, TradingSignal as TradingSignalModel
+from ..schemas import TradingSignal
+from .binance_ws import binance_ws
+from .monitor_service import MonitorService
+from .position_index import position_index
+from .trading_service import TradingService, china_now
+from ..utils.logger import setup_logger
+
+logger = setup_logger("signal_ingest")
+
+RESULTS_KEPT = 10000  # status() 能查到结果的最近条数
+HEAD = struct.Struct("<QQ")  # signals.head：下一个序号、已确认的日志长度
+UNRESOLVED = ""  # 旧格式的记录没有交易对字段，也没有价格时无法确定接收时的价格
+
+
+class JournalEntry:
+    """日志中的一条信号：序号、接收时间、交易对（平仓为所平仓位的，找不到仓位时为 None）、接收时的价格"""
+    __slots__ = ("seq", "received_at", "symbol", "prices", "signal")
+
+    def __init__(self, seq: int, received_at: datetime, symbol: Optional[str], prices: Dict[str, float],
+                 signal: TradingSignal):
+        self.seq = seq
+        self.received_at = received_at
+        self.symbol = symbol
+        self.prices = prices
+        self.signal = signal
+
+    @property
+    def priced(self) -> bool:
+        """有交易对的记录必须带着接收时的价格"""
+        return self.symbol is None or self.symbol in self.prices
+
+    def encode(self) -> bytes:
+        """一行：<seq> <crc32> <json>，crc 覆盖 json 部分，用于识别写了一半的尾行"""
+        payload = json.dumps({"t": self.received_at.isoformat(), "y": self.symbol, "p": self.prices,
+                              "s": self.signal.model_dump()}, ensure_ascii=False).encode()
+        return b"%d %08x %s\n" % (self.seq, zlib.crc32(payload), payload)
+
+    @classmethod
+    def decode(cls, line: bytes) -> Optional["JournalEntry"]:
+        try:
+            seq, crc, payload = line.rstrip(b"\n").split(b" ", 2)
+            if int(crc, 16) != zlib.crc32(payload):
+                return None
+            data = json.loads(payload)
+            symbol = data["y"] if "y" in data else next(iter(data["p"]), UNRESOLVED)
+            return cls(int(seq), datetime.fromisoformat(data["t"]), symbol, data["p"], TradingSignal(**data["s"]))
+        except (ValueError, KeyError):
+            return None
+
+
+class SignalJournal:
+    """所有 worker 共用的追加写信号日志，分组 fsync
+
+    并发到达的信号先攒在本进程内存里，由一个刷盘任务在文件锁内一次写入并 fsync，append 在数据落盘之后
+    才返回序号。序号在文件锁内分配、全局递增，所以日志顺序就是各 worker 确认的先后顺序。
+    signals.head 记录下一个序号和已确认的日志长度；它不单独 fsync，加锁时发现长度之后还有完整记录就补认，
+    末尾没写完的一行截掉。中间损坏的行读取时跳过并抄到死信文件，不影响后面的记录。
+    """
+
+    name = "signals"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.durable_seq = 0  # 本进程写入的最大序号
+        self._fd: Optional[int] = None
+        self._head_fd: Optional[int] = None
+        self._lock_fd: Optional[int] = None
+        self._buffer: List[Tuple[datetime, Optional[str], Dict[str, float], TradingSignal, asyncio.Future]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._io_lock = asyncio.Lock()  # flock 不区分同一进程的线程，进程内另外串行
+        self.on_durable: Callable[[List[JournalEntry]], None] = lambda entries: None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, self.name + ".journal")
+
+    @property
+    def dead_letter_path(self) -> str:
+        return os.path.join(self.directory, self.name + ".dead")
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        self._head_fd = os.open(os.path.join(self.directory, self.name + ".head"), os.O_RDWR | os.O_CREAT, 0o600)
+        self._lock_fd = os.open(os.path.join(self.directory, self.name + ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            self._recover()
+
+    def close(self):
+        for fd in (self._fd, self._head_fd, self._lock_fd):
+            if fd is not None:
+                os.close(fd)
+        self._fd = self._head_fd = self._lock_fd = None
+
+    @contextmanager
+    def _locked(self):
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    @property
+    def next_seq(self) -> int:
+        return self._read_head()[0]
+
+    def _read_head(self) -> Tuple[int, int]:
+        data = os.pread(self._head_fd, HEAD.size, 0)
+        return HEAD.unpack(data) if len(data) == HEAD.size else (1, 0)
+
+    def _write_head(self, next_seq: int, length: int, sync: bool = False):
+        os.pwrite(self._head_fd, HEAD.pack(next_seq, length), 0)
+        if sync:
+            os.fsync(self._head_fd)
+
+    def _recover(self) -> Tuple[int, int]:
+        """（持锁）核对 head 与文件：补认长度之后的完整记录，截掉没写完的尾行；返回 (下一个序号, 长度)"""
+        next_seq, length = self._read_head()
+        size = os.fstat(self._fd).st_size
+        length = min(length, size)
+        if size > length:
+            tail = os.pread(self._fd, size - length, length)
+            complete = tail.rfind(b"\n") + 1
+            for line in tail[:complete].splitlines(keepends=True):
+                entry = JournalEntry.decode(line)
+                if entry is not None:
+                    next_seq = max(next_seq, entry.seq + 1)
+            if complete < len(tail):
+                logger.warning(f"Truncating torn tail of {self.path} at byte {length + complete}")
+                os.ftruncate(self._fd, length + complete)
+                os.fsync(self._fd)
+            length += complete
+            self._write_head(next_seq, length)
+        return next_seq, length
+
+    def reserve(self, next_seq: int):
+        """保证之后分配的序号不小于 next_seq（日志被删除或截断后序号仍需大于检查点）"""
+        with self._locked():
+            current, length = self._recover()
+            if next_seq > current:
+                self._write_head(next_seq, length, sync=True)
+
+    async def append(self, received_at: datetime, symbol: Optional[str], prices: Dict[str, float],
+                     signal: TradingSignal) -> int:
+        """追加一条信号，落盘后返回其序号"""
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append((received_at, symbol, prices, signal, future))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+        return await future
+
+    async def _flush(self):
+        while self._buffer:
+            batch, self._buffer = self._buffer, []
+            try:
+                async with self._io_lock:
+                    entries = await asyncio.to_thread(self._write, [item[:4] for item in batch])
+            except Exception as e:
+                logger.error(f"Journal write failed: {e}")
+                for *_, future in batch:
+                    future.set_exception(e)
+                continue
+            self.durable_seq = entries[-1].seq
+            self.on_durable(entries)
+            for entry, (*_, future) in zip(entries, batch):
+                future.set_result(entry.seq)
+
+    def _write(self, items: List[Tuple[datetime, Optional[str], Dict[str, float], TradingSignal]]
+               ) -> List[JournalEntry]:
+        with self._locked():
+            next_seq, length = self._recover()
+            entries = [JournalEntry(next_seq + i, *item) for i, item in enumerate(items)]
+            data = b"".join(entry.encode() for entry in entries)
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self._fd, view):]
+            os.fsync(self._fd)
+            self._write_head(entries[-1].seq + 1, length + len(data))
+        return entries
+
+    async def read(self, offset: int, after_seq: int, report_corrupt: bool = True) -> Tuple[List[JournalEntry], int]:
+        """offset 之后已确认、序号大于 after_seq 的记录及新的读取位置；损坏的行跳过（report_corrupt 时抄到死信文件）
+
+        日志在上次读取之后被截断（compact）过时从头读。
+        """
+        async with self._io_lock:
+            return await asyncio.to_thread(self._read, offset, after_seq, report_corrupt)
+
+    def _read(self, offset: int, after_seq: int, report_corrupt: bool) -> Tuple[List[JournalEntry], int]:
+        with self._locked():
+            _, length = self._recover()
+        if offset > length or (offset and os.pread(self._fd, 1, offset - 1) != b"\n"):
+            offset = 0
+        entries = self._decode(os.pread(self._fd, length - offset, offset), report_corrupt) if length > offset else []
+        if offset and entries and entries[0].seq > after_seq + 1:
+            # 截断后重新写到了原来的位置之后：读取位置恰好落在行首，但前面还有没读过的记录
+            entries = self._decode(os.pread(self._fd, length, 0), report_corrupt)
+        return [entry for entry in entries if entry.seq > after_seq], length
+
+    def _decode(self, data: bytes, report_corrupt: bool) -> List[JournalEntry]:
+        entries = []
+        for line in data.splitlines(keepends=True):
+            entry = JournalEntry.decode(line)
+            if entry is not None:
+                entries.append(entry)
+            elif report_corrupt:
+                logger.error(f"Skipping corrupt record in {self.path}: {line[:80]!r}")
+                self._write_dead_letter({"seq": None, "error": "corrupt record",
+                                         "record": line.decode(errors="replace")})
+        return entries
+
+    async def dead_letter(self, entry: JournalEntry, error: str):
+        """把无法写入数据库的记录追加到死信文件"""
+        record = {"seq": entry.seq, "error": error, "record": entry.encode().decode()}
+        async with self._io_lock:
+            await asyncio.to_thread(self._write_dead_letter, record)
+
+    def _write_dead_letter(self, record: dict):
+        with open(self.dead_letter_path, "ab") as f:
+            f.write(json.dumps(record, ensure_ascii=False).encode() + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def compact(self, applied_seq: int, max_bytes: int = None) -> bool:
+        """日志里的记录都已写入数据库且文件超过 max_bytes 时截断，返回是否截断"""
+        max_bytes = settings.INGEST_COMPACT_BYTES if max_bytes is None else max_bytes
+        async with self._io_lock:
+            return await asyncio.to_thread(self._compact, applied_seq, max_bytes)
+
+    def _compact(self, applied_seq: int, max_bytes: int) -> bool:
+        with self._locked():
+            next_seq, length = self._recover()
+            if next_seq - 1 > applied_seq or length <= max_bytes:
+                return False
+            os.ftruncate(self._fd, 0)
+            os.fsync(self._fd)
+            self._write_head(next_seq, 0, sync=True)
+        logger.info(f"Compacted {self.path} at seq {applied_seq}")
+        return True
+
+
+class SignalIngest:
+    """信号接收：写入共享日志即确认，由一个 worker 在后台按序分组提交到数据库
+
+    所有 worker 追加到同一个日志，日志顺序就是确认顺序：同一笔交易先确认的开仓一定排在平仓前面，
+    不管它们是哪个 worker 收到的。持有 applier 锁的 worker 读日志并写库，它退出后由其它 worker 接管。
+    确认之前在接收时取得交易对和价格（与同步处理一样等待行情），一起写入日志，写库只用日志里的价格，
+    因此结果与何时入库无关；没有价格的记录移入死信文件。每次提交在同一事务内推进 ingest_checkpoint，
+    重启或接管后只重放检查点之后的记录，每条信号恰好写入一次；写不进去的记录逐条隔离，
+    多次失败后移入死信文件，不阻塞后面的信号。
+    """
+
+    def __init__(self):
+        self.journal: Optional[SignalJournal] = None
+        self.session_factory: Optional[Callable[[], AsyncSession]] = None
+        self.pending: Deque[JournalEntry] = deque()
+        self.applied_seq = 0
+        self.results: "OrderedDict[int, dict]" = OrderedDict()
+        self.pending_opens: Dict[str, Tuple[int, Optional[str]]] = {}  # 尚未入库的开仓 trade_id -> (序号, 交易对)
+        self.offset = 0  # 日志已读到的位置
+        self.read_seq = 0  # 已读到的最大序号
+        self.isolate_until = 0  # 序号不超过它的记录逐条写入（所在的批次失败过）
+        self.attempts = 0  # 队首记录连续失败的次数
+        self._applier_fd: Optional[int] = None
+        self._wakeup = asyncio.Event()
+        self._read_lock = asyncio.Lock()  # 后台任务和 submit 都会读日志，读取位置只能推进一次
+        self._writer: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._writer is not None and not self._writer.done()
+
+    @property
+    def is_applier(self) -> bool:
+        return self._applier_fd is not None
+
+    async def start(self, session_factory: Callable[[], AsyncSession], directory: str = None):
+        """打开日志并启动后台任务；抢到 applier 锁时先把检查点之后的记录（上次未入库的）排入队列"""
+        self.session_factory = session_factory
+        self.journal = SignalJournal(directory or settings.INGEST_JOURNAL_DIR)
+        self.journal.open()
+        self._wakeup = asyncio.Event()
+        self._read_lock = asyncio.Lock()
+        self.journal.on_durable = lambda entries: self._wakeup.set()
+        self.pending = deque()
+        self.pending_opens = {}
+        await self._load_checkpoint()
+        self.offset, self.read_seq = 0, self.applied_seq
+        if self._try_acquire_applier():
+            await self._become_applier()
+        self._writer = asyncio.create_task(self._run())
+        role = "applying" if self.is_applier else "journaling only"
+        logger.info(f"Signal ingest started on {self.journal.path} ({role}), applied seq {self.applied_seq}")
+
+    async def stop(self):
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        if self.journal is not None:
+            self.journal.close()
+        if self._applier_fd is not None:
+            os.close(self._applier_fd)
+            self._applier_fd = None
+        logger.info(f"Signal ingest stopped, {len(self.pending)} signals left in the journal")
+
+    def _try_acquire_applier(self) -> bool:
+        fd = os.open(os.path.join(self.journal.directory, self.journal.name + ".applier.lock"),
+                     os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._applier_fd = fd
+        return True
+
+    async def _load_checkpoint(self):
+        async with self.session_factory() as db:
+            checkpoint = await db.scalar(select(IngestCheckpoint.seq).where(
+                IngestCheckpoint.journal == self.journal.name))
+        self.applied_seq = max(self.applied_seq, checkpoint or 0)
+
+    async def _become_applier(self):
+        await self._load_checkpoint()
+        await asyncio.to_thread(self.journal.reserve, self.applied_seq + 1)
+        self.offset, self.read_seq = 0, self.applied_seq
+        self.pending = deque()
+        self.pending_opens = {}
+        await self._read_new()
+        if self.pending:
+            logger.info(f"Replaying {len(self.pending)} signals from {self.journal.path}")
+
+    async def _read_new(self):
+        """读日志新增的记录：写库的 worker 排入队列，其它 worker 只记下待写入的开仓（用于确定平仓的交易对）"""
+        async with self._read_lock:
+            entries, self.offset = await self.journal.read(self.offset, self.read_seq, report_corrupt=self.is_applier)
+            if entries:
+                self.read_seq = entries[-1].seq
+        self._track_opens(entries)
+        if self.is_applier:
+            self.pending.extend(entries)
+            MonitorService.ingest_pending.set(len(self.pending))
+        else:
+            # 检查点之前的开仓已经入库，由未平仓索引或数据库提供
+            for trade_id in [t for t, (seq, _) in self.pending_opens.items() if seq <= self.applied_seq]:
+                del self.pending_opens[trade_id]
+
+    def _track_opens(self, entries: List[JournalEntry]):
+        for entry in entries:
+            if entry.signal.is_close != "1":
+                self.pending_opens[entry.signal.trade_id] = (entry.seq, entry.signal.currentcy)
+
+    async def _resolve_symbol(self, signal: TradingSignal) -> Optional[str]:
+        """信号对应的交易对：开仓取信号里的；平仓依次查未平仓索引、日志里待写入的开仓和数据库"""
+        if signal.is_close != "1":
+            return signal.currentcy
+        position = position_index.get_open(signal.trade_id)
+        if position is not None:
+            return position.currentcy
+        if signal.trade_id not in self.pending_opens:
+            # 开仓可能刚由其它 worker 写入日志
+            await self._read_new()
+        pending = self.pending_opens.get(signal.trade_id)
+        if pending is not None:
+            return pending[1]
+        # 已入库但本进程的索引还没同步到
+        async with self.session_factory() as db:
+            return await db.scalar(select(TradingSignalModel.currentcy).where(
+                TradingSignalModel.trade_id == signal.trade_id,
+                TradingSignalModel.is_close == False
+            ).order_by(TradingSignalModel.id).limit(1))
+
+    async def submit(self, signal: TradingSignal) -> int:
+        """取得接收时的交易对和价格（必要时等待行情），写入日志并落盘后返回序号
+
+        取不到价格时抛出异常，信号不被确认；找不到仓位的平仓不需要价格。
+        """
+        received_at = china_now()
+        symbol = await self._resolve_symbol(signal)
+        prices = {}
+        if symbol:
+            price = await binance_ws.wait_for_price(symbol)
+            if price is None:
+                raise RuntimeError(f"No price for {symbol}, signal {signal.trade_id} not accepted")
+            prices[symbol] = price
+        return await self.journal.append(received_at, symbol, prices, signal)
+
+    def status(self, seq: int) -> Optional[dict]:
+        """序号的处理状态；未知序号返回 None（非写库的 worker 定期从数据库刷新检查点，没有处理结果）"""
+        if self.journal is None or seq < 1 or seq >= self.journal.next_seq:
+            return None
+        if seq > self.applied_seq:
+            return {"seq": seq, "status": "pending"}
+        result = self.results.get(seq)
+        return {"seq": seq, "status": "applied", **({"result": result} if result is not None else {})}
+
+    async def _advance_checkpoint(self, db: AsyncSession, seq: int):
+        dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+        stmt = dialect.insert(IngestCheckpoint.__table__).values(journal=self.journal.name, seq=seq)
+        await db.execute(stmt.on_conflict_do_update(index_elements=["journal"], set_={"seq": stmt.excluded.seq}))
+
+    def _done(self, entry: JournalEntry, result: dict):
+        self.pending.popleft()
+        self.results[entry.seq] = result
+        trade_id = entry.signal.trade_id
+        if trade_id in self.pending_opens and self.pending_opens[trade_id][0] <= entry.seq:
+            del self.pending_opens[trade_id]
+        while len(self.results) > RESULTS_KEPT:
+            self.results.popitem(last=False)
+        self.applied_seq = entry.seq
+        MonitorService.ingest_pending.set(len(self.pending))
+
+    async def apply_pending(self, batch_size: int = None) -> int:
+        """把队首最多 batch_size 条信号在一个事务内写入数据库，返回条数；失败时抛出异常，队列不变"""
+        batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        batch = []
+        for entry in itertools.islice(self.pending, batch_size):
+            if not entry.priced:
+                break  # 由 _apply_next 移入死信文件
+            batch.append(entry)
+        if not batch:
+            return 0
+        last_seq = batch[-1].seq
+
+        async def before_commit(db: AsyncSession):
+            await self._advance_checkpoint(db, last_seq)
+
+        async with self.session_factory() as db:
+            results = await TradingService.create_signals_batch(
+                db, [entry.signal for entry in batch],
+                [(entry.received_at, entry.prices) for entry in batch],
+                before_commit=before_commit)
+        for entry, result in zip(batch, results):
+            result.pop('index', None)
+            self._done(entry, result)
+        MonitorService.ingest_applied_total.inc(len(batch))
+        MonitorService.trade_count.inc(len(batch))
+        return len(batch)
+
+    async def dead_letter(self, error: Exception):
+        """把队首记录移入死信文件，并在数据库里推进检查点越过它"""
+        entry = self.pending[0]
+        await self.journal.dead_letter(entry, str(error))
+        async with self.session_factory() as db:
+            await self._advance_checkpoint(db, entry.seq)
+            await db.commit()
+        logger.error(f"Moved signal seq {entry.seq} ({entry.signal.trade_id}) to {self.journal.dead_letter_path}")
+        self._done(entry, {'trade_id': entry.signal.trade_id, 'status': 'dead_letter', 'detail': str(error)})
+        MonitorService.ingest_dead_letter_total.inc()
+
+    async def _apply_next(self):
+        """写入队首的一批；批次失败后对其中的记录逐条重试，单条多次失败的移入死信文件"""
+        if not self.pending[0].priced:
+            try:
+                await self.dead_letter(ValueError("No price captured at receive time"))
+            except Exception as e:
+                logger.error(f"Error dead-lettering seq {self.pending[0].seq}: {e}")
+                await asyncio.sleep(settings.INGEST_RETRY_DELAY)
+            return
+        isolating = self.pending[0].seq <= self.isolate_until
+        try:
+            await self.apply_pending(1 if isolating else None)
+        except Exception as e:
+            logger.error(f"Error applying ingested signals from seq {self.pending[0].seq}: {e}")
+            if not isolating:
+                # 找出批内写不进去的那条：之后逐条写入，不等待
+                self.isolate_until = self.pending[min(settings.INGEST_BATCH_SIZE, len(self.pending)) - 1].seq
+                return
+            self.attempts += 1
+            if self.attempts >= settings.INGEST_MAX_ATTEMPTS:
+                try:
+                    await self.dead_letter(e)
+                    self.attempts = 0
+                    return
+                except Exception as dead_error:
+                    logger.error(f"Error dead-lettering seq {self.pending[0].seq}: {dead_error}")
+            await asyncio.sleep(settings.INGEST_RETRY_DELAY)
+            return
+        self.attempts = 0
+
+    async def _run(self):
+        while not self.is_applier:
+            await asyncio.sleep(settings.INGEST_TAKEOVER_INTERVAL)
+            try:
+                # 非写库的 worker 也要知道检查点，status() 才能报告已写入
+                await self._load_checkpoint()
+                if self._try_acquire_applier():
+                    logger.info("Took over applying the signal journal")
+                    await self._become_applier()
+            except Exception as e:
+                logger.error(f"Error checking the signal journal applier: {e}")
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.INGEST_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            if self._wakeup.is_set():
+                self._wakeup.clear()
+                # 稍等片刻，让同一时间到达的信号进入同一个事务
+                await asyncio.sleep(settings.INGEST_COMMIT_WINDOW)
+            await self._read_new()
+            if not self.pending:
+                continue
+            while self.pending:
+                await self._apply_next()
+            if await self.journal.compact(self.applied_seq):
+                self.offset = 0
+
+
+# 创建单例实例
+signal_ingest = SignalIngest()
@@ -0,0 +1,137 @@
+import asyncio
+import time
+import zlib
+from typing import Awaitable, Callable, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..schemas import TradingSignal
+from .monitor_service import MonitorService
+from .trading_service import TradingService
+from ..utils.logger import setup_logger
+
+logger = setup_logger("signal_lanes")
+
+Handler = Callable[..., Awaitable[object]]  # handler(db, signal, **options)
+
+
+class LaneBarrier:
+    """批量信号在通道里的占位：每条涉及的通道处理到它时停下，全部到齐后批处理开始，处理完再放行"""
+
+    def __init__(self, count: int):
+        self.waiting = count
+        self.ready = asyncio.Event()
+        self.released = asyncio.Event()
+
+    def arrive(self):
+        self.waiting -= 1
+        if self.waiting == 0:
+            self.ready.set()
+
+
+class SignalLanes:
+    """按 trade_id 分片的信号处理通道
+
+    同一个 trade_id 总是进入同一条通道，通道内逐条处理（各自的会话和事务），
+    因此同一笔交易的开仓和平仓严格按到达顺序执行，不会看到对方未提交的状态；
+    不同通道互不等待，无关的交易并行处理。
+    """
+
+    def __init__(self, count: int = None, queue_size: int = None):
+        self.count = count or settings.SIGNAL_LANES
+        self.queue_size = queue_size or settings.SIGNAL_LANE_QUEUE_SIZE
+        self.queues: List[asyncio.Queue] = []
+        self.workers: List[asyncio.Task] = []
+        self.session_factory: Optional[Callable[[], AsyncSession]] = None
+        self.handler: Handler = TradingService.create_signal
+        self.batch_lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return bool(self.workers)
+
+    def lane_of(self, trade_id: str) -> int:
+        return zlib.crc32(trade_id.encode()) % self.count
+
+    def start(self, session_factory: Callable[[], AsyncSession], handler: Handler = None):
+        if self.running:
+            return
+        self.session_factory = session_factory
+        self.handler = handler or TradingService.create_signal
+        self.queues = [asyncio.Queue(self.queue_size) for _ in range(self.count)]
+        self.workers = [asyncio.create_task(self._work(lane)) for lane in range(self.count)]
+        logger.info(f"Started {self.count} signal lanes")
+
+    async def stop(self):
+        """处理完已排队的信号后停止"""
+        for queue in self.queues:
+            await queue.join()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        self.queues = []
+
+    async def submit(self, signal: TradingSignal, **options):
+        """把信号排入其 trade_id 所在的通道，返回处理结果（异常原样抛出）；通道排满时等待
+
+        options 原样传给 handler（例如 create_signal 的 price）。
+        """
+        lane = self.lane_of(signal.trade_id)
+        future = asyncio.get_running_loop().create_future()
+        queue = self.queues[lane]
+        await queue.put((signal, options, future, time.perf_counter()))
+        MonitorService.signal_lane_depth.labels(lane=str(lane)).set(queue.qsize())
+        return await future
+
+    async def submit_batch(self, signals: List[TradingSignal], handler: Handler = None):
+        """一批信号在一个事务内处理（默认 TradingService.create_signals_batch），与单条信号保持同一 trade_id 的顺序
+
+        在批内每个 trade_id 所在的通道里排入同一个 LaneBarrier：这些通道先处理完排在前面的信号，
+        然后暂停到批处理结束，排在后面的信号看到的是批处理提交后的状态。占位在锁内按通道号
+        顺序排入，任意两批在它们共有的通道里先后顺序一致，不会互相等待。
+        """
+        lanes = sorted({self.lane_of(signal.trade_id) for signal in signals})
+        barrier = LaneBarrier(len(lanes))
+        try:
+            async with self.batch_lock:
+                for lane in lanes:
+                    await self.queues[lane].put((barrier, None, None, time.perf_counter()))
+            if lanes:
+                await barrier.ready.wait()
+            async with self.session_factory() as db:
+                return await (handler or TradingService.create_signals_batch)(db, signals)
+        finally:
+            barrier.released.set()
+
+    async def _work(self, lane: int):
+        queue = self.queues[lane]
+        depth = MonitorService.signal_lane_depth.labels(lane=str(lane))
+        while True:
+            signal, options, future, enqueued_at = await queue.get()
+            depth.set(queue.qsize())
+            if isinstance(signal, LaneBarrier):
+                signal.arrive()
+                await signal.released.wait()
+                queue.task_done()
+                continue
+            started = time.perf_counter()
+            MonitorService.signal_lane_wait_seconds.observe(started - enqueued_at)
+            try:
+                if future.cancelled():
+                    # 请求方已断开也照常处理，信号不能丢
+                    logger.warning(f"Signal {signal.trade_id} submitter went away, processing anyway")
+                async with self.session_factory() as db:
+                    result = await self.handler(db, signal, **options)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                MonitorService.signal_lane_service_seconds.observe(time.perf_counter() - started)
+                queue.task_done()
+
+
+# 创建单例实例
+signal_lanes = SignalLanes()
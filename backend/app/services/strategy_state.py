@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import case, delete, func, insert, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.trading import StrategyDailyStats, StrategyState, TradingSignal as TradingSignalModel
+from ..utils.logger import setup_logger
+
+logger = setup_logger("strategy_state")
+
+
+def next_streak(is_profit: Optional[bool], last_is_profit: Optional[bool],
+                win_streak: int, lose_streak: int) -> Tuple[int, int]:
+    """根据本次盈亏和上一次平仓状态计算 (连胜, 连亏)；未计算盈亏的平仓两者都归零"""
+    if is_profit is None:
+        return 0, 0
+    if is_profit:
+        return (win_streak + 1 if last_is_profit else 1), 0
+    return 0, (1 if last_is_profit else lose_streak + 1)
+
+
+async def record_close(db: AsyncSession, title: str, is_profit: Optional[bool], profit: Optional[float],
+                       closed_at: datetime, signal_id: int) -> Tuple[int, int]:
+    """在当前事务内用一条 upsert 更新策略状态，返回本次平仓后的 (连胜, 连亏)
+
+    连胜/连亏在数据库里基于行内旧值计算，并发平仓同一策略时由行锁串行化。
+    """
+    table = StrategyState.__table__
+    c = table.c
+    profit = profit or 0.0
+    won, lost = is_profit is True, is_profit is False
+    win_streak, lose_streak = next_streak(is_profit, None, 0, 0)
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(table).values(
+        title=title,
+        win_streak=win_streak,
+        lose_streak=lose_streak,
+        trade_count=1,
+        win_count=int(won),
+        loss_count=int(lost),
+        total_profit=profit,
+        peak_profit=max(profit, 0.0),
+        last_is_profit=is_profit,
+        last_closed_at=closed_at,
+        last_signal_id=signal_id,
+    )
+    last_won = c.last_is_profit.is_(True)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[c.title],
+        set_={
+            "win_streak": case((last_won, c.win_streak + 1), else_=1) if won else 0,
+            "lose_streak": case((last_won, 1), else_=c.lose_streak + 1) if lost else 0,
+            "trade_count": c.trade_count + 1,
+            "win_count": c.win_count + int(won),
+            "loss_count": c.loss_count + int(lost),
+            "total_profit": c.total_profit + profit,
+            "peak_profit": case((c.total_profit + profit > c.peak_profit, c.total_profit + profit),
+                                else_=c.peak_profit),
+            "last_is_profit": is_profit,
+            "last_closed_at": closed_at,
+            "last_signal_id": signal_id,
+        },
+    ).returning(c.win_streak, c.lose_streak)
+    row = (await db.execute(stmt)).one()
+    return row.win_streak, row.lose_streak
+
+
+def empty_state(title: str) -> dict:
+    return {"title": title, "win_streak": 0, "lose_streak": 0, "trade_count": 0, "win_count": 0,
+            "loss_count": 0, "total_profit": 0.0, "peak_profit": 0.0, "last_is_profit": None,
+            "last_closed_at": None, "last_signal_id": None}
+
+
+def apply_close(state: dict, is_profit: Optional[bool], profit: Optional[float], closed_at: datetime,
+                signal_id: Optional[int]):
+    """在内存中的状态上应用一次平仓（与 record_close 的 upsert 语义相同）"""
+    state["win_streak"], state["lose_streak"] = next_streak(
+        is_profit, state["last_is_profit"], state["win_streak"], state["lose_streak"])
+    state["trade_count"] += 1
+    state["win_count"] += is_profit is True
+    state["loss_count"] += is_profit is False
+    state["total_profit"] += profit or 0.0
+    state["peak_profit"] = max(state["peak_profit"], state["total_profit"])
+    state["last_is_profit"] = is_profit
+    state["last_closed_at"] = closed_at
+    state["last_signal_id"] = signal_id
+
+
+async def lock_states(db: AsyncSession, titles) -> Dict[str, dict]:
+    """批量平仓前锁住涉及的策略状态行（不存在的先插入空行），返回可修改的状态"""
+    titles = sorted(set(titles))
+    if not titles:
+        return {}
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    await db.execute(dialect.insert(StrategyState.__table__).on_conflict_do_nothing(),
+                     [empty_state(title) for title in titles])
+    table = StrategyState.__table__
+    rows = (await db.execute(select(table).where(table.c.title.in_(titles))
+                             .order_by(table.c.title).with_for_update())).mappings()
+    return {row["title"]: dict(row) for row in rows}
+
+
+async def save_states(db: AsyncSession, states: Dict[str, dict]):
+    """按主键批量写回 lock_states 返回并修改过的状态"""
+    if states:
+        await db.execute(update(StrategyState), list(states.values()))
+
+
+def accumulate_daily(daily: Dict[Tuple[date, str], dict], title: str, day: date,
+                     is_profit: Optional[bool], profit: Optional[float]):
+    """把一次平仓累加到 (日期, 策略) 的日汇总上"""
+    row = daily.get((day, title))
+    if row is None:
+        row = daily[(day, title)] = {"day": day, "title": title, "close_count": 0, "win_count": 0,
+                                     "lose_count": 0, "total_profit": 0.0}
+    row["close_count"] += 1
+    row["win_count"] += is_profit is True
+    row["lose_count"] += is_profit is not True
+    row["total_profit"] += profit or 0.0
+
+
+async def add_daily_stats(db: AsyncSession, daily: Dict[Tuple[date, str], dict]):
+    """在当前事务内把日汇总累加到 strategy_daily_stats（一条多行 upsert）
+
+    按 (日期, 策略) 排序写入：所有平仓路径都按 平仓记录 -> 策略状态（按策略名）-> 日汇总 的顺序加锁，
+    并发事务之间不会形成环形等待。
+    """
+    if not daily:
+        return
+    table = StrategyDailyStats.__table__
+    c = table.c
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[c.day, c.title],
+        set_={name: c[name] + stmt.excluded[name]
+              for name in ("close_count", "win_count", "lose_count", "total_profit")},
+    )
+    await db.execute(stmt, [daily[key] for key in sorted(daily)])
+
+
+async def get_state(db: AsyncSession, title: str) -> Optional[StrategyState]:
+    return await db.get(StrategyState, title)
+
+
+async def list_states(db: AsyncSession) -> List[StrategyState]:
+    return list(await db.scalars(select(StrategyState).order_by(StrategyState.title)))
+
+
+async def rebuild(db: AsyncSession) -> Dict[str, dict]:
+    """从 trading_signals 的已平仓记录按平仓时间重放，重建 strategy_state 和 strategy_daily_stats
+
+    同一事务内先清空再写入。
+    """
+    states: Dict[str, dict] = {}
+    daily: Dict[Tuple[date, str], dict] = {}
+    rows = await db.stream(select(
+        TradingSignalModel.id, TradingSignalModel.title, TradingSignalModel.is_profit,
+        TradingSignalModel.profit_percentage, TradingSignalModel.closed_at
+    ).where(
+        TradingSignalModel.is_close == True,
+        TradingSignalModel.title.isnot(None)
+    ).order_by(TradingSignalModel.closed_at, TradingSignalModel.id).execution_options(yield_per=10000))
+    async for row in rows:
+        state = states.get(row.title)
+        if state is None:
+            state = states[row.title] = empty_state(row.title)
+        apply_close(state, row.is_profit, row.profit_percentage, row.closed_at, row.id)
+        if row.closed_at is not None:
+            accumulate_daily(daily, row.title, row.closed_at.date(), row.is_profit, row.profit_percentage)
+    await db.execute(delete(StrategyState))
+    await db.execute(delete(StrategyDailyStats))
+    if states:
+        await db.execute(insert(StrategyState), list(states.values()))
+    if daily:
+        await db.execute(insert(StrategyDailyStats), list(daily.values()))
+    await db.commit()
+    logger.info(f"Rebuilt strategy_state for {len(states)} strategies")
+    return states
+
+
+async def backfill_if_needed(db: AsyncSession) -> bool:
+    """启动时检查：strategy_state 或 strategy_daily_stats 记录的平仓数与 trading_signals 不一致
+    （刚升级、表还是空的）时重建
+
+    PostgreSQL 上先以 EXCLUSIVE 锁住两张汇总表：多个 worker 同时启动时只有一个重建，
+    并发的平仓会等重建提交后再在其结果上累加；平仓先更新 trading_signals 再更新汇总表，
+    所以锁等待中的平仓不在重建读到的快照里，不会被计入两次。
+    """
+    if db.bind.dialect.name == "postgresql":
+        await db.execute(text("LOCK TABLE strategy_state, strategy_daily_stats IN EXCLUSIVE MODE"))
+    recorded = (await db.execute(select(func.coalesce(func.sum(StrategyState.trade_count), 0)))).scalar_one()
+    recorded_daily = (await db.execute(select(func.coalesce(func.sum(StrategyDailyStats.close_count), 0)))).scalar_one()
+    # 日汇总只统计有平仓时间的记录
+    closed, closed_dated = (await db.execute(select(
+        func.count(),
+        func.count(TradingSignalModel.closed_at)
+    ).where(
+        TradingSignalModel.is_close == True,
+        TradingSignalModel.title.isnot(None)
+    ))).one()
+    if recorded == closed and recorded_daily == closed_dated:
+        await db.commit()
+        return False
+    logger.info(f"strategy_state has {recorded} closes, strategy_daily_stats has {recorded_daily}, "
+                f"trading_signals has {closed} ({closed_dated} with closed_at); rebuilding")
+    await rebuild(db)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="策略状态表维护")
+    parser.add_argument("command", choices=["backfill"],
+                        help="backfill: 从 trading_signals 重建 strategy_state 和 strategy_daily_stats")
+    parser.parse_args()
+
+    from ..database import AsyncSessionLocal
+
+    async def backfill():
+        async with AsyncSessionLocal() as db:
+            return await rebuild(db)
+
+    states = asyncio.run(backfill())
+    print(f"strategy_state rebuilt for {len(states)} strategies")
+
+
+if __name__ == "__main__":
+    main()
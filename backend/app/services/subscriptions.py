@@ -0,0 +1,89 @@
+from typing import Any, Dict, Iterable, Iterator, List, Set
+
+# 通配频道：订阅所有交易对
+WILDCARD = "*"
+
+
+def normalize_symbol(symbol: str) -> str:
+    """统一交易对写法：btc / btcusdt / BTCUSDT -> BTCUSDT"""
+    symbol = symbol.strip().upper()
+    if symbol in (WILDCARD, "ALL"):
+        return WILDCARD
+    if symbol.endswith("USDT"):
+        symbol = symbol[:-4]
+    return f"{symbol}USDT"
+
+
+def parse_symbols(raw: str) -> List[str]:
+    """解析逗号分隔的交易对列表，例如 /api/ws/btc,eth"""
+    symbols = []
+    for part in raw.split(","):
+        if part.strip():
+            symbol = normalize_symbol(part)
+            if symbol not in symbols:
+                symbols.append(symbol)
+    return symbols
+
+
+class SubscriptionRegistry:
+    """按交易对索引的订阅表
+
+    - 每个交易对对应一个订阅者集合（用 dict 作为有序集合），订阅/退订 O(1)
+    - 反向索引记录每个订阅者订阅了哪些交易对，断开时只清理自己的条目
+    - 行情只会投递给该交易对的订阅者和通配频道的订阅者
+    """
+
+    def __init__(self):
+        self._by_symbol: Dict[str, Dict[Any, None]] = {}
+        self._by_subscriber: Dict[Any, Set[str]] = {}
+
+    def subscribe(self, subscriber: Any, symbol: str) -> str:
+        symbol = normalize_symbol(symbol)
+        self._by_symbol.setdefault(symbol, {})[subscriber] = None
+        self._by_subscriber.setdefault(subscriber, set()).add(symbol)
+        return symbol
+
+    def subscribe_many(self, subscriber: Any, symbols: Iterable[str]) -> List[str]:
+        return [self.subscribe(subscriber, symbol) for symbol in symbols]
+
+    def unsubscribe(self, subscriber: Any, symbol: str):
+        symbol = normalize_symbol(symbol)
+        subscribers = self._by_symbol.get(symbol)
+        if subscribers is not None:
+            subscribers.pop(subscriber, None)
+            if not subscribers:
+                del self._by_symbol[symbol]
+        symbols = self._by_subscriber.get(subscriber)
+        if symbols is not None:
+            symbols.discard(symbol)
+            if not symbols:
+                del self._by_subscriber[subscriber]
+
+    def unsubscribe_all(self, subscriber: Any):
+        for symbol in self._by_subscriber.pop(subscriber, ()):
+            subscribers = self._by_symbol.get(symbol)
+            if subscribers is not None:
+                subscribers.pop(subscriber, None)
+                if not subscribers:
+                    del self._by_symbol[symbol]
+
+    def subscribers(self, symbol: str) -> Iterator[Any]:
+        """某个交易对的订阅者（含通配订阅者，不重复），symbol 需已规范化"""
+        direct = self._by_symbol.get(symbol)
+        if direct:
+            yield from list(direct)
+        wildcard = self._by_symbol.get(WILDCARD)
+        if wildcard:
+            for subscriber in list(wildcard):
+                if direct is None or subscriber not in direct:
+                    yield subscriber
+
+    def symbols_of(self, subscriber: Any) -> Set[str]:
+        return set(self._by_subscriber.get(subscriber, ()))
+
+    def symbols(self) -> Set[str]:
+        """当前有订阅者的具体交易对（不含通配频道）"""
+        return {symbol for symbol in self._by_symbol if symbol != WILDCARD}
+
+    def count(self, symbol: str) -> int:
+        return len(self._by_symbol.get(normalize_symbol(symbol), ()))
@@ -0,0 +1,98 @@
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from ..config import settings
+
+
+class TickSlice:
+    """一段按时间顺序排列的行情，由环形缓冲区上的视图组成（最多两段，不复制数据）"""
+
+    def __init__(self, segments: List[Tuple[np.ndarray, np.ndarray]]):
+        self.segments = [(ts, price) for ts, price in segments if len(ts)]
+
+    def __len__(self) -> int:
+        return sum(len(ts) for ts, _ in self.segments)
+
+    def to_dict(self) -> dict:
+        ts, price = [], []
+        for ts_part, price_part in self.segments:
+            ts.extend(ts_part.tolist())
+            price.extend(price_part.tolist())
+        return {'ts': ts, 'price': price}
+
+
+class TickRingBuffer:
+    """单个交易对的定长环形缓冲区：毫秒时间戳 + 价格，预分配，内存占用固定"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.ts = np.zeros(capacity, dtype=np.int64)
+        self.price = np.zeros(capacity, dtype=np.float64)
+        self.head = 0  # 下一个写入位置
+        self.count = 0
+        self.total = 0  # 累计写入条数（含已被覆盖的），供增量落盘
+
+    def append(self, ts: int, price: float):
+        if self.count and ts < self.last_ts:
+            # 保证时间戳单调，二分查找才成立
+            ts = self.last_ts
+        i = self.head
+        self.ts[i] = ts
+        self.price[i] = price
+        self.head = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+        self.total += 1
+
+    @property
+    def last_ts(self) -> Optional[int]:
+        if not self.count:
+            return None
+        return int(self.ts[self.head - 1])
+
+    def _ranges(self) -> List[Tuple[int, int]]:
+        """按时间顺序的有效区间"""
+        if self.count < self.capacity:
+            return [(0, self.count)]
+        return [(self.head, self.capacity), (0, self.head)]
+
+    def since(self, since_ts: int = None, limit: int = None) -> TickSlice:
+        """时间戳 >= since_ts 的行情（最旧的在前）；不给 since_ts 时返回最近 limit 条"""
+        segments = []
+        if since_ts is None:
+            remaining = limit if limit is not None else self.count
+            for start, end in reversed(self._ranges()):
+                take = min(remaining, end - start)
+                if take > 0:
+                    segments.insert(0, (self.ts[end - take:end], self.price[end - take:end]))
+                    remaining -= take
+            return TickSlice(segments)
+
+        remaining = limit
+        for start, end in self._ranges():
+            ts = self.ts[start:end]
+            offset = int(np.searchsorted(ts, since_ts, side='left'))
+            stop = end - start
+            if remaining is not None:
+                stop = min(stop, offset + remaining)
+                remaining -= max(0, stop - offset)
+            segments.append((ts[offset:stop], self.price[start + offset:start + stop]))
+            if remaining is not None and remaining <= 0:
+                break
+        return TickSlice(segments)
+
+
+class TickStore:
+    """所有交易对的行情环形缓冲区"""
+
+    def __init__(self, capacity: int = None):
+        self.capacity = capacity or settings.TICK_BUFFER_CAPACITY
+        self.buffers: Dict[str, TickRingBuffer] = {}
+
+    def record(self, symbol: str, ts: int, price: float):
+        buffer = self.buffers.get(symbol)
+        if buffer is None:
+            buffer = self.buffers[symbol] = TickRingBuffer(self.capacity)
+        buffer.append(ts, price)
+
+    def get(self, symbol: str) -> Optional[TickRingBuffer]:
+        return self.buffers.get(symbol)
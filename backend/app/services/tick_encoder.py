@@ -0,0 +1,72 @@
+import json
+from typing import Callable, Dict
+
+# 协议格式
+WS_FRAME = "ws"    # /ws:            {"s": "BTCUSDT", "p": "52000.0"}
+API_FRAME = "api"  # /api/ws/{symbol}: {"symbol": "BTCUSDT", "price": 52000.0}
+KLINE_FRAME = "kline"  # /ws/candles:  {"e": "kline", "s": "BTCUSDT", "i": "1m", "k": {...}}
+PNL_FRAME = "pnl"  # /ws/pnl:          {"e": "pnl", "strategy": "alpha", "open": 3, "pnl": 1.25, ...}
+
+
+def _dumps(payload: dict) -> str:
+    # 与 starlette 的 send_json 使用相同的序列化参数
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+_ENCODERS: Dict[str, Callable[[str, float], str]] = {
+    WS_FRAME: lambda symbol, price: _dumps({'s': symbol, 'p': str(price)}),
+    API_FRAME: lambda symbol, price: _dumps({'symbol': symbol, 'price': price}),
+}
+
+
+class EncodedTick:
+    """一次价格更新：每种协议格式只编码一次，所有订阅者共享同一份文本"""
+
+    __slots__ = ('key', 'symbol', 'price', '_frames')
+
+    def __init__(self, symbol: str, price: float):
+        self.key = symbol
+        self.symbol = symbol
+        self.price = price
+        self._frames: Dict[str, str] = {}
+
+    def frame(self, variant: str) -> str:
+        text = self._frames.get(variant)
+        if text is None:
+            text = _ENCODERS[variant](self.symbol, self.price)
+            self._frames[variant] = text
+        return text
+
+
+class EncodedBar:
+    """一次 K 线收盘事件，和 EncodedTick 一样只编码一次"""
+
+    __slots__ = ('key', 'symbol', 'interval', 'candle', '_text')
+
+    def __init__(self, symbol: str, interval: str, candle):
+        self.key = symbol
+        self.symbol = symbol
+        self.interval = interval
+        self.candle = candle
+        self._text = None
+
+    def frame(self, variant: str) -> str:
+        if self._text is None:
+            self._text = _dumps({'e': 'kline', 's': self.symbol, 'i': self.interval, 'k': self.candle.to_dict()})
+        return self._text
+
+
+class EncodedPnl:
+    """一个策略的浮动盈亏汇总；按策略合并，慢客户端只收到每个策略的最新值"""
+
+    __slots__ = ('key', 'payload', '_text')
+
+    def __init__(self, strategy: str, payload: dict):
+        self.key = strategy
+        self.payload = payload
+        self._text = None
+
+    def frame(self, variant: str) -> str:
+        if self._text is None:
+            self._text = _dumps({'e': 'pnl', **self.payload})
+        return self._text
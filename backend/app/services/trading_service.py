@@ -1,152 +1,347 @@
-from sqlalchemy.orm import Session
-from datetime import datetime
-from typing import List
-from ..models.trading import TradingSignal as TradingSignalModel
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from ..models.trading import StrategyDailyStats, TradingSignal as TradingSignalModel
 from ..schemas import TradingSignal
 from .binance_ws import binance_ws
+from .position_index import OPEN_POSITION_COLUMNS, OpenPosition, position_index
+from .strategy_state import accumulate_daily, add_daily_stats, apply_close, lock_states, record_close, save_states
 import logging
 import pytz  # 添加时区支持
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, case, exists, insert, select, tuple_, update
+from sqlalchemy.orm import aliased
 
 logger = logging.getLogger(__name__)
 
+CHINA_TZ = pytz.timezone('Asia/Shanghai')
+
+
+def to_china_local(value: datetime) -> datetime:
+    """转换成不带时区的中国时间：时间列是 timestamp without time zone，保存的是中国本地时间
+
+    （asyncpg 不接受把带时区的值写入/比较不带时区的列）；不带时区的输入视为已经是中国时间。
+    旧版本按服务器时区写入的记录由迁移 7d2a4f1c6e83 换算成中国时间。
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(CHINA_TZ).replace(tzinfo=None)
+    return value
+
+
+def china_now() -> datetime:
+    return to_china_local(datetime.now(CHINA_TZ))
+
+
 class TradingService:
     @staticmethod
-    async def create_signal(db: Session, signal: TradingSignal) -> TradingSignalModel:
+    async def create_signal(db: AsyncSession, signal: TradingSignal,
+                            price: Optional[float] = None) -> TradingSignalModel:
+        """处理一条信号；price 不为空时直接作为成交价（例如止盈止损触发的 tick 价格），不再取当前价格"""
         try:
-            china_tz = pytz.timezone('Asia/Shanghai')
-            current_time = datetime.now(china_tz)
+            current_time = china_now()
 
             if signal.is_close == "1":
-                # 查找对应的开仓记录
-                open_signal = db.query(TradingSignalModel).filter(
-                    TradingSignalModel.trade_id == signal.trade_id,
-                    TradingSignalModel.is_close == False
-                ).first()
-                
-                if open_signal:
-                    # 获取当前价格作为平仓价格
-                    current_price = binance_ws.get_current_price(open_signal.currentcy)
-                    logger.info(f"平仓价格: {current_price} for {open_signal.currentcy}")
-                    
-                    # 更新开仓记录的状态为已平仓
-                    open_signal.is_close = True
-                    open_signal.closed_at = current_time
-                    open_signal.close_price = current_price
-                    
-                    # 计算获利百分比
-                    if open_signal.open_price and current_price:
-                        price_change = ((current_price - open_signal.open_price) / open_signal.open_price) * 100
-                        # 如果是做空，则收益取反
-                        if open_signal.side == 'sell':
-                            price_change = -price_change
-                        open_signal.profit_percentage = price_change
-                        open_signal.is_profit = price_change > 0
-                        logger.info(f"获利百分比: {price_change}%")
-
-                        # 更新连胜/连亏
-                        last_signal = db.query(TradingSignalModel).filter(
-                            TradingSignalModel.title == open_signal.title,
-                            TradingSignalModel.id != open_signal.id,
-                            TradingSignalModel.is_close == True
-                        ).order_by(TradingSignalModel.closed_at.desc()).first()
-
-                        if last_signal:
-                            if open_signal.is_profit:
-                                if last_signal.is_profit:
-                                    open_signal.win_streak = last_signal.win_streak + 1
-                                    open_signal.lose_streak = 0
-                                else:
-                                    open_signal.win_streak = 1
-                                    open_signal.lose_streak = 0
-                            else:
-                                if not last_signal.is_profit:
-                                    open_signal.lose_streak = last_signal.lose_streak + 1
-                                    open_signal.win_streak = 0
-                                else:
-                                    open_signal.lose_streak = 1
-                                    open_signal.win_streak = 0
-                        else:
-                            open_signal.win_streak = 1 if open_signal.is_profit else 0
-                            open_signal.lose_streak = 0 if open_signal.is_profit else 1
+                # 先查内存索引；未命中（尚未加载或由其它进程开仓）时回退到数据库
+                position = position_index.get_open(signal.trade_id)
+                if position is None:
+                    open_signal = (await db.execute(select(*OPEN_POSITION_COLUMNS).where(
+                        TradingSignalModel.trade_id == signal.trade_id,
+                        TradingSignalModel.is_close == False
+                    ).order_by(TradingSignalModel.id).limit(1))).first()
+                    if open_signal is None:
+                        return None
+                    position = OpenPosition.from_row(open_signal)
 
-                        logger.info(f"连胜: {open_signal.win_streak}, 连亏: {open_signal.lose_streak}")
+                # 获取当前价格作为平仓价格
+                current_price = price if price is not None else await binance_ws.wait_for_price(position.currentcy)
+                logger.info(f"平仓价格: {current_price} for {position.currentcy}")
 
-                    db.commit()
-                    db.refresh(open_signal)
-                    return open_signal
-                return None
+                # 更新开仓记录的状态为已平仓，并计算获利百分比
+                values = TradingService._close_values(position, current_price, current_time)
+
+                # 先用一条条件 UPDATE 平仓：条件里带上 is_close，已被其它进程平仓时不会重复平仓。
+                # 加锁顺序与批量路径相同：先平仓记录，再策略状态，最后日汇总
+                closed = (await db.execute(
+                    update(TradingSignalModel).where(
+                        TradingSignalModel.id == position.id,
+                        TradingSignalModel.is_close == False
+                    ).values(**values).returning(TradingSignalModel)
+                )).scalar_one_or_none()
+                if closed is None:
+                    logger.warning(f"Position {signal.trade_id} was already closed, retrying from database")
+                    await db.rollback()
+                    position_index.discard(signal.trade_id)
+                    return await TradingService.create_signal(db, signal, price)
+
+                # 确实由本次平仓后才更新策略状态（连胜/连亏、累计收益）和日汇总，与平仓在同一事务内
+                if position.title is not None:
+                    closed.win_streak, closed.lose_streak = await record_close(
+                        db, position.title, values.get('is_profit'), values.get('profit_percentage'),
+                        current_time, position.id)
+                    logger.info(f"连胜: {closed.win_streak}, 连亏: {closed.lose_streak}")
+                    daily = {}
+                    accumulate_daily(daily, position.title, current_time.date(), values.get('is_profit'),
+                                     values.get('profit_percentage'))
+                    await add_daily_stats(db, daily)
+
+                position_index.stage_close(db, position)
+                await db.commit()
+                return closed
 
             # 创建新的开仓记录
-            current_price = binance_ws.get_current_price(signal.currentcy)
+            current_price = price if price is not None else await binance_ws.wait_for_price(signal.currentcy)
             logger.info(f"开仓价格: {current_price} for {signal.currentcy}")
             
-            db_signal = TradingSignalModel(
-                trade_id=signal.trade_id,
-                title=signal.title,
-                currentcy=signal.currentcy,
-                zs_tp_trigger_px=float(signal.zs_tp_trigger_px) if signal.zs_tp_trigger_px else None,
-                zy_tp_trigger_px=[float(signal.zy_tp_trigger_px)] if signal.zy_tp_trigger_px else None,
-                lever=int(signal.lever) if signal.lever else None,
-                side=signal.side,
-                is_close=False,
-                created_at=current_time,
-                closed_at=None,
-                open_price=current_price,
-                close_price=None,
-                profit_percentage=None,
-                is_profit=None,
-                win_streak=0,
-                lose_streak=0
-            )
+            db_signal = TradingSignalModel(**TradingService._open_values(signal, current_price, current_time))
 
             db.add(db_signal)
-            db.commit()
-            db.refresh(db_signal)
+            await db.flush()
+            position_index.stage_open(db, OpenPosition.from_row(db_signal))
+            await db.commit()
+            await db.refresh(db_signal)
             return db_signal
             
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Error processing signal: {e}")
             raise
 
     @staticmethod
-    async def get_all_signals(db: Session) -> List[TradingSignalModel]:
-        """获取所有交易记录"""
+    def _open_values(signal: TradingSignal, current_price: Optional[float], current_time: datetime) -> dict:
+        """开仓记录的列值；信号里的数字字段格式不对时抛出 ValueError"""
+        return dict(
+            trade_id=signal.trade_id,
+            title=signal.title,
+            currentcy=signal.currentcy,
+            zs_tp_trigger_px=float(signal.zs_tp_trigger_px) if signal.zs_tp_trigger_px else None,
+            zy_tp_trigger_px=[float(signal.zy_tp_trigger_px)] if signal.zy_tp_trigger_px else None,
+            lever=int(signal.lever) if signal.lever else None,
+            side=signal.side,
+            is_close=False,
+            created_at=current_time,
+            closed_at=None,
+            open_price=current_price,
+            close_price=None,
+            profit_percentage=None,
+            is_profit=None,
+            win_streak=0,
+            lose_streak=0
+        )
+
+    @staticmethod
+    def _close_values(position: OpenPosition, current_price: Optional[float], current_time: datetime) -> dict:
+        """平仓要更新的列值（不含连胜/连亏）"""
+        values = {
+            'is_close': True,
+            'closed_at': current_time,
+            'close_price': current_price,
+        }
+        if position.open_price and current_price:
+            price_change = ((current_price - position.open_price) / position.open_price) * 100
+            # 如果是做空，则收益取反
+            if position.side == 'sell':
+                price_change = -price_change
+            values['profit_percentage'] = price_change
+            values['is_profit'] = price_change > 0
+            logger.info(f"获利百分比: {price_change}%")
+        return values
+
+    @staticmethod
+    async def _prices(symbols) -> Dict[str, Optional[float]]:
+        """并发获取一组交易对的新鲜价格"""
+        symbols = list(symbols)
+        prices = await asyncio.gather(*(binance_ws.wait_for_price(symbol) for symbol in symbols))
+        return dict(zip(symbols, prices))
+
+    @staticmethod
+    async def create_signals_batch(db: AsyncSession, signals: List[TradingSignal],
+                                   snapshots: Optional[List[Optional[Tuple[datetime, Dict[str, float]]]]] = None,
+                                   before_commit: Optional[Callable[[AsyncSession], Awaitable[None]]] = None
+                                   ) -> List[dict]:
+        """按顺序批量处理信号，全部在一个事务内提交
+
+        开仓合并成一条批量 INSERT，已有记录的平仓合并成一条按主键的批量 UPDATE，
+        同一批内先开后平的仓位直接以平仓后的状态插入。返回与输入一一对应的结果，
+        单条信号的数据错误只影响该条。
+
+        snapshots 与 signals 一一对应，是接收信号时记录的 (时间, {交易对: 价格})：
+        有快照时用快照里的时间和价格，没有的交易对才取当前价格。before_commit 在提交前
+        于同一事务内执行（例如推进写入检查点）。
+        """
         try:
-            # 直接获取所有记录并按时间倒序排序
-            signals = db.query(TradingSignalModel).order_by(
-                TradingSignalModel.created_at.desc()
-            ).all()
-            
-            # 打印日志以检查数据
-            signal_info = [{
-                'trade_id': s.trade_id,
-                'title': s.title,
-                'is_close': s.is_close
-            } for s in signals]
-            logger.info(f"Retrieved signals: {signal_info}")
-            
-            # 使用字典保存每个 trade_id 的最新记录
-            latest_signals = {}
-            for signal in signals:
-                if signal.trade_id not in latest_signals:
-                    latest_signals[signal.trade_id] = signal
-            
-            return list(latest_signals.values())
+            snapshots = snapshots or [None] * len(signals)
+
+            def snapshot_price(i: int, symbol: Optional[str]) -> Optional[float]:
+                return snapshots[i][1].get(symbol) if snapshots[i] is not None else None
+
+            closing = {signal.trade_id for signal in signals if signal.is_close == "1"}
+
+            # 价格在加锁之前获取：开仓用信号里的交易对，平仓先用内存索引里的交易对
+            symbols = set()
+            for i, signal in enumerate(signals):
+                if signal.is_close == "1":
+                    position = position_index.get_open(signal.trade_id)
+                    symbol = position.currentcy if position is not None else None
+                else:
+                    symbol = signal.currentcy
+                if symbol and snapshot_price(i, symbol) is None:
+                    symbols.add(symbol)
+            prices = await TradingService._prices(symbols)
+
+            # 一次查询并锁住本批要平仓的未平仓记录
+            existing: Dict[str, List[OpenPosition]] = {}
+            if closing:
+                rows = await db.execute(
+                    select(*OPEN_POSITION_COLUMNS).where(
+                        TradingSignalModel.trade_id.in_(closing),
+                        TradingSignalModel.is_close == False
+                    ).order_by(TradingSignalModel.id).with_for_update()
+                )
+                for row in rows:
+                    existing.setdefault(row.trade_id, []).append(OpenPosition.from_row(row))
+            missing = {p.currentcy for i, signal in enumerate(signals) if signal.is_close == "1"
+                       for p in existing.get(signal.trade_id, ())
+                       if p.currentcy and snapshot_price(i, p.currentcy) is None} - set(prices)
+            if missing:
+                prices.update(await TradingService._prices(missing))
+
+            titles = {p.title for ps in existing.values() for p in ps if p.title is not None}
+            titles |= {s.title for s in signals if s.is_close != "1" and s.trade_id in closing and s.title is not None}
+            states = await lock_states(db, titles)
+
+            results: List[dict] = []
+            new_rows: List[dict] = []  # 待插入的新记录（可能在本批内已平仓）
+            batch_open: Dict[str, List[dict]] = {}  # 本批开仓且尚未平仓的记录
+            closed_existing: List[Tuple[OpenPosition, dict]] = []
+            daily: Dict[Tuple[date, str], dict] = {}  # 本批平仓的日汇总
+            last_close: Dict[str, object] = {}  # 每个策略本批最后一次平仓的记录（id 或待插入的行）
+            for i, signal in enumerate(signals):
+                current_time = snapshots[i][0] if snapshots[i] is not None else china_now()
+                result = {'index': i, 'trade_id': signal.trade_id}
+                results.append(result)
+                try:
+                    if signal.is_close == "1":
+                        # 与逐条处理一致：先平数据库里已有的仓位，再平本批新开的仓位
+                        if existing.get(signal.trade_id):
+                            position = existing[signal.trade_id].pop(0)
+                            row = None
+                        elif batch_open.get(signal.trade_id):
+                            row = batch_open[signal.trade_id].pop(0)
+                            position = OpenPosition.from_values(row)
+                        else:
+                            result['status'] = 'not_found'
+                            continue
+                        price = snapshot_price(i, position.currentcy)
+                        if price is None:
+                            price = prices.get(position.currentcy)
+                        values = TradingService._close_values(position, price, current_time)
+                        if position.title is not None:
+                            state = states[position.title]
+                            apply_close(state, values.get('is_profit'), values.get('profit_percentage'),
+                                        current_time, None)
+                            values['win_streak'], values['lose_streak'] = state['win_streak'], state['lose_streak']
+                            last_close[position.title] = row if row is not None else position.id
+                            accumulate_daily(daily, position.title, current_time.date(), values.get('is_profit'),
+                                             values.get('profit_percentage'))
+                        if row is None:
+                            closed_existing.append((position, values))
+                            result['id'] = position.id
+                        else:
+                            row.update(values)
+                            result['row'] = row
+                        result.update(status='closed', price=values['close_price'],
+                                      profit_percentage=values.get('profit_percentage'),
+                                      win_streak=values.get('win_streak'), lose_streak=values.get('lose_streak'))
+                    else:
+                        price = snapshot_price(i, signal.currentcy)
+                        if price is None:
+                            price = prices.get(signal.currentcy)
+                        row = TradingService._open_values(signal, price, current_time)
+                        new_rows.append(row)
+                        batch_open.setdefault(signal.trade_id, []).append(row)
+                        result.update(status='opened', price=row['open_price'], row=row)
+                except (ValueError, TypeError) as e:
+                    result.update(status='error', detail=str(e))
+
+            # 批量写入：一条 INSERT（按参数顺序返回 id）、一条按主键的 UPDATE、一条策略状态 UPDATE、一条日汇总 upsert
+            if new_rows:
+                ids = (await db.scalars(
+                    insert(TradingSignalModel).returning(TradingSignalModel.id, sort_by_parameter_order=True),
+                    new_rows
+                )).all()
+                for row, row_id in zip(new_rows, ids):
+                    row['id'] = row_id
+            if closed_existing:
+                await db.execute(update(TradingSignalModel), [{'id': p.id, **values} for p, values in closed_existing])
+            for title, ref in last_close.items():
+                states[title]['last_signal_id'] = ref['id'] if isinstance(ref, dict) else ref
+            await save_states(db, states)
+            await add_daily_stats(db, daily)
+
+            for row in new_rows:
+                if not row['is_close']:
+                    position_index.stage_open(db, OpenPosition.from_values(row))
+            for position, _ in closed_existing:
+                position_index.stage_close(db, position)
+            if before_commit is not None:
+                await before_commit(db)
+            await db.commit()
+
+            for result in results:
+                row = result.pop('row', None)
+                if row is not None:
+                    result['id'] = row['id']
+            return results
+
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error processing signal batch: {e}")
+            raise
+
+    @staticmethod
+    async def get_latest_signals(db: AsyncSession, limit: Optional[int], after: Optional[int] = None,
+                                 open_only: bool = False, title: Optional[str] = None
+                                 ) -> Tuple[List[TradingSignalModel], Optional[int]]:
+        """每个 trade_id 的最新一条记录，按 id 倒序分页
+
+        after 为上一页返回的游标（上一页最后一条的 id）；返回 (本页记录, 下一页游标)，
+        没有更多数据时游标为 None；limit 为 None 时不分页。"最新"由不存在同 trade_id 且 id 更大的记录来判断，
+        沿主键倒序扫描并对每行做一次索引探测，单页的代价只与 limit 有关，与表的大小无关。
+        """
+        try:
+            newer = aliased(TradingSignalModel)
+            stmt = select(TradingSignalModel).where(
+                ~exists().where(
+                    newer.trade_id == TradingSignalModel.trade_id,
+                    newer.id > TradingSignalModel.id
+                )
+            )
+            if after is not None:
+                stmt = stmt.where(TradingSignalModel.id < after)
+            if open_only:
+                stmt = stmt.where(TradingSignalModel.is_close == False)
+            if title is not None:
+                stmt = stmt.where(TradingSignalModel.title == title)
+            stmt = stmt.order_by(TradingSignalModel.id.desc())
+            if limit is None:
+                return list((await db.scalars(stmt)).all()), None
+            # 多取一条用来判断是否还有下一页
+            signals = (await db.scalars(stmt.limit(limit + 1))).all()
+            next_cursor = signals[limit - 1].id if len(signals) > limit else None
+            return list(signals[:limit]), next_cursor
         except Exception as e:
             logger.error(f"Error getting signals: {e}")
             raise
 
     @staticmethod
-    async def get_strategy_history(db: Session, title: str) -> List[TradingSignalModel]:
+    async def get_strategy_history(db: AsyncSession, title: str) -> List[TradingSignalModel]:
         """获取单个策略的历史交易记录"""
         try:
             # 获取该策略的所有已平仓记录，按时间倒序排序
-            signals = db.query(TradingSignalModel).filter(
+            signals = (await db.scalars(select(TradingSignalModel).where(
                 TradingSignalModel.title == title,
                 TradingSignalModel.is_close == True
-            ).order_by(TradingSignalModel.closed_at.desc()).all()
+            ).order_by(TradingSignalModel.closed_at.desc()))).all()
             
             return signals
         except Exception as e:
@@ -154,71 +349,133 @@ class TradingService:
             raise
 
     @staticmethod
-    async def get_closed_signals_by_timerange(db: Session, start_time: datetime, end_time: datetime) -> List[dict]:
-        """获取指定时间段内的平仓记录统计"""
-        try:
-            # 确保使用中国时区
-            china_tz = pytz.timezone('Asia/Shanghai')
-            if not start_time.tzinfo:
-                start_time = china_tz.localize(start_time)
-            if not end_time.tzinfo:
-                end_time = china_tz.localize(end_time)
+    async def get_closed_signals_by_timerange(db: AsyncSession, start_time: datetime, end_time: datetime,
+                                              title: Optional[str] = None, include_records: bool = False,
+                                              records_limit: int = 50, records_after: Optional[str] = None
+                                              ) -> List[dict]:
+        """获取指定时间段内（含两端）按策略汇总的平仓统计，按平仓次数降序
 
+        整天的部分读 strategy_daily_stats（每个策略每天一行），首尾不足一天的部分在
+        trading_signals 上用 GROUP BY 汇总，都在数据库里完成。include_records 时每个策略
+        附带最近的 records_limit 条平仓明细和下一页游标 records_next（翻页时配合 title 使用）。
+        """
+        try:
+            start_time, end_time = to_china_local(start_time), to_china_local(end_time)
             logger.info(f"Searching for closed signals between {start_time} and {end_time}")
-            
-            # 获取时间段内的所有平仓记录，并按策略名称分组
-            signals = db.query(TradingSignalModel).filter(
-                TradingSignalModel.is_close == True,
-                TradingSignalModel.closed_at >= start_time,
-                TradingSignalModel.closed_at <= end_time,
-                TradingSignalModel.title.isnot(None)  # 确保有策略名称
-            ).order_by(
-                TradingSignalModel.title,
-                TradingSignalModel.closed_at.desc()
-            ).all()
-
-            logger.info(f"Found {len(signals)} signals between {start_time} and {end_time}")
-            
-            # 按策略名称分组统计
-            strategy_stats = {}
-            for signal in signals:
-                if not signal.title:  # 跳过没有策略名称的记录
+
+            # [first_day, last_day] 是被时间段完整覆盖的日期
+            first_day = start_time.date() if start_time.time() == datetime.min.time() \
+                else start_time.date() + timedelta(days=1)
+            last_day = (end_time + timedelta(microseconds=1)).date() - timedelta(days=1)
+            if first_day <= last_day:
+                edges = [(start_time, datetime.combine(first_day, datetime.min.time()), False),
+                         (datetime.combine(last_day + timedelta(days=1), datetime.min.time()), end_time, True)]
+            else:
+                edges = [(start_time, end_time, True)]
+
+            strategy_stats: Dict[str, dict] = {}
+
+            def merge(rows):
+                for row in rows:
+                    stats = strategy_stats.setdefault(row.title, {
+                        'title': row.title, 'close_count': 0, 'win_count': 0, 'lose_count': 0, 'total_profit': 0.0})
+                    stats['close_count'] += int(row.close_count)
+                    stats['win_count'] += int(row.win_count)
+                    stats['lose_count'] += int(row.close_count) - int(row.win_count)
+                    stats['total_profit'] += float(row.total_profit or 0.0)
+
+            if first_day <= last_day:
+                daily = StrategyDailyStats
+                stmt = select(
+                    daily.title,
+                    func.sum(daily.close_count).label('close_count'),
+                    func.sum(daily.win_count).label('win_count'),
+                    func.sum(daily.total_profit).label('total_profit')
+                ).where(daily.day.between(first_day, last_day))
+                if title is not None:
+                    stmt = stmt.where(daily.title == title)
+                merge(await db.execute(stmt.group_by(daily.title)))
+
+            for low, high, inclusive in edges:
+                if high < low or (high == low and not inclusive):
                     continue
-                
-                if signal.title not in strategy_stats:
-                    strategy_stats[signal.title] = {
-                        'title': signal.title,
-                        'close_count': 0,
-                        'win_count': 0,
-                        'lose_count': 0,
-                        'total_profit': 0,
-                        'records': []
-                    }
-                
-                stats = strategy_stats[signal.title]
-                stats['close_count'] += 1
-                if signal.is_profit:
-                    stats['win_count'] += 1
-                else:
-                    stats['lose_count'] += 1
-                stats['total_profit'] += signal.profit_percentage or 0
-                stats['records'].append({
-                    'closed_at': signal.closed_at,
-                    'currentcy': signal.currentcy,
-                    'profit_percentage': signal.profit_percentage,
-                    'open_price': signal.open_price,
-                    'close_price': signal.close_price
-                })
+                stmt = select(
+                    TradingSignalModel.title,
+                    func.count().label('close_count'),
+                    func.sum(case((TradingSignalModel.is_profit == True, 1), else_=0)).label('win_count'),
+                    func.sum(TradingSignalModel.profit_percentage).label('total_profit')
+                ).where(
+                    *TradingService._closed_between(low, high, inclusive, title)
+                ).group_by(TradingSignalModel.title)
+                merge(await db.execute(stmt))
 
-            # 按平仓次数降序排序
-            sorted_stats = sorted(
-                strategy_stats.values(),
-                key=lambda x: x['close_count'],
-                reverse=True
-            )
+            logger.info(f"Found {sum(s['close_count'] for s in strategy_stats.values())} signals "
+                        f"between {start_time} and {end_time}")
+
+            if include_records:
+                for stats in strategy_stats.values():
+                    stats['records'], stats['records_next'] = [], None
+                await TradingService._attach_records(db, strategy_stats, start_time, end_time, title,
+                                                     records_limit, records_after)
 
-            return sorted_stats
+            # 按平仓次数降序排序
+            return sorted(strategy_stats.values(), key=lambda x: (-x['close_count'], x['title']))
 
         except Exception as e:
             logger.error(f"Error getting closed signals by timerange: {e}")
-            raise 
\ No newline at end of file
+            raise
+
+    @staticmethod
+    def _closed_between(low: datetime, high: datetime, inclusive: bool, title: Optional[str]) -> list:
+        conditions = [
+            TradingSignalModel.is_close == True,
+            TradingSignalModel.closed_at >= low,
+            TradingSignalModel.closed_at <= high if inclusive else TradingSignalModel.closed_at < high,
+            TradingSignalModel.title.isnot(None),  # 确保有策略名称
+        ]
+        if title is not None:
+            conditions.append(TradingSignalModel.title == title)
+        return conditions
+
+    @staticmethod
+    def records_cursor(closed_at: datetime, signal_id: int) -> str:
+        return f"{closed_at.isoformat()}|{signal_id}"
+
+    @staticmethod
+    async def _attach_records(db: AsyncSession, strategy_stats: Dict[str, dict], start_time: datetime,
+                              end_time: datetime, title: Optional[str], limit: int, after: Optional[str]):
+        """每个策略按平仓时间倒序取 limit 条明细（窗口函数在数据库里截断），多取一条判断是否有下一页"""
+        conditions = TradingService._closed_between(start_time, end_time, True, title)
+        if after is not None:
+            if title is None:
+                raise ValueError("records_after requires a strategy")
+            closed_at, _, signal_id = after.rpartition('|')
+            conditions.append(tuple_(TradingSignalModel.closed_at, TradingSignalModel.id)
+                              < (datetime.fromisoformat(closed_at), int(signal_id)))
+        rank = func.row_number().over(
+            partition_by=TradingSignalModel.title,
+            order_by=(TradingSignalModel.closed_at.desc(), TradingSignalModel.id.desc())
+        ).label('rank')
+        ranked = select(
+            TradingSignalModel.id, TradingSignalModel.title, TradingSignalModel.closed_at,
+            TradingSignalModel.currentcy, TradingSignalModel.profit_percentage,
+            TradingSignalModel.open_price, TradingSignalModel.close_price, rank
+        ).where(*conditions).subquery()
+        rows = await db.execute(
+            select(ranked).where(ranked.c.rank <= limit + 1).order_by(ranked.c.title, ranked.c.rank))
+        for row in rows:
+            stats = strategy_stats.get(row.title)
+            if stats is None:
+                continue
+            if row.rank > limit:
+                last = stats['records'][-1]
+                stats['records_next'] = TradingService.records_cursor(last['closed_at'], last['id'])
+                continue
+            stats['records'].append({
+                'id': row.id,
+                'closed_at': row.closed_at,
+                'currentcy': row.currentcy,
+                'profit_percentage': row.profit_percentage,
+                'open_price': row.open_price,
+                'close_price': row.close_price
+            })
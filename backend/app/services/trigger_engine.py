@@ -0,0 +1,181 @@
+import asyncio
+import heapq
+from typing import Dict, List, Optional, Set, Tuple
+from ..schemas import TradingSignal
+from .binance_ws import binance_ws
+from .monitor_service import MonitorService
+from .position_index import OpenPosition, position_index
+from .signal_lanes import signal_lanes
+from .subscriptions import WILDCARD, normalize_symbol
+from ..utils.logger import setup_logger
+
+logger = setup_logger("trigger_engine")
+
+STOP_LOSS = "stop_loss"
+TAKE_PROFIT = "take_profit"
+
+# 一笔触发：(trade_id, 开仓记录 id, 类型, 触发价)
+Trigger = Tuple[str, int, str, float]
+
+
+class TriggerBook:
+    """一个交易对的触发价：按方向分成两个堆
+
+    falling 是价格跌到触发价时触发的（做多止损、做空止盈），按触发价从高到低；
+    rising 是价格涨到触发价时触发的（做多止盈、做空止损），按触发价从低到高。
+    每个 tick 只看堆顶，取出已被穿越的 k 条，代价 O(k log n)，没有触发时为 O(1)。
+    已平仓的条目不立即删除，取出时按 live 核对后丢弃，过期条目过多时整体重建。
+    """
+
+    def __init__(self):
+        self.falling: List[Tuple[float, int, str, str]] = []  # (-触发价, id, trade_id, 类型)
+        self.rising: List[Tuple[float, int, str, str]] = []  # (触发价, id, trade_id, 类型)
+        self.live: Dict[str, int] = {}  # trade_id -> 仍在监控的开仓记录 id
+        self.stale = 0
+
+    def __len__(self) -> int:
+        return len(self.falling) + len(self.rising)
+
+    def add(self, position: OpenPosition):
+        self.live[position.trade_id] = position.id
+        short = position.side == "sell"
+        if position.stop_loss is not None:
+            self._push(position, STOP_LOSS, position.stop_loss, rising=short)
+        if position.take_profit is not None:
+            self._push(position, TAKE_PROFIT, position.take_profit, rising=not short)
+
+    def _push(self, position: OpenPosition, kind: str, level: float, rising: bool):
+        if rising:
+            heapq.heappush(self.rising, (level, position.id, position.trade_id, kind))
+        else:
+            heapq.heappush(self.falling, (-level, position.id, position.trade_id, kind))
+
+    def remove(self, trade_id: str):
+        if self.live.pop(trade_id, None) is not None:
+            self.stale += 2
+            if self.stale > 64 and self.stale > len(self) // 2:
+                self._compact()
+
+    def _compact(self):
+        self.falling = [entry for entry in self.falling if self.live.get(entry[2]) == entry[1]]
+        self.rising = [entry for entry in self.rising if self.live.get(entry[2]) == entry[1]]
+        heapq.heapify(self.falling)
+        heapq.heapify(self.rising)
+        self.stale = 0
+
+    def crossed(self, price: float) -> List[Trigger]:
+        """取出被 price 穿越的触发价；同一仓位只触发一次"""
+        fired: List[Trigger] = []
+        while self.falling and -self.falling[0][0] >= price:
+            level, position_id, trade_id, kind = heapq.heappop(self.falling)
+            self._fire(fired, trade_id, position_id, kind, -level)
+        while self.rising and self.rising[0][0] <= price:
+            level, position_id, trade_id, kind = heapq.heappop(self.rising)
+            self._fire(fired, trade_id, position_id, kind, level)
+        return fired
+
+    def _fire(self, fired: List[Trigger], trade_id: str, position_id: int, kind: str, level: float):
+        if self.live.get(trade_id) != position_id:
+            self.stale = max(self.stale - 1, 0)
+            return
+        del self.live[trade_id]
+        self.stale += 1  # 同一仓位在另一个堆里的条目
+        fired.append((trade_id, position_id, kind, level))
+
+
+class TriggerEngine:
+    """行情驱动的止盈止损
+
+    跟随未平仓索引维护每个交易对的 TriggerBook；每个 tick 找出被穿越的触发价，
+    以该 tick 的价格通过正常的平仓路径（按 trade_id 的处理通道）平仓。
+    多个 worker 时每个 worker 的索引都通过 position_index.sync 拉取其它 worker 的开平仓
+    （延迟约 POSITION_INDEX_SYNC_INTERVAL 秒），所有 worker 都维护同样的触发价，但只有连接上游的
+    worker 触发平仓；接管行情的 worker 立即开始触发。平仓 UPDATE 的 is_close 条件保证只平一次。
+    """
+
+    def __init__(self):
+        self.books: Dict[str, TriggerBook] = {}
+        self.closing: Set[asyncio.Task] = set()
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return
+        position_index.add_listener(self._on_position)
+        binance_ws.add_price_callback(WILDCARD, self.on_tick)
+        self.running = True
+        self.rebuild()
+
+    def stop(self):
+        if not self.running:
+            return
+        binance_ws.remove_price_callback(WILDCARD, self.on_tick)
+        position_index.listeners.remove(self._on_position)
+        self.running = False
+
+    def rebuild(self):
+        books: Dict[str, TriggerBook] = {}
+        for position in position_index.positions.values():
+            if position.currentcy and (position.stop_loss is not None or position.take_profit is not None):
+                symbol = normalize_symbol(position.currentcy)
+                book = books.get(symbol)
+                if book is None:
+                    book = books[symbol] = TriggerBook()
+                book.add(position)
+        self.books = books
+        self._update_gauge()
+
+    def _on_position(self, event: str, position: Optional[OpenPosition]):
+        if event == "load":
+            self.rebuild()
+            return
+        if not position.currentcy or (position.stop_loss is None and position.take_profit is None):
+            return
+        symbol = normalize_symbol(position.currentcy)
+        if event == "open":
+            book = self.books.get(symbol)
+            if book is None:
+                book = self.books[symbol] = TriggerBook()
+            book.add(position)
+        else:
+            book = self.books.get(symbol)
+            if book is not None:
+                book.remove(position.trade_id)
+        self._update_gauge()
+
+    def _update_gauge(self):
+        MonitorService.triggers_armed.set(sum(len(book.live) for book in self.books.values()))
+
+    def on_tick(self, symbol: str, price: float):
+        """行情路径上同步执行：只找出触发的仓位，平仓放到后台任务"""
+        book = self.books.get(symbol)
+        if book is None or not binance_ws.owns_feed:
+            return
+        fired = book.crossed(price)
+        if not fired:
+            return
+        for trade_id, position_id, kind, level in fired:
+            MonitorService.triggers_fired_total.labels(kind=kind).inc()
+            logger.info(f"{kind} triggered for {trade_id} at {price} (level {level})")
+            task = asyncio.create_task(self._close(symbol, trade_id, position_id, price))
+            self.closing.add(task)
+            task.add_done_callback(self.closing.discard)
+        self._update_gauge()
+
+    async def _close(self, symbol: str, trade_id: str, position_id: int, price: float):
+        position = position_index.get_open(trade_id)
+        if position is not None and position.id != position_id:
+            return  # 触发的仓位已平仓，同一 trade_id 又开了新仓
+        try:
+            await signal_lanes.submit(TradingSignal(is_close="1", trade_id=trade_id), price=price)
+        except Exception as e:
+            logger.error(f"Triggered close of {trade_id} failed: {e}")
+            # 仓位仍未平仓时重新挂上触发价，下一个穿越的 tick 再试
+            position = position_index.get_open(trade_id)
+            book = self.books.get(symbol)
+            if position is not None and position.id == position_id and book is not None:
+                book.add(position)
+
+
+# 创建单例实例
+trigger_engine = TriggerEngine()
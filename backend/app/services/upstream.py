@@ -0,0 +1,280 @@
+import asyncio
+import json
+from typing import Callable, Dict, Iterable, List, Optional, Set
+import websockets
+from ..config import settings
+from ..utils.logger import setup_logger
+from .monitor_service import MonitorService
+
+logger = setup_logger("upstream")
+
+
+def unwrap_stream_message(data: dict) -> Optional[dict]:
+    """combined stream 消息解包为行情数据；订阅应答返回 None"""
+    if 'id' in data and 'result' in data:
+        return None
+    if 'stream' in data:
+        return data.get('data', data)
+    return data
+
+
+class UpstreamShard:
+    """一条上游 combined-stream 连接，负责其中一部分 stream"""
+
+    def __init__(self, manager: "UpstreamConnectionManager", index: int):
+        self.manager = manager
+        self.index = index
+        self.streams: Set[str] = set()
+        self.ws = None
+        self.connected_at: Optional[float] = None
+        self.ready = asyncio.Event()  # 首次订阅已被确认或已收到行情
+        self.retired = False
+        self.task: Optional[asyncio.Task] = None
+        self._initial_id: Optional[int] = None
+
+    @property
+    def free(self) -> int:
+        return self.manager.max_streams - len(self.streams)
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self.retired and not self.manager.stopped:
+            try:
+                async with websockets.connect(self.manager.url) as ws:
+                    self.ws = ws
+                    self.connected_at = loop.time()
+                    MonitorService.upstream_connections.inc()
+                    logger.info(f"Shard {self.index} connected with {len(self.streams)} streams")
+                    if self.streams:
+                        self._initial_id = await self.send("SUBSCRIBE", sorted(self.streams))
+                    else:
+                        self.ready.set()
+                    async for raw in ws:
+                        self.manager.dispatch(self, raw)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Shard {self.index} connection error: {e}")
+            finally:
+                if self.ws is not None:
+                    self.ws = None
+                    MonitorService.upstream_connections.dec()
+                self.ready.clear()
+            if self.retired or self.manager.stopped:
+                break
+            MonitorService.upstream_reconnects_total.inc()
+            await self.manager.on_shard_lost(self)
+            await asyncio.sleep(self.manager.reconnect_delay)
+
+    async def send(self, method: str, params: List[str]) -> Optional[int]:
+        """发送一个 SUBSCRIBE / UNSUBSCRIBE 帧，连接不可用时由重连后的全量订阅兜底"""
+        ws = self.ws
+        if ws is None or not params:
+            return None
+        request_id = self.manager.next_id()
+        try:
+            await ws.send(json.dumps({"method": method, "params": params, "id": request_id}))
+            MonitorService.upstream_subscribe_frames_total.inc()
+            logger.info(f"Shard {self.index} {method} {len(params)} streams (id={request_id})")
+        except Exception as e:
+            logger.error(f"Shard {self.index} failed to send {method}: {e}")
+            return None
+        return request_id
+
+    def on_ack(self, request_id: int):
+        if request_id == self._initial_id:
+            self.ready.set()
+
+    async def close(self):
+        self.retired = True
+        ws = self.ws
+        if ws is not None:
+            await ws.close()
+        if self.task is not None:
+            self.task.cancel()
+
+
+class UpstreamConnectionManager:
+    """把 stream 分片到多条上游连接
+
+    - 每条连接的 stream 数不超过交易所的单连接上限
+    - 短时间窗口内新增的订阅合并为每个分片一个 SUBSCRIBE 帧，每帧使用唯一 id
+    - 某条连接断开时，它的 stream 立即迁移到其它在线分片；到期轮换时先建新连接再关旧连接
+    - 迁移/轮换期间两条连接可能同时推送，按 stream 的事件时间 E 去重
+    """
+
+    def __init__(self, url: str = None, on_message: Callable = None, max_streams: int = None,
+                 min_connections: int = None, batch_window: float = None, reconnect_delay: float = None,
+                 max_connection_age: float = None):
+        self.url = url or settings.BINANCE_STREAM_URL
+        self.on_message = on_message
+        self.max_streams = max_streams or settings.UPSTREAM_MAX_STREAMS_PER_CONNECTION
+        self.min_connections = min_connections or settings.UPSTREAM_MIN_CONNECTIONS
+        self.batch_window = settings.UPSTREAM_SUBSCRIBE_BATCH_WINDOW if batch_window is None else batch_window
+        self.reconnect_delay = settings.UPSTREAM_RECONNECT_DELAY if reconnect_delay is None else reconnect_delay
+        self.max_connection_age = max_connection_age or settings.UPSTREAM_MAX_CONNECTION_AGE
+        self.shards: List[UpstreamShard] = []
+        self.owner: Dict[str, UpstreamShard] = {}
+        self.stopped = False
+        self._pending: List[str] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_event: Dict[str, int] = {}
+        self._next_id = 0
+        self._next_index = 0
+        self._running = False
+        self._stop_event: Optional[asyncio.Event] = None
+
+    def next_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    async def run(self, streams: Iterable[str]):
+        """启动所有分片并一直运行到 stop()"""
+        self.stopped = False
+        self._stop_event = asyncio.Event()
+        for _ in range(self.min_connections):
+            self._new_shard()
+        self._assign(streams)
+        for shard in self.shards:
+            shard.start()
+        self._running = True
+        maintenance = asyncio.create_task(self._maintain())
+        try:
+            await self._stop_event.wait()
+        finally:
+            self._running = False
+            maintenance.cancel()
+
+    async def stop(self):
+        self.stopped = True
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        for shard in list(self.shards):
+            await shard.close()
+        self.shards.clear()
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    def subscribe(self, streams: Iterable[str]):
+        """登记新订阅，窗口结束后批量下发"""
+        for stream in streams:
+            if stream not in self.owner and stream not in self._pending:
+                self._pending.append(stream)
+        if self._pending and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.batch_window)
+        finally:
+            self._flush_task = None
+        streams, self._pending = self._pending, []
+        await self._send_grouped("SUBSCRIBE", self._assign(streams))
+
+    def _new_shard(self) -> UpstreamShard:
+        shard = UpstreamShard(self, self._next_index)
+        self._next_index += 1
+        self.shards.append(shard)
+        return shard
+
+    def _assign(self, streams: Iterable[str], exclude: UpstreamShard = None) -> Dict[UpstreamShard, List[str]]:
+        """把 stream 分配到负载最低且有余量的分片，必要时新建分片"""
+        assigned: Dict[UpstreamShard, List[str]] = {}
+        for stream in streams:
+            if stream in self.owner:
+                continue
+            candidates = [s for s in self.shards if s is not exclude and not s.retired and s.free > 0]
+            if exclude is not None:
+                # 迁移时只考虑在线分片，否则留在原分片等待重连
+                candidates = [s for s in candidates if s.ws is not None]
+                if not candidates:
+                    break
+            if candidates:
+                shard = min(candidates, key=lambda s: len(s.streams))
+            else:
+                shard = self._new_shard()
+                if self._running:
+                    shard.start()
+            shard.streams.add(stream)
+            self.owner[stream] = shard
+            assigned.setdefault(shard, []).append(stream)
+        MonitorService.upstream_streams.set(len(self.owner))
+        return assigned
+
+    async def _send_grouped(self, method: str, grouped: Dict[UpstreamShard, List[str]]):
+        await asyncio.gather(*(shard.send(method, streams) for shard, streams in grouped.items()))
+
+    async def on_shard_lost(self, shard: UpstreamShard):
+        """连接断开：把它的 stream 迁到其它在线分片，放不下的留待重连后重新订阅"""
+        movable = sorted(shard.streams)
+        for stream in movable:
+            del self.owner[stream]
+        shard.streams.clear()
+        grouped = self._assign(movable, exclude=shard)
+        for stream in movable:
+            if stream not in self.owner:
+                shard.streams.add(stream)
+                self.owner[stream] = shard
+        moved = sum(len(v) for v in grouped.values())
+        if moved:
+            logger.info(f"Moved {moved} streams off shard {shard.index}")
+        await self._send_grouped("SUBSCRIBE", grouped)
+
+    async def rotate(self, shard: UpstreamShard, timeout: float = 10):
+        """先建新连接并确认订阅，再关闭旧连接，期间不丢行情"""
+        replacement = self._new_shard()
+        for stream in shard.streams:
+            self.owner[stream] = replacement
+        replacement.streams = set(shard.streams)
+        replacement.start()
+        try:
+            await asyncio.wait_for(replacement.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Replacement for shard {shard.index} not ready, closing old connection anyway")
+        shard.streams.clear()
+        if shard in self.shards:
+            self.shards.remove(shard)
+        await shard.close()
+        logger.info(f"Rotated shard {shard.index} to shard {replacement.index}")
+
+    async def _maintain(self):
+        loop = asyncio.get_running_loop()
+        while not self.stopped:
+            await asyncio.sleep(min(60, self.max_connection_age / 4))
+            for shard in list(self.shards):
+                if shard.connected_at is not None and shard.ws is not None \
+                        and loop.time() - shard.connected_at > self.max_connection_age:
+                    await self.rotate(shard)
+
+    def dispatch(self, shard: UpstreamShard, raw):
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            logger.warning(f"Shard {shard.index} received non-JSON message")
+            return
+        payload = unwrap_stream_message(data)
+        if payload is None:
+            shard.on_ack(data['id'])
+            return
+        shard.ready.set()
+        stream = data.get('stream')
+        event_time = payload.get('E') if isinstance(payload, dict) else None
+        if stream is not None and event_time is not None:
+            last = self._last_event.get(stream)
+            if last is not None and event_time <= last:
+                MonitorService.upstream_duplicates_total.inc()
+                return
+            self._last_event[stream] = event_time
+        if self.on_message is not None:
+            self.on_message(raw, payload)
+
+    def stats(self) -> dict:
+        return {
+            'connections': sum(1 for s in self.shards if s.ws is not None),
+            'shards': [{'index': s.index, 'streams': len(s.streams), 'connected': s.ws is not None}
+                       for s in self.shards],
+            'streams': len(self.owner),
+        }
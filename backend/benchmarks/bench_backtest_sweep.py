@@ -0,0 +1,46 @@
+"""回测参数扫描的吞吐量基准
+
+一年的 1 分钟 K 线（约 52 万根），扫描均线周期 × 杠杆 × 止损距离的网格，
+对比 1 个工作进程和逐步增加到 CPU 核数时每秒完成的组合数。
+行情数组以内存映射文件共享，任务只传参数，进程数增加时吞吐量应接近线性增长。
+
+运行: python -m benchmarks.bench_backtest_sweep  （在 backend 目录下）
+"""
+import os
+import time
+import numpy as np
+from app.services.backtest_service import PriceSeries
+from app.services.backtest_sweep import Sweep, parameter_grid
+
+BARS = 365 * 24 * 60
+GRID = {"fast": [5, 10, 20, 40], "slow": [60, 120, 240], "lever": [1, 2, 5], "stop": [None, 0.005, 0.01, 0.02]}
+
+
+def make_series() -> PriceSeries:
+    rng = np.random.default_rng(7)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.001, BARS)))
+    open_ = np.concatenate(([100.0], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.0005, BARS)) * close
+    return PriceSeries(1_700_000_000_000 + np.arange(BARS, dtype=np.int64) * 60_000, close, open_,
+                       np.maximum(open_, close) + spread, np.minimum(open_, close) - spread)
+
+
+def main():
+    series = make_series()
+    combos = len(parameter_grid(GRID))
+    cores = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+    print(f"{combos} combinations over {BARS} bars, {cores} CPU(s)")
+    baseline = None
+    for workers in counts:
+        with Sweep(series, workers) as sweep:
+            started = time.perf_counter()
+            count = sum(1 for _ in sweep.results(GRID))
+            elapsed = time.perf_counter() - started
+        rate = count / elapsed
+        baseline = baseline or rate
+        print(f"workers={workers:<3} {elapsed:7.2f}s  {rate:7.1f} combos/s  speedup {rate / baseline:4.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""浮动盈亏每个 tick 的计算开销基准
+
+N 个未平仓分布在若干交易对和 50 个策略上，对比：
+- scalar: 逐个仓位计算盈亏并累加到策略汇总（客户端或旧写法的做法）
+- vector: PnlEngine.on_tick，该交易对的仓位一次向量运算
+
+运行: python -m benchmarks.bench_pnl_engine  （在 backend 目录下）
+"""
+import random
+import time
+from app.services.pnl_engine import PnlEngine
+from app.services.position_index import OpenPosition, position_index
+
+TICKS = 2000
+STRATEGIES = 50
+
+
+def make_positions(count: int, symbols: int):
+    rng = random.Random(1)
+    return {
+        f"t{i}": OpenPosition(i, f"t{i}", f"s{i % STRATEGIES}", f"B{i % symbols}USDT", rng.choice(["buy", "sell"]),
+                              rng.uniform(50, 150), lever=rng.choice([None, 5, 20]))
+        for i in range(count)
+    }
+
+
+def scalar(positions, symbols: int) -> float:
+    by_symbol = {}
+    for p in positions.values():
+        by_symbol.setdefault(p.currentcy, []).append(p)
+    totals = {}
+    start = time.perf_counter()
+    for i in range(TICKS):
+        symbol = f"B{i % symbols}USDT"
+        price = 100.0 + i % 7
+        for p in by_symbol[symbol]:
+            change = (price - p.open_price) / p.open_price * 100
+            totals[p.title] = totals.get(p.title, 0.0) + (-change if p.side == "sell" else change)
+    return (time.perf_counter() - start) / TICKS
+
+
+def vector(positions, symbols: int) -> float:
+    position_index.positions = positions
+    engine = PnlEngine()
+    engine._load()
+    engine._build()
+    start = time.perf_counter()
+    for i in range(TICKS):
+        engine.on_tick(f"B{i % symbols}USDT", 100.0 + i % 7)
+    return (time.perf_counter() - start) / TICKS
+
+
+def main():
+    print(f"{'positions':>10} {'symbols':>8} {'per tick':>9} {'scalar us/tick':>15} {'vector us/tick':>15}")
+    for count in (1_000, 10_000, 50_000, 100_000):
+        for symbols in (1, 20):
+            positions = make_positions(count, symbols)
+            print(f"{count:>10} {symbols:>8} {count // symbols:>9} "
+                  f"{scalar(positions, symbols) * 1e6:>15.1f} {vector(positions, symbols) * 1e6:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""共享价格表读延迟基准
+
+一个写进程以最快速度轮流更新所有交易对（模拟行情所有者），
+多个读进程同时做随机读取，统计单次读取延迟分位数和 seqlock 重试率。
+
+运行: python -m benchmarks.bench_price_table  （在 backend 目录下）
+"""
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from app.services.price_table import HEADER_SIZE, RECORD, SEQ, SLOT_SIZE, SPIN_LIMIT, SharedPriceTable
+
+SYMBOLS = [f"SYM{i}USDT" for i in range(200)]
+READS = 200_000
+
+
+def writer(path, stop, counter):
+    table = SharedPriceTable(path, capacity=len(SYMBOLS))
+    table.try_acquire_owner()
+    writes = 0
+    while not stop.is_set():
+        for symbol in SYMBOLS:
+            table.write(symbol, 100.0 + writes, time.time(), writes)
+            writes += 1
+    counter.value = writes
+    table.close()
+
+
+def reader(path, results):
+    table = SharedPriceTable(path, capacity=len(SYMBOLS))
+    slots = [table.slot_of(symbol) for symbol in SYMBOLS]
+    samples = []
+    retries = 0
+    for _ in range(READS):
+        slot = random.choice(slots)
+        offset = HEADER_SIZE + slot * SLOT_SIZE
+        start = time.perf_counter_ns()
+        # 与 SharedPriceTable._read_slot 相同的读取循环，额外统计重试次数
+        spins = 0
+        while True:
+            seq, price, received_at, event_ts = RECORD.unpack_from(table.mm, offset)
+            if not seq & 1 and SEQ.unpack_from(table.mm, offset)[0] == seq:
+                break
+            retries += 1
+            spins += 1
+            if spins >= SPIN_LIMIT:
+                os.sched_yield()
+                spins = 0
+        samples.append(time.perf_counter_ns() - start)
+    table.close()
+    samples.sort()
+    results.put((samples[len(samples) // 2], samples[int(len(samples) * 0.99)],
+                 samples[int(len(samples) * 0.999)], samples[-1], retries))
+
+
+def run(readers: int, path: str):
+    ctx = multiprocessing.get_context("fork")
+    stop, counter, results = ctx.Event(), ctx.Value("q", 0), ctx.Queue()
+    table = SharedPriceTable(path, capacity=len(SYMBOLS))
+    for symbol in SYMBOLS:
+        table.write(symbol, 0.0, 0.0, 0)
+    table.close()
+
+    write_proc = ctx.Process(target=writer, args=(path, stop, counter))
+    write_proc.start()
+    time.sleep(0.2)
+    started = time.perf_counter()
+    procs = [ctx.Process(target=reader, args=(path, results)) for _ in range(readers)]
+    for proc in procs:
+        proc.start()
+    stats = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    write_proc.join()
+
+    worst = lambda i: max(s[i] for s in stats)
+    retries = sum(s[4] for s in stats)
+    print(f"{readers:>8} {worst(0):>9} {worst(1):>9} {worst(2):>10} {worst(3):>9} "
+          f"{retries / (readers * READS) * 100:>9.3f}% {counter.value / (elapsed + 0.2) / 1e6:>12.2f}")
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), "bench_price_table")
+    print(f"{'readers':>8} {'p50 ns':>9} {'p99 ns':>9} {'p99.9 ns':>10} {'max ns':>9} {'retries':>10} {'writes M/s':>12}")
+    for readers in (1, 2, 4, 8):
+        run(readers, path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""批量信号处理与逐条处理的耗时对比
+
+对 N 条信号（一半开仓、一半平仓）分别逐条调用 create_signal（每条一次提交）
+和一次 create_signals_batch（一个事务），比较总耗时。
+
+默认使用临时目录里的 SQLite 文件；设置 BENCH_DATABASE_URL 可以对 PostgreSQL 运行
+（会在该库中建表并清空 trading_signals / strategy_state / strategy_daily_stats）。
+
+运行: python -m benchmarks.bench_signal_batch  （在 backend 目录下）
+"""
+import asyncio
+import os
+import tempfile
+import time
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.database import async_database_url
+from app.models.trading import Base, StrategyDailyStats, StrategyState, TradingSignal
+from app.schemas import TradingSignal as TradingSignalSchema
+from app.services.binance_ws import binance_ws
+from app.services.position_index import position_index
+from app.services.trading_service import TradingService
+
+
+def make_signals(n: int, prefix: str):
+    opens = [TradingSignalSchema(is_close="0", trade_id=f"{prefix}{i}", title=f"strategy{i % 5}",
+                                 currentcy="BTCUSDT", side="buy" if i % 2 else "sell") for i in range(n // 2)]
+    closes = [TradingSignalSchema(is_close="1", trade_id=f"{prefix}{i}") for i in range(n // 2)]
+    return opens + closes
+
+
+async def reset(session_factory):
+    async with session_factory() as db:
+        await db.execute(delete(TradingSignal))
+        await db.execute(delete(StrategyState))
+        await db.execute(delete(StrategyDailyStats))
+        await db.commit()
+        await position_index.load(db)
+    binance_ws.handle_message({"s": "BTCUSDT", "p": "52000"})
+
+
+async def sequential(session_factory, signals):
+    async with session_factory() as db:
+        for signal in signals:
+            await TradingService.create_signal(db, signal)
+
+
+async def batched(session_factory, signals):
+    async with session_factory() as db:
+        await TradingService.create_signals_batch(db, signals)
+
+
+async def run():
+    url = os.environ.get("BENCH_DATABASE_URL") or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_async_engine(async_database_url(url))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    print(f"{'signals':>8} {'sequential ms':>14} {'batch ms':>10} {'speedup':>8}")
+    for n in (10, 50, 200, 1000):
+        await reset(session_factory)
+        started = time.perf_counter()
+        await sequential(session_factory, make_signals(n, "s"))
+        one_by_one = time.perf_counter() - started
+
+        await reset(session_factory)
+        started = time.perf_counter()
+        await batched(session_factory, make_signals(n, "b"))
+        batch = time.perf_counter() - started
+        print(f"{n:>8} {one_by_one * 1e3:>14.1f} {batch * 1e3:>10.1f} {one_by_one / batch:>7.1f}x")
+    await engine.dispose()
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""价格扇出编码开销基准
+
+对比两种方式下每个 tick 的编码 CPU 开销随客户端数量的变化：
+- legacy: 每个客户端各自构造 dict 并 json 序列化（旧的 send_json 路径）
+- shared: 每个 tick 每种协议格式只编码一次，所有客户端共享同一份文本
+
+运行: python -m benchmarks.bench_tick_encoding  （在 backend 目录下）
+"""
+import json
+import time
+from app.services.tick_encoder import EncodedTick, WS_FRAME, API_FRAME
+
+SYMBOLS = ["BTCUSDT", "ETHUSDT", "XRPUSDT", "SOLUSDT", "RUNEUSDT", "1000PEPEUSDT", "WUSDT"]
+TICKS = 200
+
+
+def legacy_fanout(clients: int) -> float:
+    start = time.process_time()
+    for i in range(TICKS):
+        symbol = SYMBOLS[i % len(SYMBOLS)]
+        price = 50000.0 + i
+        for c in range(clients):
+            if c % 2:
+                json.dumps({"symbol": symbol, "price": price}, separators=(",", ":"), ensure_ascii=False)
+            else:
+                json.dumps({'s': symbol, 'p': str(price)}, separators=(",", ":"), ensure_ascii=False)
+    return (time.process_time() - start) / TICKS
+
+
+def shared_fanout(clients: int) -> float:
+    variants = [API_FRAME if c % 2 else WS_FRAME for c in range(clients)]
+    start = time.process_time()
+    for i in range(TICKS):
+        tick = EncodedTick(SYMBOLS[i % len(SYMBOLS)], 50000.0 + i)
+        for variant in variants:
+            tick.frame(variant)
+    return (time.process_time() - start) / TICKS
+
+
+def encode_only(clients: int) -> float:
+    """只计编码本身：与客户端数量无关，每个 tick 每种格式一次"""
+    start = time.process_time()
+    for i in range(TICKS):
+        tick = EncodedTick(SYMBOLS[i % len(SYMBOLS)], 50000.0 + i)
+        tick.frame(WS_FRAME)
+        if clients > 1:
+            tick.frame(API_FRAME)
+    return (time.process_time() - start) / TICKS
+
+
+def main():
+    print(f"{'clients':>8} {'legacy us/tick':>15} {'shared us/tick':>15} {'encode us/tick':>15}")
+    for clients in (1, 10, 100, 1000, 5000):
+        legacy = legacy_fanout(clients) * 1e6
+        shared = shared_fanout(clients) * 1e6
+        encode = encode_only(clients) * 1e6
+        print(f"{clients:>8} {legacy:>15.1f} {shared:>15.1f} {encode:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import itertools
+from contextlib import asynccontextmanager
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app.models.trading import Base
+from app.services.position_index import position_index
+
+
+@pytest.fixture
+def new_session(tmp_path):
+    """返回一个异步上下文管理器：每次进入都在新的 SQLite 文件上建表并加载未平仓索引"""
+    counter = itertools.count()
+
+    @asynccontextmanager
+    async def factory():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/db{next(counter)}.sqlite")
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                await position_index.load(session)
+                yield session
+        finally:
+            await engine.dispose()
+
+    return factory
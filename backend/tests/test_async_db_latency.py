@@ -0,0 +1,71 @@
+import asyncio
+import json
+import time
+from sqlalchemy import insert, select, func
+from sqlalchemy.orm import aliased
+from app.models.trading import TradingSignal
+from app.services.binance_ws import binance_ws
+
+TICK_INTERVAL = 0.005
+
+
+class TimingClient:
+    """记录每个价格被送达的时间"""
+
+    def __init__(self):
+        self.received = {}
+
+    async def send_text(self, text):
+        self.received[float(json.loads(text)["p"])] = time.perf_counter()
+
+    async def close(self):
+        pass
+
+
+async def publish_ticks(sent, stop):
+    i = 0
+    while not stop.is_set():
+        i += 1
+        sent[float(i)] = time.perf_counter()
+        binance_ws.handle_message({"s": "LATENCYUSDT", "p": str(i)})
+        await asyncio.sleep(TICK_INTERVAL)
+
+
+def test_tick_latency_stays_flat_during_heavy_query(new_session):
+    async def scenario():
+        async with new_session() as db:
+            await db.execute(insert(TradingSignal), [
+                {"trade_id": f"t{i}", "title": f"s{i % 10}", "is_close": True, "profit_percentage": i % 7 - 3.0}
+                for i in range(6000)])
+            await db.commit()
+
+            client = TimingClient()
+            binance_ws.broadcaster.add(client, symbols=["LATENCYUSDT"])
+            sent, stop = {}, asyncio.Event()
+            publisher = asyncio.create_task(publish_ticks(sent, stop))
+            try:
+                await asyncio.sleep(0.05)
+                # 自连接聚合：数据库要扫描约 1800 万行组合，结果只有一行
+                other = aliased(TradingSignal)
+                started = time.perf_counter()
+                total = await db.scalar(select(func.count()).select_from(TradingSignal).join(
+                    other, TradingSignal.id < other.id))
+                query_time = time.perf_counter() - started
+                await asyncio.sleep(0.05)
+            finally:
+                stop.set()
+                await publisher
+                await asyncio.sleep(0.02)
+                binance_ws.broadcaster.remove(client)
+            return total, query_time, started, sent, client.received
+
+    total, query_time, started, sent, received = asyncio.run(scenario())
+    assert total == 6000 * 5999 // 2
+    assert query_time > 0.1
+    assert sorted(received) == sorted(sent)
+    # 查询期间事件循环仍按节奏推送：送达间隔和送达延迟都远小于查询耗时
+    arrivals = sorted(received.values())
+    gaps = [b - a for a, b in zip(arrivals, arrivals[1:])]
+    assert max(gaps) < 0.05
+    assert max(received[p] - sent[p] for p in sent) < 0.05
+    assert len([at for at in arrivals if started <= at <= started + query_time]) >= query_time / TICK_INTERVAL / 3
@@ -0,0 +1,191 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from sqlalchemy import insert
+from app.models.trading import TradingSignal
+from app.services.backtest_service import BacktestService, PriceSeries, sma, to_epoch_ms
+from app.services.binance_ws import binance_ws
+
+MINUTE = 60_000
+
+
+def random_walk(n, seed=3):
+    rng = np.random.default_rng(seed)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+    return PriceSeries(1_700_000_000_000 + np.arange(n, dtype=np.int64) * MINUTE, close)
+
+
+def sma_cross(fast, slow):
+    entry = lambda s: sma(s.close, fast) > sma(s.close, slow)
+    exit = lambda s: sma(s.close, fast) < sma(s.close, slow)
+    return entry, exit
+
+
+def reference(close, entry, exit, sign, lever, fee):
+    """逐根 K 线的循环实现"""
+    hold, equity, curve, trades, opened = 0, 1.0, [], [], None
+    for i in range(len(close)):
+        r = hold * sign * lever * (close[i] / close[i - 1] - 1.0) if i else 0.0
+        new = hold
+        if hold and exit[i]:
+            new = 0
+        elif not hold and entry[i] and not exit[i]:
+            new = 1
+        if i == len(close) - 1 and new:
+            new = 0
+        cost = fee * lever if new != hold else 0.0
+        if new and not hold:
+            opened = i
+        elif hold and not new:
+            trades.append(sign * lever * (close[i] / close[opened] - 1.0) - 2 * fee * lever)
+        hold = new
+        equity *= max(1.0 + r - cost, 0.0)
+        curve.append(equity)
+    return np.array(curve), np.array(trades)
+
+
+@pytest.mark.parametrize("side,lever", [("buy", 3), ("sell", 1)])
+def test_rules_match_bar_by_bar_loop(side, lever):
+    series = random_walk(3000)
+    entry, exit = sma_cross(10, 30)
+    trades = BacktestService.rules_to_trades(series, entry, exit, side, lever)
+    result = BacktestService.run(series, trades, fee=0.0005)
+
+    curve, trade_returns = reference(series.close, entry(series), exit(series), -1 if side == "sell" else 1,
+                                     lever, 0.0005)
+    assert len(trades) > 10
+    assert np.allclose(result.equity, curve)
+    assert np.allclose(result.trade_returns, trade_returns)
+    peak = np.maximum.accumulate(curve)
+    assert result.stats["max_drawdown"] == pytest.approx(float(np.max(1 - curve / peak)))
+    assert result.stats["win_rate"] == pytest.approx(float(np.mean(trade_returns > 0)))
+
+
+def test_a_year_of_minute_bars_runs_well_under_a_second():
+    series = random_walk(365 * 24 * 60)
+    entry, exit = sma_cross(50, 200)
+    started = time.perf_counter()
+    result = BacktestService.run(series, BacktestService.rules_to_trades(series, entry, exit, lever=5), fee=0.0004)
+    elapsed = time.perf_counter() - started
+    assert result.stats["total_trades"] > 100
+    assert np.isfinite(result.stats["sharpe_ratio"])
+    assert elapsed < 0.5
+
+
+def test_recorded_signals_replay_on_stored_candles(new_session):
+    base = datetime(2026, 1, 5, 10, 0)  # 中国时间
+    start_ms = to_epoch_ms(base)
+    for i in range(120):
+        binance_ws.handle_message({"s": "BTKUSDT", "p": str(100.0 + i), "E": start_ms + i * MINUTE})
+
+    async def scenario():
+        async with new_session() as db:
+            await db.execute(insert(TradingSignal), [
+                {"trade_id": "long", "title": "bt", "currentcy": "BTKUSDT", "side": "buy", "lever": 2,
+                 "is_close": True, "created_at": base + timedelta(minutes=10, seconds=30),
+                 "closed_at": base + timedelta(minutes=20)},
+                {"trade_id": "short", "title": "bt", "currentcy": "BTKUSDT", "side": "sell",
+                 "is_close": False, "created_at": base + timedelta(minutes=100)},
+                {"trade_id": "other", "title": "bt", "currentcy": "ETHUSDT", "side": "buy",
+                 "is_close": False, "created_at": base + timedelta(minutes=5)},
+            ])
+            await db.commit()
+            return await BacktestService.run_backtest(db, "bt", "btk", base, base + timedelta(hours=3))
+
+    result = asyncio.run(scenario())
+    # 最后一根是尚未收盘的 K 线，价格 219
+    assert result.trades.entry.tolist() == [10, 100]
+    assert result.trades.exit.tolist() == [20, 119]
+    assert result.trade_returns == pytest.approx([2 * (120 / 110 - 1), -(219 / 200 - 1)])
+    assert result.to_dict(points=10)["equity_curve"]["ts"][-1] == start_ms + 119 * MINUTE
+
+
+def test_signals_with_a_bare_base_asset_are_replayed(new_session):
+    base = datetime(2026, 1, 6, 10, 0)
+    start_ms = to_epoch_ms(base)
+    for i in range(60):
+        binance_ws.handle_message({"s": "BTQUSDT", "p": str(100.0 + i), "E": start_ms + i * MINUTE})
+
+    async def scenario():
+        async with new_session() as db:
+            await db.execute(insert(TradingSignal), [
+                {"trade_id": "bare", "title": "bt", "currentcy": "BTQ", "side": "buy", "is_close": True,
+                 "created_at": base + timedelta(minutes=5), "closed_at": base + timedelta(minutes=10)},
+                {"trade_id": "lower", "title": "bt", "currentcy": "btq", "side": "buy", "is_close": True,
+                 "created_at": base + timedelta(minutes=20), "closed_at": base + timedelta(minutes=30)},
+                {"trade_id": "full", "title": "bt", "currentcy": "BTQUSDT", "side": "buy", "is_close": True,
+                 "created_at": base + timedelta(minutes=40), "closed_at": base + timedelta(minutes=50)},
+            ])
+            await db.commit()
+            return await BacktestService.run_backtest(db, "bt", "BTQUSDT", base, base + timedelta(hours=1))
+
+    result = asyncio.run(scenario())
+    assert result.trades.entry.tolist() == [5, 20, 40]
+    assert result.trades.exit.tolist() == [10, 30, 50]
+
+
+def test_signals_outside_the_price_history_are_skipped(new_session):
+    base = datetime(2026, 1, 7, 10, 0)
+    start_ms = to_epoch_ms(base)
+    for i in range(30):
+        binance_ws.handle_message({"s": "BTOUSDT", "p": str(100.0 + i), "E": start_ms + i * MINUTE})
+
+    async def scenario():
+        async with new_session() as db:
+            await db.execute(insert(TradingSignal), [
+                # 行情开始之前就已平仓
+                {"trade_id": "before", "title": "bo", "currentcy": "BTO", "side": "buy", "is_close": True,
+                 "created_at": base - timedelta(hours=2), "closed_at": base - timedelta(hours=1)},
+                # 行情开始之前开仓、之后平仓：没有开仓价
+                {"trade_id": "straddle", "title": "bo", "currentcy": "BTO", "side": "buy", "is_close": True,
+                 "created_at": base - timedelta(minutes=10), "closed_at": base + timedelta(minutes=5)},
+                {"trade_id": "inside", "title": "bo", "currentcy": "BTO", "side": "buy", "is_close": True,
+                 "created_at": base + timedelta(minutes=10), "closed_at": base + timedelta(minutes=20)},
+            ])
+            await db.commit()
+            return await BacktestService.run_backtest(db, "bo", "BTOUSDT", base - timedelta(hours=3),
+                                                      base + timedelta(hours=1))
+
+    result = asyncio.run(scenario())
+    assert result.trades.entry.tolist() == [10]
+    assert result.trades.exit.tolist() == [20]
+    assert result.stats["total_trades"] == 1
+    assert result.stats["skipped_signals"] == 2
+
+
+def test_stops_exit_at_trigger_level():
+    # 第 0 根开多（收盘 100），第 2 根最低 94 触及 5% 止损，第 4 根跳空开在 89 低于止损位
+    close = np.array([100.0, 101.0, 97.0, 96.0, 90.0, 92.0])
+    low = np.array([100.0, 99.0, 94.0, 95.0, 88.0, 91.0])
+    high = np.array([100.0, 103.0, 101.0, 97.0, 90.0, 93.0])
+    open_ = np.array([100.0, 100.0, 100.0, 96.0, 89.0, 91.0])
+    series = PriceSeries(np.arange(6) * MINUTE, close, open_, high, low)
+    trades = BacktestService.rules_to_trades(series, np.array([1, 0, 0, 0, 0, 0], bool), np.zeros(6, bool))
+
+    stopped = BacktestService.apply_stops(series, trades, stop_loss=0.05)
+    assert stopped.exit.tolist() == [2]
+    assert stopped.exit_price.tolist() == [95.0]
+    result = BacktestService.run(series, stopped)
+    assert np.allclose(result.equity, [1.0, 1.01, 0.95, 0.95, 0.95, 0.95])
+    assert np.isclose(result.trade_returns[0], -0.05)
+
+    # 止盈 2%：第 1 根最高 103 触及 102
+    taken = BacktestService.apply_stops(series, trades, stop_loss=0.05, take_profit=0.02)
+    assert taken.exit.tolist() == [1] and taken.exit_price.tolist() == [102.0]
+
+    # 从第 3 根开仓（收盘 96），止损位 91.2；第 4 根开盘 89 已低于止损位，按开盘价成交
+    late = BacktestService.rules_to_trades(series, np.array([0, 0, 0, 1, 0, 0], bool), np.zeros(6, bool))
+    gapped = BacktestService.apply_stops(series, late, stop_loss=0.05)
+    assert gapped.exit.tolist() == [4] and gapped.exit_price.tolist() == [89.0]
+
+
+def test_short_stop_uses_highs():
+    close = np.array([100.0, 99.0, 104.0, 100.0])
+    high = np.array([100.0, 100.0, 106.0, 101.0])
+    series = PriceSeries(np.arange(4) * MINUTE, close, close, high, close)
+    trades = BacktestService.rules_to_trades(series, np.array([1, 0, 0, 0], bool), np.zeros(4, bool), "sell", 2)
+    stopped = BacktestService.apply_stops(series, trades, stop_loss=0.05)
+    assert stopped.exit.tolist() == [2] and stopped.exit_price.tolist() == [105.0]
+    assert np.isclose(BacktestService.run(series, stopped).trade_returns[0], -0.10)
@@ -0,0 +1,74 @@
+import asyncio
+import numpy as np
+from app.services.backtest_service import PriceSeries
+from app.services.backtest_sweep import Sweep, parameter_grid, run_params
+
+MINUTE = 60_000
+
+GRID = {"fast": [5, 10], "slow": [30, 60], "lever": [1, 3], "stop": [None, 0.01]}
+
+
+def ohlc_walk(n, seed=5):
+    rng = np.random.default_rng(seed)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+    open_ = np.concatenate(([100.0], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.001, n)) * close
+    return PriceSeries(1_700_000_000_000 + np.arange(n, dtype=np.int64) * MINUTE, close, open_,
+                       np.maximum(open_, close) + spread, np.minimum(open_, close) - spread)
+
+
+def key(row):
+    return tuple(str(row[name]) for name in ("fast", "slow", "lever", "stop"))
+
+
+def test_parameter_grid():
+    combos = parameter_grid(GRID)
+    assert len(combos) == 16
+    assert combos[0] == {"fast": 5, "slow": 30, "side": "buy", "lever": 1, "stop": None, "take": None}
+    try:
+        parameter_grid({"window": [1]})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unknown parameter accepted")
+
+
+def test_parameter_grid_rejects_invalid_values():
+    invalid = [{"fast": 5}, {"fast": []}, {"fast": [0]}, {"fast": [2.5]}, {"slow": [True]}, {"slow": ["30"]},
+               {"side": ["long"]}, {"lever": [0]}, {"lever": [None]}, {"stop": [-0.01]}, {"take": ["1%"]}]
+    for grid in invalid:
+        try:
+            parameter_grid(grid)
+        except ValueError:
+            continue
+        raise AssertionError(f"invalid grid accepted: {grid}")
+    assert len(parameter_grid({"side": ["buy", "sell"], "lever": [0.5, 2], "take": [None, 0.02]})) == 8
+
+
+def test_sweep_matches_direct_runs():
+    series = ohlc_walk(5000)
+    expected = {key(row): row for row in (run_params(series, params, 0.0004) for params in parameter_grid(GRID))}
+    calls = []
+    with Sweep(series, workers=2, fee=0.0004, chunk_size=3) as sweep:
+        rows = list(sweep.results(GRID, lambda done, total: calls.append((done, total))))
+
+    assert len(rows) == 16
+    assert {key(row): row for row in rows} == expected
+    assert len(calls) == 6  # 16 组按 3 个一批
+    assert [total for _, total in calls] == [16] * 6
+    assert calls[-1][0] == 16
+
+
+def test_async_sweep_reports_progress():
+    series = ohlc_walk(2000)
+
+    async def scenario():
+        rows, progress = [], []
+        with Sweep(series, workers=2, chunk_size=4) as sweep:
+            async for row in sweep.aresults(GRID):
+                (progress if "progress" in row else rows).append(row)
+        return rows, progress
+
+    rows, progress = asyncio.run(scenario())
+    assert len(rows) == 16
+    assert [p["progress"] for p in progress] == [4, 8, 12, 16]
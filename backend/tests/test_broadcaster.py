@@ -0,0 +1,124 @@
+import asyncio
+import json
+from app.services.broadcaster import PriceBroadcaster
+from app.services.tick_encoder import EncodedTick, API_FRAME
+
+
+class FakeClient:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.received = []
+        self.closed = False
+
+    async def send_text(self, text):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received.append(json.loads(text))
+
+    async def close(self):
+        self.closed = True
+
+
+def test_fast_client_receives_every_update():
+    async def scenario():
+        broadcaster = PriceBroadcaster(max_pending=16, send_timeout=1)
+        client = FakeClient()
+        broadcaster.add(client)
+        for i in range(5):
+            broadcaster.publish(EncodedTick("BTCUSDT", i))
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.01)
+        return client
+
+    client = asyncio.run(scenario())
+    assert [m["p"] for m in client.received] == ["0", "1", "2", "3", "4"]
+
+
+def test_slow_client_gets_latest_price_per_symbol():
+    async def scenario():
+        broadcaster = PriceBroadcaster(max_pending=16, send_timeout=1)
+        slow = FakeClient(delay=0.05)
+        broadcaster.add(slow)
+        for i in range(20):
+            broadcaster.publish(EncodedTick("BTCUSDT", i))
+            broadcaster.publish(EncodedTick("ETHUSDT", i))
+        await asyncio.sleep(0.3)
+        return slow
+
+    slow = asyncio.run(scenario())
+    assert slow.received == [
+        {"s": "BTCUSDT", "p": "19"},
+        {"s": "ETHUSDT", "p": "19"},
+    ]
+
+
+def test_stuck_client_is_dropped_without_blocking_others():
+    async def scenario():
+        broadcaster = PriceBroadcaster(max_pending=16, send_timeout=0.05)
+        stuck = FakeClient(delay=10)
+        fast = FakeClient()
+        broadcaster.add(stuck)
+        broadcaster.add(fast)
+        broadcaster.publish(EncodedTick("BTCUSDT", 1))
+        await asyncio.sleep(0.2)
+        broadcaster.publish(EncodedTick("BTCUSDT", 2))
+        await asyncio.sleep(0.01)
+        return broadcaster, stuck, fast
+
+    broadcaster, stuck, fast = asyncio.run(scenario())
+    assert stuck not in broadcaster.channels
+    assert stuck.closed
+    assert [m["p"] for m in fast.received] == ["1", "2"]
+
+
+def test_overflowing_client_is_dropped():
+    async def scenario():
+        broadcaster = PriceBroadcaster(max_pending=2, send_timeout=1)
+        client = FakeClient(delay=1)
+        broadcaster.add(client)
+        for symbol in ["A", "B", "C", "D"]:
+            broadcaster.publish(EncodedTick(symbol, 1))
+        await asyncio.sleep(0)
+        return broadcaster, client
+
+    broadcaster, client = asyncio.run(scenario())
+    assert client not in broadcaster.channels
+    assert broadcaster.stats()["queued"] == 0
+
+
+def test_lagging_client_is_dropped_even_when_conflated():
+    async def scenario():
+        broadcaster = PriceBroadcaster(max_pending=16, send_timeout=5, max_lag=0.05)
+        client = FakeClient(delay=1)
+        broadcaster.add(client)
+        broadcaster.publish(EncodedTick("A", 1))
+        await asyncio.sleep(0)  # A 已取出、正在发送
+        broadcaster.publish(EncodedTick("B", 1))
+        await asyncio.sleep(0.1)
+        # 队列里只有一个交易对，但 B 已等待超过 max_lag
+        broadcaster.publish(EncodedTick("B", 2))
+        await asyncio.sleep(0)
+        return broadcaster, client
+
+    broadcaster, client = asyncio.run(scenario())
+    assert client not in broadcaster.channels
+    assert client.closed
+
+
+def test_tick_is_encoded_once_per_variant():
+    async def scenario():
+        broadcaster = PriceBroadcaster(max_pending=16, send_timeout=1)
+        ws_clients = [FakeClient() for _ in range(3)]
+        api_client = FakeClient()
+        for client in ws_clients:
+            broadcaster.add(client)
+        broadcaster.add(api_client, API_FRAME)
+        tick = EncodedTick("BTCUSDT", 52000.5)
+        broadcaster.publish(tick)
+        await asyncio.sleep(0.01)
+        return tick, ws_clients, api_client
+
+    tick, ws_clients, api_client = asyncio.run(scenario())
+    assert sorted(tick._frames) == ["api", "ws"]
+    assert all(c.received == [{"s": "BTCUSDT", "p": "52000.5"}] for c in ws_clients)
+    assert api_client.received == [{"symbol": "BTCUSDT", "price": 52000.5}]
@@ -0,0 +1,29 @@
+from app.services.candles import CandleAggregator
+
+
+def test_ticks_update_every_resolution():
+    aggregator = CandleAggregator(history=10)
+    for ts, price in [(0, 10.0), (400, 12.0), (900, 9.0), (1500, 11.0)]:
+        aggregator.update("BTCUSDT", ts, price)
+
+    seconds = [c.to_dict() for c in aggregator.candles("BTCUSDT", "1s")]
+    assert seconds == [
+        {"open_time": 0, "open": 10.0, "high": 12.0, "low": 9.0, "close": 9.0, "count": 3},
+        {"open_time": 1000, "open": 11.0, "high": 11.0, "low": 11.0, "close": 11.0, "count": 1},
+    ]
+    minute = aggregator.candles("BTCUSDT", "1m")
+    assert len(minute) == 1
+    assert (minute[0].open, minute[0].high, minute[0].low, minute[0].close, minute[0].count) == (10.0, 12.0, 9.0, 11.0, 4)
+
+
+def test_bar_close_events_and_bounded_history():
+    aggregator = CandleAggregator(resolutions={"1s": 1}, history=3)
+    closed = []
+    aggregator.add_listener(lambda symbol, interval, candle: closed.append((symbol, interval, candle.open_time)))
+    for second in range(6):
+        aggregator.update("ETHUSDT", second * 1000, 3200.0 + second)
+
+    assert closed == [("ETHUSDT", "1s", t * 1000) for t in range(5)]
+    history = aggregator.candles("ETHUSDT", "1s", include_current=False)
+    assert [c.open_time for c in history] == [2000, 3000, 4000]
+    assert [c.open_time for c in aggregator.candles("ETHUSDT", "1s", limit=2)] == [4000, 5000]
@@ -0,0 +1,80 @@
+import asyncio
+import csv
+import io
+import json
+import tracemalloc
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert
+from app.models.trading import TradingSignal
+from app.services import export_service
+
+START = datetime(2026, 1, 1)
+
+
+def rows(n, titles=3):
+    return [{"trade_id": f"t{i}", "title": f"s{i % titles}", "currentcy": "BTCUSDT", "side": "buy",
+             "is_close": i % 2 == 0, "created_at": START + timedelta(minutes=i),
+             "closed_at": START + timedelta(minutes=i + 5) if i % 2 == 0 else None,
+             "open_price": 100.0, "close_price": 100.0 + i if i % 2 == 0 else None,
+             "zy_tp_trigger_px": [110.0 + i] if i % 3 == 0 else None} for i in range(n)]
+
+
+async def collect(db, stmt, fmt, chunk_size=None):
+    return [chunk async for chunk in export_service.encode(db, stmt, fmt, chunk_size)]
+
+
+def test_ndjson_and_csv_stream_in_chunks(new_session):
+    async def scenario():
+        async with new_session() as db:
+            await db.execute(insert(TradingSignal), rows(25))
+            await db.commit()
+            ndjson = await collect(db, export_service.signals_query(title="s0"), "ndjson", chunk_size=3)
+            history = await collect(db, export_service.history_query("s0"), "csv", chunk_size=4)
+            return ndjson, history
+
+    ndjson, history = asyncio.run(scenario())
+    records = [json.loads(line) for chunk in ndjson for line in chunk.decode().splitlines()]
+    assert len(ndjson) == 3  # 9 行，每批 3 行
+    assert [r["trade_id"] for r in records] == [f"t{i}" for i in range(0, 25, 3)]
+    assert records[1]["zy_tp_trigger_px"] == [113.0] and records[1]["created_at"] == "2026-01-01T00:03:00"
+
+    table = list(csv.DictReader(io.StringIO(b"".join(history).decode())))
+    assert [r["trade_id"] for r in table] == [f"t{i}" for i in range(24, -1, -6)]  # 按平仓时间倒序
+    assert table[0]["zy_tp_trigger_px"] == "[134.0]" and table[-1]["closed_at"] == "2026-01-01T00:05:00"
+
+
+def test_parquet_stream_is_a_readable_file(new_session):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    async def scenario():
+        async with new_session() as db:
+            await db.execute(insert(TradingSignal), rows(10))
+            await db.commit()
+            return await collect(db, export_service.signals_query(closed_only=True), "parquet", chunk_size=2)
+
+    chunks = asyncio.run(scenario())
+    table = pq.read_table(io.BytesIO(b"".join(chunks)))
+    assert table.column("trade_id").to_pylist() == ["t0", "t2", "t4", "t6", "t8"]
+    assert pq.ParquetFile(io.BytesIO(b"".join(chunks))).num_row_groups == 3
+
+
+def test_memory_stays_flat_as_rows_grow(new_session):
+    async def peak(n):
+        async with new_session() as db:
+            await db.execute(insert(TradingSignal), rows(n))
+            await db.commit()
+            tracemalloc.start()
+            try:
+                size = 0
+                async for chunk in export_service.encode(db, export_service.signals_query(), "ndjson", 500):
+                    size += len(chunk)
+                return size, tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+    small_size, small_peak = asyncio.run(peak(1000))
+    large_size, large_peak = asyncio.run(peak(12000))
+    assert large_size > 10 * small_size
+    # 输出大 12 倍，内存峰值只由批大小决定
+    assert large_peak < 2 * small_peak
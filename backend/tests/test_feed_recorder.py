@@ -0,0 +1,79 @@
+import asyncio
+import json
+import os
+import time
+from app.services.binance_ws import BinanceWebSocket
+from app.services.feed_recorder import FeedRecorder, ReplaySource, read_records, recording_files
+
+HOUR_NS = 3600 * 10**9
+BASE_NS = 1_700_000_000 * 10**9 - (1_700_000_000 * 10**9) % HOUR_NS
+
+
+def mark_price(symbol, price, event_time):
+    return json.dumps({"stream": f"{symbol.lower()}@markPrice@1s",
+                       "data": {"e": "markPriceUpdate", "E": event_time, "s": symbol, "p": str(price)}})
+
+
+def record_session(directory, step_ns=10**9):
+    recorder = FeedRecorder(directory)
+    messages = []
+    for i in range(6):
+        # 后半段跨过整点，落到下一个小时的分块
+        ts_ns = BASE_NS + HOUR_NS - 3 * step_ns + i * step_ns
+        raw = mark_price("BTCUSDT" if i % 2 else "ETHUSDT", 100 + i, ts_ns // 10**6)
+        recorder.record(raw, ts_ns)
+        messages.append((ts_ns, raw))
+    recorder.close()
+    return messages
+
+
+def test_recording_is_chunked_per_hour_and_read_back(tmp_path):
+    messages = record_session(str(tmp_path))
+    files = recording_files(str(tmp_path))
+    assert len(files) == 2
+    records = [(ts, payload.decode()) for path in files for ts, payload in read_records(path)]
+    assert records == messages
+
+
+def test_partial_trailing_record_is_ignored(tmp_path):
+    messages = record_session(str(tmp_path))
+    last = recording_files(str(tmp_path))[-1]
+    with open(last, "ab") as f:
+        f.write(b"\x01\x02\x03")
+    records = [ts for path in recording_files(str(tmp_path)) for ts, _ in read_records(path)]
+    assert records == [ts for ts, _ in messages]
+
+
+def test_reopening_a_chunk_truncates_the_partial_record(tmp_path):
+    messages = record_session(str(tmp_path))
+    last = recording_files(str(tmp_path))[-1]
+    with open(last, "ab") as f:
+        f.write(b"\x01\x02\x03")  # 崩溃时写了一半的记录头
+    ts_ns = BASE_NS + HOUR_NS + 10 * 10**9
+    raw = mark_price("BTCUSDT", 200, ts_ns // 10**6)
+    recorder = FeedRecorder(str(tmp_path))
+    recorder.record(raw, ts_ns)
+    recorder.close()
+    records = [(ts, payload.decode()) for path in recording_files(str(tmp_path)) for ts, payload in read_records(path)]
+    assert records == messages + [(ts_ns, raw)]
+
+
+def test_replay_feeds_the_normal_ingest_path(tmp_path):
+    record_session(str(tmp_path))
+
+    async def replay(speed):
+        feed = BinanceWebSocket()
+        source = ReplaySource(str(tmp_path), speed=speed)
+        started = time.monotonic()
+        await source.run(feed)
+        return feed, time.monotonic() - started
+
+    feed, elapsed = asyncio.run(replay(0))
+    assert elapsed < 0.5
+    assert feed.prices == {"ETHUSDT": 104.0, "BTCUSDT": 105.0}
+    assert feed.ticks.get("BTCUSDT").since().to_dict()["price"] == [101.0, 103.0, 105.0]
+
+    # 5 秒的录制按 20 倍速回放约 0.25 秒
+    feed, elapsed = asyncio.run(replay(20))
+    assert 0.2 < elapsed < 1.0
+    assert feed.prices == {"ETHUSDT": 104.0, "BTCUSDT": 105.0}
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import numpy as np
+from app.services import history_store as hs
+from app.services.backtest_service import BacktestService
+from app.services.binance_ws import binance_ws
+from app.services.history_store import DAY_MS, TICK, HistoryRecorder, HistoryStore, import_klines
+
+MINUTE = 60_000
+DAY0 = 19_700 * DAY_MS  # 2023-12-09 00:00 UTC
+
+
+def klines(start, count, price=100.0):
+    open_time = start + np.arange(count, dtype=np.int64) * MINUTE
+    close = price + np.arange(count, dtype=np.float64)
+    return {"open_time": open_time, "open": close - 0.5, "high": close + 1, "low": close - 1, "close": close,
+            "volume": np.full(count, 2.0), "count": np.full(count, 7)}
+
+
+def test_partitions_by_day_and_reads_only_touched_days(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    # 三天的 1 分钟 K 线
+    assert store.write("btc", "1m", klines(DAY0, 3 * 1440)) == 3 * 1440
+    assert store.days("BTCUSDT", "1m") == ["2023-12-09", "2023-12-10", "2023-12-11"]
+
+    # 第二天中午到第三天凌晨：只打开两个分区，返回 memmap 上的视图
+    start, end = DAY0 + DAY_MS + 720 * MINUTE, DAY0 + 2 * DAY_MS + 10 * MINUTE
+    part = store.read("BTCUSDT", "1m", start, end)
+    assert len(part.segments) == 2
+    assert all(isinstance(segment["close"], np.memmap) for segment in part.segments)
+    columns = part.columns()
+    assert columns["open_time"][0] == start and columns["open_time"][-1] == end
+    assert len(columns["close"]) == 720 + 11
+
+    # 单个分区内的读取不复制
+    one = store.read("BTCUSDT", "1m", DAY0, DAY0 + 9 * MINUTE).columns()
+    assert isinstance(one["close"], np.memmap) and one["close"].tolist() == list(100.0 + np.arange(10))
+
+    # 不给 start 时取最近 limit 条
+    last = store.read("BTCUSDT", "1m", limit=3).columns()
+    assert last["open_time"].tolist() == [DAY0 + (3 * 1440 - k) * MINUTE for k in (3, 2, 1)]
+
+
+def test_overlapping_writes_merge_and_torn_tails_are_ignored(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    store.write("ETHUSDT", "1m", klines(DAY0 + 2 * MINUTE, 10))
+    # 与已有数据重叠（含更早的和重复的 K 线）：合并重写，新数据覆盖
+    store.write("ETHUSDT", "1m", klines(DAY0, 5, price=500.0))
+    columns = store.read("ETHUSDT", "1m").columns()
+    assert columns["open_time"].tolist() == [DAY0 + i * MINUTE for i in range(12)]
+    assert columns["close"].tolist()[:6] == [500.0, 501.0, 502.0, 503.0, 504.0, 103.0]
+
+    # 写了一半的尾部：只有一列多出来的字节被忽略，下次追加前截断
+    partition = os.path.join(str(tmp_path), "ETHUSDT", "1m", "2023-12-09")
+    with open(os.path.join(partition, "close.bin"), "ab") as f:
+        f.write(b"\x00" * 12)
+    assert len(store.read("ETHUSDT", "1m")) == 12
+    store.write("ETHUSDT", "1m", klines(DAY0 + 12 * MINUTE, 2, price=120.0))
+    columns = store.read("ETHUSDT", "1m").columns()
+    assert columns["close"].tolist()[-3:] == [109.0, 120.0, 121.0]
+
+
+def test_import_binance_kline_csv(tmp_path):
+    path = tmp_path / "BTCUSDT-1m-2023-12-09.csv"
+    rows = []
+    for i in range(5):
+        t = DAY0 + i * MINUTE
+        rows.append(f"{t},{100 + i},{101 + i},{99 + i},{100.5 + i},12.5,{t + MINUTE - 1},1250.0,{30 + i},6.0,600.0,0")
+    path.write_text("\n".join(rows) + "\n")
+    # 较新的现货数据：带表头，时间为微秒
+    micro = tmp_path / "ETHUSDT-1h-2023-12-09.csv"
+    micro.write_text("open_time,open,high,low,close,volume,close_time,quote_volume,count,tb,tq,ignore\n"
+                     f"{DAY0 * 1000},1,2,0.5,1.5,3,{DAY0 * 1000 + 1},4,5,6,7,0\n")
+
+    store = HistoryStore(str(tmp_path / "history"))
+    assert import_klines(store, str(path)) == 5
+    assert import_klines(store, str(micro)) == 1
+    btc = store.read("BTCUSDT", "1m").columns()
+    assert btc["open_time"].tolist() == [DAY0 + i * MINUTE for i in range(5)]
+    assert btc["count"].tolist() == [30, 31, 32, 33, 34]
+    assert btc["volume"].tolist() == [12.5] * 5
+    eth = store.read("ETHUSDT", "1h").columns()
+    assert eth["open_time"].tolist() == [DAY0] and eth["close"].tolist() == [1.5]
+
+
+def test_backtest_reads_stored_history_then_live_candles(tmp_path, monkeypatch):
+    store = HistoryStore(str(tmp_path))
+    monkeypatch.setattr(hs, "history_store", store)
+    symbol = "HISTUSDT"
+    store.write(symbol, "1m", klines(DAY0, 100))
+    # 进程内的 K 线从第 90 根开始：重叠部分以进程内为准
+    for i in range(90, 120):
+        binance_ws.candles.update(symbol, DAY0 + i * MINUTE, 1000.0 + i)
+
+    series = BacktestService.price_history(symbol, "1m")
+    assert len(series) == 120
+    assert np.all(np.diff(series.ts) == MINUTE)
+    assert series.close[89] == 189.0 and series.close[90] == 1090.0
+
+    window = BacktestService.price_history(symbol, "1m", DAY0 + 10 * MINUTE, DAY0 + 19 * MINUTE)
+    assert window.close.tolist() == [100.0 + i for i in range(10, 20)]
+
+    # 只有存储里才有的周期
+    store.write(symbol, "1d", klines(DAY0, 3))
+    assert len(BacktestService.price_history(symbol, "1d")) == 3
+
+
+def test_recorder_flushes_new_ticks_and_closed_candles(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    symbol = "RECUSDT"
+
+    async def scenario():
+        recorder = HistoryRecorder(store, flush_interval=3600, intervals=["1m"])
+        assert recorder.start()
+        # 同一目录的第二个写入者拿不到锁
+        assert not HistoryRecorder(store, flush_interval=3600).start()
+        for i in range(5):
+            binance_ws.handle_message({"s": symbol, "p": 10.0 + i, "E": DAY0 + i * 30_000})
+        await recorder.flush()
+        binance_ws.handle_message({"s": symbol, "p": 20.0, "E": DAY0 + 3 * MINUTE})
+        await recorder.stop()
+
+    asyncio.run(scenario())
+    ticks = store.read(symbol, TICK).columns()
+    assert ticks["price"].tolist() == [10.0, 11.0, 12.0, 13.0, 14.0, 20.0]
+    candles = store.read(symbol, "1m").columns()
+    assert candles["open_time"].tolist() == [DAY0, DAY0 + MINUTE, DAY0 + 2 * MINUTE]
+    assert candles["close"].tolist() == [11.0, 13.0, 14.0]
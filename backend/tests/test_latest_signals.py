@@ -0,0 +1,44 @@
+import asyncio
+from sqlalchemy import insert
+from app.models.trading import TradingSignal
+from app.services.trading_service import TradingService
+
+# (trade_id, title, is_close)；同一 trade_id 的多条记录里 id 最大的是最新的
+ROWS = [("a", "alpha", True), ("b", "beta", True), ("a", "alpha", False), ("c", "alpha", False),
+        ("b", "beta", False), ("d", "beta", True), ("c", "alpha", True), ("e", "alpha", False)]
+
+
+def expected(open_only=False, title=None):
+    latest = {}
+    for row_id, (trade_id, row_title, is_close) in enumerate(ROWS, start=1):
+        latest[trade_id] = (row_id, row_title, is_close)
+    return sorted((row_id for row_id, row_title, is_close in latest.values()
+                   if not (open_only and is_close) and (title is None or row_title == title)), reverse=True)
+
+
+async def all_pages(db, limit, **filters):
+    ids, after, pages = [], None, 0
+    while True:
+        signals, after = await TradingService.get_latest_signals(db, limit, after, **filters)
+        ids += [s.id for s in signals]
+        pages += 1
+        if after is None:
+            return ids, pages
+
+
+def test_pages_walk_the_latest_row_of_each_trade(new_session):
+    async def scenario():
+        async with new_session() as db:
+            await db.execute(insert(TradingSignal), [
+                {"trade_id": trade_id, "title": title, "is_close": is_close} for trade_id, title, is_close in ROWS])
+            await db.commit()
+
+            assert await all_pages(db, 2) == (expected(), 3)
+            assert await all_pages(db, 5) == (expected(), 1)
+            assert await all_pages(db, 1, open_only=True) == (expected(open_only=True), 3)
+            assert await all_pages(db, 10, title="alpha") == (expected(title="alpha"), 1)
+            assert (await all_pages(db, 2, open_only=True, title="beta"))[0] == expected(True, "beta")
+            # 不给 limit 时一次返回全部
+            assert await all_pages(db, None) == (expected(), 1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import random
+import pytest
+from sqlalchemy import insert
+from app.models.trading import TradingSignal
+from app.services.binance_ws import binance_ws
+from app.services.pnl_engine import PnlEngine
+from app.services.position_index import OpenPosition, position_index
+from app.services.trading_service import TradingService
+
+SYMBOLS = ["PNLAUSDT", "PNLBUSDT", "PNLCUSDT"]
+
+
+def make_positions(count):
+    rng = random.Random(7)
+    return {
+        f"p{i}": OpenPosition(i, f"p{i}", f"s{i % 4}", rng.choice(SYMBOLS), rng.choice(["buy", "sell"]),
+                              rng.uniform(50, 150), lever=rng.choice([None, 5, 20]))
+        for i in range(count)
+    }
+
+
+def expected(positions, prices):
+    """逐个仓位按平仓的盈亏口径计算"""
+    totals = {}
+    for p in positions.values():
+        profit = TradingService._close_values(p, prices[p.currentcy], None)['profit_percentage']
+        row = totals.setdefault(p.title, [0, 0.0, 0.0])
+        row[0] += 1
+        row[1] += profit
+        row[2] += profit * (p.lever or 1)
+    return totals
+
+
+def actual(engine):
+    return {row["strategy"]: [row["open"], row["pnl"], row["lever_pnl"]] for row in engine.snapshot()}
+
+
+def assert_close(got, want):
+    assert got.keys() == want.keys()
+    for title in want:
+        assert got[title][0] == want[title][0]
+        assert got[title][1:] == pytest.approx(want[title][1:], rel=1e-9, abs=1e-9)
+
+
+def test_ticks_revalue_positions_and_strategy_totals(monkeypatch):
+    positions = make_positions(500)
+    monkeypatch.setattr(position_index, "positions", dict(positions))
+    monkeypatch.setattr(position_index, "listeners", [])
+    prices = {symbol: 100.0 for symbol in SYMBOLS}
+    for symbol, price in prices.items():
+        binance_ws.handle_message({"s": symbol, "p": str(price)})
+
+    engine = PnlEngine()
+    engine._load()
+    position_index.add_listener(engine._on_position)
+    assert_close(actual(engine), expected(positions, prices))
+
+    for price in (101.5, 97.25, 120.0):
+        for symbol in SYMBOLS:
+            prices[symbol] = price * (1 + SYMBOLS.index(symbol) / 10)
+            binance_ws.prices[symbol] = prices[symbol]
+            engine.on_tick(symbol, prices[symbol])
+        assert_close(actual(engine), expected(positions, prices))
+
+    # 平掉 s3 的全部仓位、新开一个：下一次推送时 s3 归零
+    for trade_id in [t for t, p in positions.items() if p.title == "s3"]:
+        position_index.discard(trade_id)
+        del positions[trade_id]
+    new = OpenPosition(1000, "new", "s0", "PNLAUSDT", "sell", 90.0, lever=10)
+    position_index.positions["new"] = positions["new"] = new
+    position_index._notify("open", new)
+    engine.on_tick("PNLAUSDT", prices["PNLAUSDT"])
+    assert_close(actual(engine), expected(positions, prices))
+    assert engine.removed == {"s3"}
+
+
+class Client:
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, text):
+        self.frames.append(json.loads(text))
+
+    async def close(self):
+        pass
+
+
+def test_pushes_are_conflated_per_strategy(monkeypatch):
+    monkeypatch.setattr(position_index, "positions", make_positions(40))
+    monkeypatch.setattr(position_index, "listeners", [])
+
+    async def scenario():
+        engine = PnlEngine()
+        engine._load()
+        client = Client()
+        engine.register(client)
+        await asyncio.sleep(0.01)
+        initial = list(client.frames)
+        client.frames.clear()
+        for i in range(50):
+            engine.on_tick("PNLAUSDT", 100.0 + i)
+        engine.publish()
+        await asyncio.sleep(0.01)
+        engine.unregister(client)
+        return initial, client.frames, engine.snapshot()
+
+    initial, frames, snapshot = asyncio.run(scenario())
+    assert sorted(frame["strategy"] for frame in initial) == ["s0", "s1", "s2", "s3"]
+    # 50 个 tick 之后每个策略只推送一次，内容是最新的汇总
+    assert sorted(frame["strategy"] for frame in frames) == ["s0", "s1", "s2", "s3"]
+    assert {frame["strategy"]: frame["pnl"] for frame in frames} == {row["strategy"]: row["pnl"] for row in snapshot}
+
+
+def test_positions_opened_by_other_workers_are_valued(new_session, monkeypatch):
+    monkeypatch.setattr(position_index, "listeners", [])
+
+    async def scenario():
+        async with new_session() as db:
+            binance_ws.handle_message({"s": "PNLAUSDT", "p": "100"})
+            engine = PnlEngine()
+            engine._load()
+            position_index.add_listener(engine._on_position)
+            assert actual(engine) == {}
+
+            # 另一个 worker 提交的开仓：不经过本进程的索引，由 sync 从数据库拉取
+            await db.execute(insert(TradingSignal).values(trade_id="w1", title="remote", currentcy="PNLAUSDT",
+                                                          side="buy", open_price=80.0, is_close=False))
+            await db.commit()
+            await position_index.sync(db)
+            return actual(engine)
+
+    assert_close(asyncio.run(scenario()), {"remote": [1, 25.0, 25.0]})
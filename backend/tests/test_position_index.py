@@ -0,0 +1,98 @@
+import asyncio
+from sqlalchemy import event, update
+from app.models.trading import TradingSignal
+from app.schemas import TradingSignal as TradingSignalSchema
+from app.services.binance_ws import binance_ws
+from app.services.position_index import OpenPosition, OpenPositionIndex, position_index
+from app.services.trading_service import TradingService
+
+
+def open_signal(trade_id, title="alpha", side="buy"):
+    return TradingSignalSchema(is_close="0", trade_id=trade_id, title=title, currentcy="BTCUSDT", side=side)
+
+
+def close_signal(trade_id):
+    return TradingSignalSchema(is_close="1", trade_id=trade_id)
+
+
+async def submit(db, signal, price):
+    binance_ws.handle_message({"s": "BTCUSDT", "p": str(price)})
+    return await TradingService.create_signal(db, signal)
+
+
+def test_close_needs_no_select_and_keeps_index_consistent(new_session):
+    async def scenario():
+        async with new_session() as db:
+            await submit(db, open_signal("t1"), 100)
+            await submit(db, open_signal("t2"), 100)
+            await submit(db, close_signal("t1"), 110)
+            assert set(position_index.positions) == {"t2"}
+
+            statements = []
+            event.listen(db.bind.sync_engine, "before_cursor_execute",
+                         lambda conn, cursor, sql, *args: statements.append(sql.split()[0]))
+            closed = await submit(db, close_signal("t2"), 120)
+            # 条件平仓 UPDATE + 策略状态 upsert + 日汇总 upsert + 回写连胜/连亏，没有任何 SELECT
+            assert statements == ["UPDATE", "INSERT", "INSERT", "UPDATE"]
+            assert (closed.is_close, closed.close_price, closed.win_streak, closed.lose_streak) == (True, 120.0, 2, 0)
+            assert position_index.positions == {}
+            assert not any((await position_index.verify(db)).values())
+
+    asyncio.run(scenario())
+
+
+def test_rollback_discards_staged_changes(new_session):
+    async def scenario():
+        async with new_session() as db:
+            row = TradingSignal(trade_id="t1", title="alpha", currentcy="BTCUSDT", is_close=False)
+            db.add(row)
+            await db.flush()
+            position_index.stage_open(db, OpenPosition.from_row(row))
+            await db.rollback()
+            assert position_index.positions == {}
+            assert not any((await position_index.verify(db)).values())
+
+    asyncio.run(scenario())
+
+
+def test_out_of_band_close_is_detected_and_falls_back(new_session):
+    async def scenario():
+        async with new_session() as db:
+            await submit(db, open_signal("t1"), 100)
+            await db.execute(update(TradingSignal).where(TradingSignal.trade_id == "t1").values(is_close=True))
+            await db.commit()
+            assert (await position_index.verify(db))["extra"] == ["t1"]
+
+            # 索引里的记录已被平仓：UPDATE 没有命中，移除索引后回退到数据库，没有其它未平仓记录
+            assert await submit(db, close_signal("t1"), 90) is None
+            assert position_index.positions == {}
+
+    asyncio.run(scenario())
+
+
+def test_other_workers_changes_are_synced_from_the_database(new_session):
+    async def scenario():
+        async with new_session() as db:
+            await submit(db, open_signal("t1"), 100)
+            # 另一个 worker 的索引：本进程的提交只通过数据库传给它
+            other = OpenPositionIndex()
+            await other.load(db)
+            events = []
+            other.add_listener(lambda event, position: events.append((event, position and position.trade_id)))
+
+            await submit(db, open_signal("t2"), 100)
+            await submit(db, open_signal("t3"), 100)
+            await submit(db, close_signal("t3"), 110)
+            assert await other.sync(db) == 1
+            assert sorted(other.positions) == ["t1", "t2"]
+
+            await submit(db, close_signal("t1"), 120)
+            assert await other.sync(db) == 1
+            # 回看窗口内重复看到的记录不再产生变化
+            assert await other.sync(db) == 0
+            assert sorted(other.positions) == ["t2"]
+            assert not any((await other.verify(db)).values())
+            return events
+
+    events = asyncio.run(scenario())
+    assert events == [("open", "t2"), ("close", "t1")]
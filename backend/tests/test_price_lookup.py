@@ -0,0 +1,54 @@
+import asyncio
+from app.services.binance_ws import BinanceWebSocket
+from app.services.monitor_service import MonitorService
+
+
+def new_feed():
+    feed = BinanceWebSocket()
+    feed.upstream.subscribe = lambda streams: feed.requested.extend(streams)
+    feed.requested = []
+    return feed
+
+
+def counter(metric):
+    return metric._value.get()
+
+
+def test_fresh_price_returns_immediately():
+    async def scenario():
+        feed = new_feed()
+        feed.handle_message({"s": "BTCUSDT", "p": "52000"})
+        return await feed.wait_for_price("btc", max_age=5, timeout=0.01)
+
+    assert asyncio.run(scenario()) == 52000.0
+
+
+def test_missing_price_subscribes_and_waits_for_first_tick():
+    async def scenario():
+        feed = new_feed()
+        missing_before = counter(MonitorService.price_missing_total)
+        lookup = asyncio.create_task(feed.wait_for_price("SUI", timeout=1))
+        await asyncio.sleep(0.01)
+        feed.handle_message({"s": "SUIUSDT", "p": "1.25"})
+        price = await lookup
+        return feed, price, counter(MonitorService.price_missing_total) - missing_before
+
+    feed, price, missing = asyncio.run(scenario())
+    assert price == 1.25
+    assert missing == 1
+    assert feed.requested == ["suiusdt@markPrice@1s"]
+    assert feed._price_waiters == {}
+
+
+def test_stale_price_is_returned_after_deadline():
+    async def scenario():
+        feed = new_feed()
+        feed.handle_message({"s": "ETHUSDT", "p": "3200"})
+        feed.price_times["ETHUSDT"] -= 60
+        stale_before = counter(MonitorService.price_stale_total)
+        timeouts_before = counter(MonitorService.price_wait_timeouts_total)
+        price = await feed.wait_for_price("ETHUSDT", max_age=5, timeout=0.05)
+        return (price, counter(MonitorService.price_stale_total) - stale_before,
+                counter(MonitorService.price_wait_timeouts_total) - timeouts_before)
+
+    assert asyncio.run(scenario()) == (3200.0, 1, 1)
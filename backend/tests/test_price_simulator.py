@@ -0,0 +1,47 @@
+import asyncio
+import json
+import numpy as np
+from app.services.binance_ws import BinanceWebSocket
+from app.services.price_simulator import PriceSimulator, load_params
+
+
+def test_params_from_json_and_synthetic_symbols(tmp_path):
+    path = tmp_path / "sim.json"
+    path.write_text(json.dumps({"btcusdt": {"vol": 2.0}, "DOGEUSDT": {"start": 0.1, "low": 0.05, "high": 0.2}}))
+    params = load_params(str(path), synthetic=3)
+    assert params["BTCUSDT"]["vol"] == 2.0 and params["BTCUSDT"]["start"] == 52000.0
+    assert params["DOGEUSDT"]["start"] == 0.1
+    assert [s for s in params if s.startswith("SIM")] == ["SIM00000USDT", "SIM00001USDT", "SIM00002USDT"]
+
+
+def test_batch_step_stays_within_bounds_and_is_reproducible():
+    params = load_params(path="", synthetic=2000)
+    runs = []
+    for _ in range(2):
+        simulator = PriceSimulator(params, model="regime", switch_prob=0.2, seed=7)
+        for _ in range(200):
+            # 放大步长让价格频繁触及边界
+            prices = simulator.step(dt=86400)
+        runs.append(prices.copy())
+        assert np.all(prices >= np.exp(simulator.log_low) * (1 - 1e-12))
+        assert np.all(prices <= np.exp(simulator.log_high) * (1 + 1e-12))
+    assert np.array_equal(runs[0], runs[1])
+    assert len(np.unique(runs[0])) > 1000
+
+
+def test_run_pushes_through_the_ingest_path():
+    async def scenario():
+        feed = BinanceWebSocket()
+        seen = []
+        feed.add_price_callback("*", lambda symbol, price: seen.append(symbol))
+        simulator = PriceSimulator(load_params(path="", synthetic=50), model="gbm", tick_rate=100, seed=1,
+                                   yield_every=16)
+        await simulator.run(feed, steps=3)
+        await asyncio.sleep(0)
+        return feed, simulator, seen
+
+    feed, simulator, seen = asyncio.run(scenario())
+    assert set(feed.prices) == set(simulator.symbols)
+    assert feed.prices["SIM00049USDT"] == simulator.prices[-1]
+    assert len(feed.ticks.get("BTCUSDT").since()) == 3
+    assert len(seen) == 3 * len(simulator.symbols)
@@ -0,0 +1,148 @@
+import asyncio
+import multiprocessing
+import time
+from app.config import settings
+from app.services.binance_ws import BinanceWebSocket
+from app.services.price_table import HEADER_SIZE, SEQ, SLOT_SIZE, SharedPriceFollower, SharedPriceTable
+
+
+def test_owner_lock_is_exclusive(tmp_path):
+    path = str(tmp_path / "prices")
+    first, second = SharedPriceTable(path, capacity=8), SharedPriceTable(path, capacity=8)
+    assert first.try_acquire_owner()
+    assert not second.try_acquire_owner()
+    first.close()
+    assert second.try_acquire_owner()
+    second.close()
+
+
+def test_follower_sees_owner_writes_and_requests(tmp_path):
+    path = str(tmp_path / "prices")
+    owner, reader = SharedPriceTable(path, capacity=8), SharedPriceTable(path, capacity=8)
+    owner.try_acquire_owner()
+    owner.write("BTCUSDT", 52000.0, 1700000000.5, 1700000000400)
+    assert reader.read("BTCUSDT") == (52000.0, 1700000000.5)
+    assert reader.read("ETHUSDT") is None
+
+    seen = []
+    follower = SharedPriceFollower(reader, lambda *tick: seen.append(tick))
+    assert follower.poll() == 1
+    assert follower.poll() == 0
+    owner.write("BTCUSDT", 52001.0, 1700000001.5, 1700000001400)
+    follower.poll()
+    assert seen == [("BTCUSDT", 52000.0, 1700000000.5, 1700000000400),
+                    ("BTCUSDT", 52001.0, 1700000001.5, 1700000001400)]
+
+    reader.request("SUIUSDT")
+    assert owner.take_requests() == ["SUIUSDT"]
+    assert owner.take_requests() == []
+    owner.close()
+    reader.close()
+
+
+def _writer(path, stop):
+    table = SharedPriceTable(path, capacity=8)
+    table.try_acquire_owner()
+    i = 0
+    while not stop.is_set():
+        i += 1
+        table.write("BTCUSDT", float(i), float(i), i)
+    table.close()
+
+
+def test_reads_are_consistent_under_concurrent_writes(tmp_path):
+    path = str(tmp_path / "prices")
+    reader = SharedPriceTable(path, capacity=8)
+    ctx = multiprocessing.get_context("fork")
+    stop = ctx.Event()
+    writer = ctx.Process(target=_writer, args=(path, stop))
+    writer.start()
+    try:
+        deadline = time.monotonic() + 5
+        while reader.read("BTCUSDT") is None and time.monotonic() < deadline:
+            time.sleep(0.001)
+        slot = reader.slot_of("BTCUSDT")
+        for _ in range(20000):
+            _, price, received_at, event_ts = reader._read_slot(slot)
+            assert price == received_at == float(event_ts)
+    finally:
+        stop.set()
+        writer.join()
+    reader.close()
+
+
+def test_slot_left_mid_write_does_not_hang_readers(tmp_path):
+    path = str(tmp_path / "prices")
+    owner = SharedPriceTable(path, capacity=8)
+    assert owner.try_acquire_owner()
+    owner.write("BTCUSDT", 100.0, 1.0, 1)
+    follower = SharedPriceTable(path, capacity=8)
+    versions = []
+    assert follower.changed_since(versions) == [("BTCUSDT", 100.0, 1.0, 1)]
+
+    # 所有者在两次写 seq 之间退出：槽位停在奇数
+    slot = owner.slot_of("BTCUSDT")
+    offset = HEADER_SIZE + slot * SLOT_SIZE
+    SEQ.pack_into(owner.mm, offset, SEQ.unpack_from(owner.mm, offset)[0] + 1)
+    owner.close()
+    assert follower.read("BTCUSDT") is None
+    assert follower.changed_since(versions) == []
+
+    # 新的所有者接管后继续写入，读者恢复
+    successor = SharedPriceTable(path, capacity=8)
+    assert successor.try_acquire_owner()
+    successor.write("BTCUSDT", 101.0, 2.0, 2)
+    assert follower.read("BTCUSDT") == (101.0, 2.0)
+    assert follower.changed_since(versions) == [("BTCUSDT", 101.0, 2.0, 2)]
+    successor.close()
+    follower.close()
+
+
+def test_follower_worker_uses_owner_prices(tmp_path):
+    path = str(tmp_path / "prices")
+    owner, follower = BinanceWebSocket(), BinanceWebSocket()
+    owner.shared_table = SharedPriceTable(path, capacity=16)
+    owner.shared_table.try_acquire_owner()
+    follower.shared_table = SharedPriceTable(path, capacity=16)
+
+    owner.handle_message({"s": "BTCUSDT", "p": "52000", "E": 1700000000000})
+    assert follower.get_current_price("btc") == 52000.0
+    SharedPriceFollower(follower.shared_table, follower._apply_shared_price).poll()
+    assert follower.prices == {"BTCUSDT": 52000.0}
+    assert follower.price_times["BTCUSDT"] == owner.price_times["BTCUSDT"]
+
+    asyncio.run(follower.subscribe_symbol("suiusdt"))
+    assert owner.shared_table.take_requests() == ["SUIUSDT"]
+    owner.shared_table.close()
+    follower.shared_table.close()
+
+
+def test_owner_callbacks_run_only_after_taking_over_the_feed(tmp_path, monkeypatch):
+    path = str(tmp_path / "prices")
+    monkeypatch.setattr(settings, "PRICE_TABLE_PATH", path)
+    monkeypatch.setattr(settings, "PRICE_TABLE_TAKEOVER_INTERVAL", 0.05)
+    owner = SharedPriceTable(path)
+    owner.try_acquire_owner()
+    worker, calls = BinanceWebSocket(), []
+
+    async def feed():
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(worker, "_run_feed", feed)
+    worker.on_feed_owner(lambda: calls.append("early"))
+
+    async def scenario():
+        task = asyncio.create_task(worker.start())
+        await asyncio.sleep(0.2)
+        # 跟随者不触发回调
+        assert calls == [] and not worker.owns_feed
+        owner.close()
+        await asyncio.sleep(0.2)
+        assert calls == ["early"] and worker.owns_feed
+        # 已是所有者时注册的回调立即调用
+        worker.on_feed_owner(lambda: calls.append("late"))
+        assert calls == ["early", "late"]
+        task.cancel()
+        await worker.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,198 @@
+import asyncio
+import os
+import sqlite3
+import time
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app.models.trading import Base, TradingSignal
+from app.schemas import TradingSignal as TradingSignalSchema
+from app.services.binance_ws import binance_ws
+from app.services.position_index import position_index
+from app.services.trading_service import TradingService
+
+# 默认 100 万行；本地快速运行可以调小，例如 QUERY_PLAN_ROWS=100000
+ROWS = int(os.environ.get("QUERY_PLAN_ROWS", 1_000_000))
+TITLES = 1000
+
+# 每 30 秒一条开仓，10 分钟后平仓；每 20 条留一条未平仓（约 5%）
+SEED = f"""
+WITH RECURSIVE seq(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM seq WHERE x < {ROWS})
+INSERT INTO trading_signals (trade_id, title, currentcy, side, is_close, created_at, closed_at,
+                             open_price, close_price, profit_percentage, is_profit, win_streak, lose_streak)
+SELECT 't' || x, 's' || (x % {TITLES}), 'BTCUSDT', 'buy', x % 20 != 0,
+       datetime('2026-01-01', '+' || (x * 30) || ' seconds') || '.000000',
+       CASE WHEN x % 20 != 0 THEN datetime('2026-01-01', '+' || (x * 30 + 600) || ' seconds') || '.000000' END,
+       100.0,
+       CASE WHEN x % 20 != 0 THEN 100.0 + x % 7 - 3 END,
+       CASE WHEN x % 20 != 0 THEN x % 7 - 3.0 END,
+       CASE WHEN x % 20 != 0 THEN x % 7 > 3 END,
+       0, 0
+FROM seq
+"""
+
+# 日汇总按平仓日期从种子数据一次性生成（与 backfill 的结果一致）
+SEED_DAILY = """
+INSERT INTO strategy_daily_stats (day, title, close_count, win_count, lose_count, total_profit)
+SELECT date(closed_at), title, count(*), sum(is_profit = 1), sum(is_profit IS NOT 1), sum(coalesce(profit_percentage, 0))
+FROM trading_signals WHERE is_close = 1 AND title IS NOT NULL
+GROUP BY date(closed_at), title
+"""
+
+
+@pytest.fixture(scope="module")
+def db_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("plans") / "signals.sqlite")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    indexes = list(TradingSignal.__table__.indexes)
+    # 先删索引再灌数据，最后重建索引，比逐行维护索引快得多
+    for index in indexes:
+        index.drop(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(SEED)
+        conn.exec_driver_sql(SEED_DAILY)
+    for index in indexes:
+        index.create(engine)
+    engine.dispose()
+    return path
+
+
+def explain(path, sql, params):
+    with sqlite3.connect(path) as conn:
+        return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def run_service(path, call):
+    """执行一次服务调用，返回 (结果, 耗时, 访问 trading_signals 的语句及其查询计划)"""
+    statements = []
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        event.listen(engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, sql, params, context, many:
+                     statements.append((sql, params[0] if many else params)))
+        try:
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                started = time.perf_counter()
+                result = await call(db)
+                return result, time.perf_counter() - started
+        finally:
+            await engine.dispose()
+
+    result, elapsed = asyncio.run(scenario())
+    plans = [(sql, explain(path, sql, params)) for sql, params in statements
+             if ("trading_signals" in sql or "strategy_daily_stats" in sql) and not sql.startswith("INSERT")]
+    return result, elapsed, plans
+
+
+def assert_indexed(plans, *expected_indexes, walk=False):
+    """每条语句对 trading_signals 的访问都走索引（不允许无索引的全表扫描），并且用到了预期的索引
+
+    expected_indexes 的元素可以是索引名的元组，表示其中任意一个即可。walk=True 时允许沿主键顺序
+    扫描（由 LIMIT 截断，代价与页大小相关），但不允许额外排序。
+    """
+    assert plans
+    details = [detail for _, plan in plans for detail in plan]
+    for sql, plan in plans:
+        for detail in plan:
+            if walk:
+                assert "TEMP B-TREE" not in detail, f"sort: {detail}\n{sql}"
+                if detail == "SCAN trading_signals":
+                    continue
+            assert detail not in ("SCAN trading_signals", "SCAN strategy_daily_stats"), \
+                f"full table scan: {detail}\n{sql}"
+    for names in expected_indexes:
+        names = names if isinstance(names, tuple) else (names,)
+        assert any(name in detail for detail in details for name in names), (names, details)
+
+
+def test_position_index_load_scans_only_open_rows(db_path):
+    async def load(db):
+        await position_index.load(db)
+        return len(position_index.positions)
+
+    count, elapsed, plans = run_service(db_path, load)
+    assert count == ROWS // 20
+    assert_indexed(plans, "ix_trading_signals_open_trade_id")
+    assert elapsed < 2.0
+
+
+def test_close_fallback_finds_the_open_row_by_trade_id(db_path):
+    binance_ws.handle_message({"s": "BTCUSDT", "p": "101"})
+
+    async def close(db):
+        position_index.discard("t40")  # 索引未命中，走数据库回退查询
+        return await TradingService.create_signal(db, TradingSignalSchema(is_close="1", trade_id="t40"))
+
+    closed, elapsed, plans = run_service(db_path, close)
+    assert (closed.trade_id, closed.is_close, closed.close_price) == ("t40", True, 101.0)
+    assert_indexed(plans, ("ix_trading_signals_open_trade_id", "ix_trading_signals_trade_id"))
+    assert elapsed < 0.1
+
+
+def test_batch_locks_open_rows_by_trade_id(db_path):
+    binance_ws.handle_message({"s": "BTCUSDT", "p": "101"})
+    signals = [TradingSignalSchema(is_close="1", trade_id=f"t{i}") for i in range(60, 1060, 20)]
+
+    results, elapsed, plans = run_service(db_path, lambda db: TradingService.create_signals_batch(db, signals))
+    assert {r["status"] for r in results} == {"closed"}
+    assert_indexed(plans, ("ix_trading_signals_open_trade_id", "ix_trading_signals_trade_id"))
+    assert elapsed < 0.2
+
+
+def test_strategy_history_reads_closed_rows_by_title(db_path):
+    signals, elapsed, plans = run_service(db_path, lambda db: TradingService.get_strategy_history(db, "s7"))
+    assert len(signals) >= ROWS // TITLES * 19 // 20
+    assert all(s.title == "s7" and s.is_close for s in signals)
+    assert_indexed(plans, "ix_trading_signals_closed_title")
+    assert elapsed < 0.5
+
+
+def closed_totals(path, start, end):
+    """直接在明细上统计，作为对照"""
+    with sqlite3.connect(path) as conn:
+        return conn.execute(
+            "SELECT count(*), sum(is_profit = 1), round(sum(profit_percentage), 6) FROM trading_signals "
+            "WHERE is_close = 1 AND title IS NOT NULL AND closed_at >= ? AND closed_at <= ?",
+            (f"{start:%Y-%m-%d %H:%M:%S}.000000", f"{end:%Y-%m-%d %H:%M:%S}.000000")).fetchone()
+
+
+@pytest.mark.parametrize("start, end", [
+    (datetime(2026, 1, 2, 6), datetime(2026, 1, 3, 18)),  # 不足整天，只读明细
+    (datetime(2026, 1, 2, 6), datetime(2026, 4, 2, 18)),  # 90 天：整天读日汇总，首尾读明细
+])
+def test_timerange_statistics_are_aggregated_in_the_database(db_path, start, end):
+    stats, elapsed, plans = run_service(
+        db_path, lambda db: TradingService.get_closed_signals_by_timerange(db, start, end))
+    totals = (sum(s["close_count"] for s in stats), sum(s["win_count"] for s in stats),
+              round(sum(s["total_profit"] for s in stats), 6))
+    assert totals == closed_totals(db_path, start, end)
+    assert len(stats) == TITLES * 19 // 20 and "records" not in stats[0]  # 每 20 个策略里有 1 个从不平仓
+    assert_indexed(plans, "ix_trading_signals_closed_at")
+    assert elapsed < 0.5
+
+
+def test_timerange_records_are_paginated_per_strategy(db_path):
+    start, end = datetime(2026, 1, 2), datetime(2026, 4, 2)
+    stats, elapsed, plans = run_service(db_path, lambda db: TradingService.get_closed_signals_by_timerange(
+        db, start, end, include_records=True, records_limit=5))
+    assert {len(s["records"]) for s in stats} == {5}
+    assert all(s["records_next"] for s in stats)
+
+    first = next(s for s in stats if s["title"] == "s7")
+    [page], _, _ = run_service(db_path, lambda db: TradingService.get_closed_signals_by_timerange(
+        db, start, end, title="s7", include_records=True, records_limit=5, records_after=first["records_next"]))
+    closed = [r["closed_at"] for r in first["records"] + page["records"]]
+    assert closed == sorted(closed, reverse=True) and len(set(closed)) == 10
+
+@pytest.mark.parametrize("filters", [{}, {"after": ROWS // 2}, {"open_only": True}, {"title": "s7"}])
+def test_latest_signals_page_cost_does_not_grow_with_the_table(db_path, filters):
+    (signals, next_cursor), elapsed, plans = run_service(
+        db_path, lambda db: TradingService.get_latest_signals(db, 100, **filters))
+    assert len(signals) == 100 and next_cursor == signals[-1].id
+    assert_indexed(plans, "ix_trading_signals_trade_id", walk=True)
+    if "title" in filters:
+        assert_indexed(plans, "ix_trading_signals_title")
+    assert elapsed < 0.1
@@ -0,0 +1,87 @@
+import asyncio
+from sqlalchemy import event, select
+from app.models.trading import StrategyDailyStats, StrategyState, TradingSignal
+from app.schemas import TradingSignal as TradingSignalSchema
+from app.services.binance_ws import binance_ws
+from app.services.position_index import position_index
+from app.services.trading_service import TradingService
+
+
+def set_prices(btc, eth):
+    binance_ws.handle_message({"s": "BTCUSDT", "p": str(btc)})
+    binance_ws.handle_message({"s": "ETHUSDT", "p": str(eth)})
+
+
+def opened(trade_id, title, currentcy="BTCUSDT", side="buy", lever=None):
+    return TradingSignalSchema(is_close="0", trade_id=trade_id, title=title, currentcy=currentcy, side=side, lever=lever)
+
+
+def closed(trade_id):
+    return TradingSignalSchema(is_close="1", trade_id=trade_id)
+
+
+BATCH = [
+    opened("n1", "alpha"), closed("e1"), closed("n1"), opened("n2", "beta", "ETHUSDT", side="sell"),
+    closed("zz"), opened("bad", "alpha", lever="x"), closed("e2"), opened("n3", "alpha"), closed("n2"),
+]
+
+
+async def seed(db):
+    set_prices(100, 2000)
+    for signal in (opened("e1", "alpha"), opened("e2", "beta", "ETHUSDT")):
+        await TradingService.create_signal(db, signal)
+    set_prices(110, 1900)
+
+
+async def table_state(db):
+    db.expire_all()
+    signals = sorted((s.trade_id, s.is_close, s.open_price, s.close_price, s.profit_percentage, s.is_profit,
+                      s.win_streak, s.lose_streak, s.side) for s in await db.scalars(select(TradingSignal)))
+    states = sorted((s.title, s.win_streak, s.lose_streak, s.trade_count, s.win_count, s.loss_count,
+                     round(s.total_profit, 9), round(s.peak_profit, 9), s.last_is_profit)
+                    for s in await db.scalars(select(StrategyState)))
+    daily = sorted((d.day, d.title, d.close_count, d.win_count, d.lose_count, round(d.total_profit, 9))
+                   for d in await db.scalars(select(StrategyDailyStats)))
+    return signals, states, daily, sorted(position_index.positions)
+
+
+def test_batch_matches_sequential_processing(new_session):
+    async def scenario():
+        async with new_session() as sequential:
+            await seed(sequential)
+            for signal in BATCH:
+                try:
+                    await TradingService.create_signal(sequential, signal)
+                except ValueError:
+                    pass
+            expected = await table_state(sequential)
+
+        async with new_session() as batched:
+            await seed(batched)
+            results = await TradingService.create_signals_batch(batched, BATCH)
+            assert [r["status"] for r in results] == [
+                "opened", "closed", "closed", "opened", "not_found", "error", "closed", "opened", "closed"]
+            assert results[0]["id"] == results[2]["id"]
+            assert (results[1]["win_streak"], results[2]["lose_streak"], results[8]["lose_streak"]) == (1, 1, 2)
+            assert await table_state(batched) == expected
+            assert sorted(position_index.positions) == ["n3"]
+
+    asyncio.run(scenario())
+
+
+def test_batch_uses_a_constant_number_of_statements(new_session):
+    async def scenario():
+        async with new_session() as db:
+            await seed(db)
+            statements = []
+            event.listen(db.bind.sync_engine, "before_cursor_execute",
+                         lambda conn, cursor, sql, *args: statements.append(sql))
+            signals = [opened(f"o{i}", f"s{i % 3}") for i in range(50)] + [closed(f"o{i}") for i in range(0, 50, 2)]
+            signals += [closed("e1"), closed("e2")]
+            await TradingService.create_signals_batch(db, signals)
+            # SQLite 不支持按参数顺序返回 id 的多行 INSERT，会逐行插入（PostgreSQL 上是一条）；
+            # 其余为：加锁查询持仓、策略状态 upsert + 加锁查询、平仓批量 UPDATE、策略状态批量 UPDATE、日汇总 upsert
+            other = [sql for sql in statements if not sql.startswith("INSERT INTO trading_signals")]
+            assert len(other) == 6
+
+    asyncio.run(scenario())
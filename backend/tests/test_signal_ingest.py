@@ -0,0 +1,301 @@
+import asyncio
+import json
+import os
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.config import settings
+from app.models.trading import Base, IngestCheckpoint, TradingSignal
+from app.schemas import TradingSignal as TradingSignalSchema
+from app.services.binance_ws import binance_ws
+from app.services.position_index import position_index
+from app.services.signal_ingest import UNRESOLVED, JournalEntry, SignalIngest
+from app.services.trading_service import TradingService, china_now
+
+
+def set_price(price):
+    binance_ws.handle_message({"s": "INGESTUSDT", "p": str(price)})
+
+
+def opened(trade_id):
+    return TradingSignalSchema(is_close="0", trade_id=trade_id, title="ingest", currentcy="INGESTUSDT", side="buy")
+
+
+def closed(trade_id):
+    return TradingSignalSchema(is_close="1", trade_id=trade_id)
+
+
+async def make_factory(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/ingest.sqlite")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with factory() as db:
+        await position_index.load(db)
+    return engine, factory
+
+
+async def wait_applied(ingest, seq):
+    for _ in range(500):
+        if ingest.applied_seq >= seq:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"seq {seq} not applied")
+
+
+async def rows(factory):
+    async with factory() as db:
+        return [(s.trade_id, s.is_close, s.open_price, s.close_price)
+                for s in await db.scalars(select(TradingSignal).order_by(TradingSignal.id))]
+
+
+def test_signals_are_applied_in_order_with_prices_at_receive_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_COMMIT_WINDOW", 0.2)
+
+    async def scenario():
+        engine, factory = await make_factory(tmp_path)
+        ingest = SignalIngest()
+        await ingest.start(factory, str(tmp_path / "journal"))
+        try:
+            set_price(100)
+            first = await ingest.submit(opened("a"))
+            set_price(110)
+            # 开仓尚未入库，平仓的交易对来自日志里待写入的开仓
+            second = await ingest.submit(closed("a"))
+            set_price(999)
+            assert (first, second) == (1, 2)
+            assert ingest.status(second)["status"] == "pending"
+            await wait_applied(ingest, second)
+            return await rows(factory), ingest.status(first), ingest.status(second), ingest.status(3)
+        finally:
+            await ingest.stop()
+            await engine.dispose()
+
+    table, first, second, unknown = asyncio.run(scenario())
+    assert table == [("a", True, 100.0, 110.0)]
+    assert first["status"] == "applied" and first["result"]["status"] == "opened"
+    assert second["result"]["status"] == "closed"
+    assert unknown is None
+
+
+def test_restart_replays_only_unapplied_signals(tmp_path, monkeypatch):
+    journal_dir = str(tmp_path / "journal")
+
+    async def scenario():
+        engine, factory = await make_factory(tmp_path)
+        try:
+            # 第一次：写入日志后在后台提交之前退出
+            monkeypatch.setattr(settings, "INGEST_COMMIT_WINDOW", 60)
+            ingest = SignalIngest()
+            await ingest.start(factory, journal_dir)
+            set_price(200)
+            await ingest.submit(opened("b"))
+            set_price(220)
+            await ingest.submit(closed("b"))
+            await ingest.stop()
+            with open(ingest.journal.path, "ab") as f:
+                f.write(b'3 0000abcd {"t": "2026')  # 写了一半的尾行
+            assert await rows(factory) == []
+
+            # 第二次：重放日志
+            monkeypatch.setattr(settings, "INGEST_COMMIT_WINDOW", 0)
+            set_price(500)
+            ingest = SignalIngest()
+            await ingest.start(factory, journal_dir)
+            await wait_applied(ingest, 2)
+            seq = await ingest.submit(opened("c"))
+            await wait_applied(ingest, seq)
+            await ingest.stop()
+
+            # 第三次：检查点之前的记录不再写入
+            ingest = SignalIngest()
+            await ingest.start(factory, journal_dir)
+            replayed = len(ingest.pending)
+            await ingest.stop()
+            async with factory() as db:
+                checkpoint = await db.scalar(select(IngestCheckpoint.seq))
+            return seq, replayed, checkpoint, await rows(factory)
+        finally:
+            await engine.dispose()
+
+    seq, replayed, checkpoint, table = asyncio.run(scenario())
+    assert seq == 3
+    assert replayed == 0
+    assert checkpoint == 3
+    assert table == [("b", True, 200.0, 220.0), ("c", False, 500.0, None)]
+
+
+def test_workers_share_one_journal_in_confirmation_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_COMMIT_WINDOW", 0)
+    monkeypatch.setattr(settings, "INGEST_TAKEOVER_INTERVAL", 0.05)
+    journal_dir = str(tmp_path / "journal")
+
+    async def scenario():
+        engine, factory = await make_factory(tmp_path)
+        first, second = SignalIngest(), SignalIngest()
+        try:
+            await first.start(factory, journal_dir)
+            await second.start(factory, journal_dir)
+            assert (first.is_applier, second.is_applier) == (True, False)
+            # 开仓由不写库的 worker 确认，平仓紧接着由另一个 worker 确认：平仓不能先于开仓入库
+            set_price(100)
+            opened_seq = await second.submit(opened("w"))
+            set_price(120)
+            closed_seq = await first.submit(closed("w"))
+            await wait_applied(first, closed_seq)
+            table = await rows(factory)
+
+            # 写库的 worker 退出后由另一个接管
+            await first.stop()
+            seq = await second.submit(opened("v"))
+            await wait_applied(second, seq)
+            return (opened_seq, closed_seq, seq), table, await rows(factory), second.is_applier
+        finally:
+            await first.stop()
+            await second.stop()
+            await engine.dispose()
+
+    seqs, table, after_takeover, took_over = asyncio.run(scenario())
+    assert seqs == (1, 2, 3)
+    assert table == [("w", True, 100.0, 120.0)]
+    assert took_over and after_takeover[-1] == ("v", False, 120.0, None)
+
+
+def test_poison_signal_is_dead_lettered_without_blocking_the_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_COMMIT_WINDOW", 0.1)
+    monkeypatch.setattr(settings, "INGEST_RETRY_DELAY", 0.01)
+    monkeypatch.setattr(settings, "INGEST_MAX_ATTEMPTS", 2)
+    create_signals_batch = TradingService.create_signals_batch
+
+    async def failing_batch(db, signals, *args, **kwargs):
+        if any(signal.trade_id == "poison" for signal in signals):
+            raise RuntimeError("cannot write poison")
+        return await create_signals_batch(db, signals, *args, **kwargs)
+
+    monkeypatch.setattr(TradingService, "create_signals_batch", failing_batch)
+
+    async def scenario():
+        engine, factory = await make_factory(tmp_path)
+        ingest = SignalIngest()
+        await ingest.start(factory, str(tmp_path / "journal"))
+        try:
+            set_price(100)
+            seqs = await asyncio.gather(*(ingest.submit(opened(trade_id)) for trade_id in ("p1", "poison", "p2")))
+            await wait_applied(ingest, max(seqs))
+            with open(ingest.journal.dead_letter_path) as f:
+                dead = [json.loads(line) for line in f]
+            return await rows(factory), [ingest.status(seq)["result"]["status"] for seq in seqs], dead
+        finally:
+            await ingest.stop()
+            await engine.dispose()
+
+    table, statuses, dead = asyncio.run(scenario())
+    assert sorted(row[0] for row in table) == ["p1", "p2"]
+    assert statuses == ["opened", "dead_letter", "opened"]
+    assert [record["seq"] for record in dead] == [2] and "cannot write poison" in dead[0]["error"]
+
+
+def test_corrupt_record_is_skipped_not_truncated(tmp_path, monkeypatch):
+    journal_dir = str(tmp_path / "journal")
+
+    async def scenario():
+        engine, factory = await make_factory(tmp_path)
+        try:
+            monkeypatch.setattr(settings, "INGEST_COMMIT_WINDOW", 60)
+            ingest = SignalIngest()
+            await ingest.start(factory, journal_dir)
+            set_price(300)
+            for trade_id in ("k1", "k2", "k3"):
+                await ingest.submit(opened(trade_id))
+            await ingest.stop()
+            with open(ingest.journal.path, "rb") as f:
+                lines = f.readlines()
+            lines[1] = lines[1].replace(b'"k2"', b'"kX"')  # crc 不再匹配
+            with open(ingest.journal.path, "wb") as f:
+                f.writelines(lines)
+
+            monkeypatch.setattr(settings, "INGEST_COMMIT_WINDOW", 0)
+            ingest = SignalIngest()
+            await ingest.start(factory, journal_dir)
+            await wait_applied(ingest, 3)
+            await ingest.stop()
+            return await rows(factory), os.path.exists(ingest.journal.dead_letter_path)
+        finally:
+            await engine.dispose()
+
+    table, dead_lettered = asyncio.run(scenario())
+    assert [row[0] for row in table] == ["k1", "k3"]
+    assert dead_lettered
+
+
+def test_close_on_another_worker_carries_the_pending_opens_symbol_and_price(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_COMMIT_WINDOW", 60)
+    journal_dir = str(tmp_path / "journal")
+
+    async def scenario():
+        engine, factory = await make_factory(tmp_path)
+        try:
+            first, second = SignalIngest(), SignalIngest()
+            await first.start(factory, journal_dir)
+            await second.start(factory, journal_dir)
+            # 开仓还在写库的 worker 的队列里，平仓由另一个 worker 接收
+            set_price(100)
+            await first.submit(opened("x"))
+            set_price(130)
+            await second.submit(closed("x"))
+            await first.stop()
+            await second.stop()
+            with open(first.journal.path, "rb") as f:
+                entries = [(entry.symbol, entry.prices) for entry in map(JournalEntry.decode, f)]
+
+            # 重放时价格已经变了，也没有接收时刻的行情，仍按日志里的价格写入
+            monkeypatch.setattr(settings, "INGEST_COMMIT_WINDOW", 0)
+            set_price(999)
+            ingest = SignalIngest()
+            await ingest.start(factory, journal_dir)
+            await wait_applied(ingest, 2)
+            await ingest.stop()
+            return entries, await rows(factory)
+        finally:
+            await engine.dispose()
+
+    entries, table = asyncio.run(scenario())
+    assert entries == [("INGESTUSDT", {"INGESTUSDT": 100.0}), ("INGESTUSDT", {"INGESTUSDT": 130.0})]
+    assert table == [("x", True, 100.0, 130.0)]
+
+
+def test_signals_without_a_receive_time_price_are_not_accepted(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_COMMIT_WINDOW", 0)
+    journal_dir = str(tmp_path / "journal")
+
+    async def no_price(symbol, *args, **kwargs):
+        return None
+
+    async def scenario():
+        engine, factory = await make_factory(tmp_path)
+        try:
+            # 旧格式、没有价格的记录：不能按重放时的价格写入
+            os.makedirs(journal_dir)
+            with open(os.path.join(journal_dir, "signals.journal"), "wb") as f:
+                f.write(JournalEntry(1, china_now(), UNRESOLVED, {}, opened("legacy")).encode())
+            ingest = SignalIngest()
+            await ingest.start(factory, journal_dir)
+            await wait_applied(ingest, 1)
+            status = ingest.status(1)
+
+            monkeypatch.setattr(binance_ws, "wait_for_price", no_price)
+            try:
+                await ingest.submit(opened("unpriced"))
+            except RuntimeError:
+                pass
+            else:
+                raise AssertionError("signal without a price accepted")
+            next_seq = ingest.journal.next_seq
+            await ingest.stop()
+            return status, next_seq, await rows(factory)
+        finally:
+            await engine.dispose()
+
+    status, next_seq, table = asyncio.run(scenario())
+    assert status["result"]["status"] == "dead_letter"
+    assert next_seq == 2
+    assert table == []
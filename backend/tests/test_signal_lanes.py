@@ -0,0 +1,109 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.models.trading import Base, TradingSignal
+from app.schemas import TradingSignal as TradingSignalSchema
+from app.services.binance_ws import binance_ws
+from app.services.position_index import position_index
+from app.services.signal_lanes import SignalLanes
+
+
+def opened(trade_id):
+    return TradingSignalSchema(is_close="0", trade_id=trade_id, title="lanes", currentcy="LANESUSDT", side="buy")
+
+
+def closed(trade_id):
+    return TradingSignalSchema(is_close="1", trade_id=trade_id)
+
+
+@asynccontextmanager
+async def no_session():
+    yield None
+
+
+def test_same_trade_in_order_different_trades_in_parallel():
+    lanes = SignalLanes(count=8)
+    trades = [f"t{i}" for i in range(40)]
+    seen = {}
+
+    async def handler(db, signal):
+        seen.setdefault(signal.trade_id, []).append(signal.is_close)
+        await asyncio.sleep(random.uniform(0, 0.02))
+        return signal.is_close
+
+    async def scenario():
+        lanes.start(no_session, handler)
+        started = time.perf_counter()
+        try:
+            results = await asyncio.gather(*(lanes.submit(signal) for trade_id in trades
+                                             for signal in (opened(trade_id), closed(trade_id))))
+        finally:
+            await lanes.stop()
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(scenario())
+    assert results == ["0", "1"] * len(trades)
+    assert all(seen[trade_id] == ["0", "1"] for trade_id in trades)
+    # 80 条信号逐条处理约 0.8 秒，8 条通道并行时约为其 1/8
+    assert elapsed < 0.4
+
+
+def test_open_and_close_arriving_together(tmp_path):
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/lanes.sqlite")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with factory() as db:
+            await position_index.load(db)
+        binance_ws.handle_message({"s": "LANESUSDT", "p": "100"})
+        lanes = SignalLanes(count=4)
+        lanes.start(factory)
+        try:
+            results = await asyncio.gather(*(lanes.submit(signal) for i in range(20)
+                                             for signal in (opened(f"x{i}"), closed(f"x{i}"))))
+            async with factory() as db:
+                rows = (await db.scalars(select(TradingSignal))).all()
+        finally:
+            await lanes.stop()
+            await engine.dispose()
+        return results, rows
+
+    results, rows = asyncio.run(scenario())
+    assert all(result is not None for result in results)
+    assert len(rows) == 20
+    assert all(row.is_close and row.close_price == 100.0 for row in rows)
+
+
+def test_batch_waits_for_earlier_signals_and_holds_later_ones():
+    lanes = SignalLanes(count=4)
+    order = []
+
+    async def handler(db, signal):
+        await asyncio.sleep(0.01)
+        order.append(signal.trade_id + signal.is_close)
+
+    async def batch_handler(db, signals):
+        await asyncio.sleep(0.02)
+        order.extend(signal.trade_id + "b" for signal in signals)
+        return len(signals)
+
+    async def scenario():
+        lanes.start(no_session, handler)
+        try:
+            first = [asyncio.ensure_future(lanes.submit(opened(f"t{i}"))) for i in range(4)]
+            await asyncio.sleep(0)
+            batch = asyncio.ensure_future(lanes.submit_batch([closed(f"t{i}") for i in range(4)], batch_handler))
+            await asyncio.sleep(0)
+            later = [asyncio.ensure_future(lanes.submit(closed(f"t{i}"))) for i in range(4)]
+            await asyncio.gather(*first, *later)
+            return await batch
+        finally:
+            await lanes.stop()
+
+    assert asyncio.run(scenario()) == 4
+    for i in range(4):
+        assert order.index(f"t{i}0") < order.index(f"t{i}b") < order.index(f"t{i}1")
@@ -0,0 +1,92 @@
+import asyncio
+from sqlalchemy import delete, select
+from app.models.trading import StrategyDailyStats, StrategyState
+from app.schemas import TradingSignal as TradingSignalSchema
+from app.services.binance_ws import binance_ws
+from app.services.strategy_state import backfill_if_needed, get_state, rebuild
+from app.services.trading_service import TradingService
+
+
+async def trade(db, trade_id, title, open_price, close_price, side="buy"):
+    for is_close, price in (("0", open_price), ("1", close_price)):
+        binance_ws.handle_message({"s": "BTCUSDT", "p": str(price)})
+        signal = TradingSignalSchema(is_close=is_close, trade_id=trade_id, title=title, currentcy="BTCUSDT", side=side)
+        result = await TradingService.create_signal(db, signal)
+    return result
+
+
+def snapshot(state):
+    data = state.to_dict()
+    data["total_profit"] = round(data["total_profit"], 9)
+    data["peak_profit"] = round(data["peak_profit"], 9)
+    return data
+
+
+async def all_states(db):
+    db.expire_all()
+    daily = sorted((d.day, d.title, d.close_count, d.win_count, d.lose_count, round(d.total_profit, 9))
+                   for d in await db.scalars(select(StrategyDailyStats)))
+    return {state.title: snapshot(state) for state in await db.scalars(select(StrategyState))}, daily
+
+
+def test_each_close_updates_state_in_the_same_transaction(new_session):
+    async def scenario():
+        async with new_session() as db:
+            # +10%, +10%, -20%, -5%（做空）, +5%
+            results = [await trade(db, "a1", "alpha", 100, 110), await trade(db, "a2", "alpha", 100, 110),
+                       await trade(db, "a3", "alpha", 100, 80), await trade(db, "a4", "alpha", 100, 105, side="sell"),
+                       await trade(db, "a5", "alpha", 100, 105), await trade(db, "b1", "beta", 100, 90)]
+            assert [(r.win_streak, r.lose_streak) for r in results] == [
+                (1, 0), (2, 0), (0, 1), (0, 2), (1, 0), (0, 1)]
+
+            alpha = await get_state(db, "alpha")
+            assert (alpha.win_streak, alpha.lose_streak, alpha.trade_count, alpha.win_count,
+                    alpha.loss_count) == (1, 0, 5, 3, 2)
+            assert round(alpha.total_profit, 9) == 0.0
+            assert round(alpha.peak_profit, 9) == 20.0
+            assert alpha.last_signal_id == results[4].id
+            assert (await get_state(db, "beta")).loss_count == 1
+
+    asyncio.run(scenario())
+
+
+def test_backfill_rebuilds_the_live_state(new_session):
+    async def scenario():
+        async with new_session() as db:
+            for i, (open_price, close_price) in enumerate([(100, 110), (100, 95), (100, 90), (100, 120)]):
+                await trade(db, f"t{i}", "alpha" if i % 2 else "beta", open_price, close_price)
+            live = await all_states(db)
+            assert [(row[1], row[2]) for row in live[1]] == [("alpha", 2), ("beta", 2)]
+
+            await db.execute(delete(StrategyState))
+            await db.execute(delete(StrategyDailyStats))
+            await db.commit()
+            await rebuild(db)
+            assert await all_states(db) == live
+
+    asyncio.run(scenario())
+
+
+def test_startup_backfill_runs_only_when_state_is_behind(new_session):
+    async def scenario():
+        async with new_session() as db:
+            await trade(db, "t1", "alpha", 100, 110)
+            await trade(db, "t2", "alpha", 100, 90)
+            live = await all_states(db)
+            assert not await backfill_if_needed(db)
+
+            # 升级前的库：有平仓记录，汇总表为空
+            await db.execute(delete(StrategyState))
+            await db.execute(delete(StrategyDailyStats))
+            await db.commit()
+            assert await backfill_if_needed(db)
+            assert await all_states(db) == live
+            assert not await backfill_if_needed(db)
+
+            # 已有 strategy_state 的库升级后新建的日汇总表为空
+            await db.execute(delete(StrategyDailyStats))
+            await db.commit()
+            assert await backfill_if_needed(db)
+            assert await all_states(db) == live
+
+    asyncio.run(scenario())
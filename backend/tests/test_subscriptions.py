@@ -0,0 +1,67 @@
+import asyncio
+import json
+from app.services.binance_ws import BinanceWebSocket
+from app.services.subscriptions import SubscriptionRegistry, normalize_symbol, parse_symbols, WILDCARD
+
+
+class FakeClient:
+    def __init__(self):
+        self.received = []
+
+    async def send_text(self, text):
+        self.received.append(json.loads(text))
+
+    async def close(self):
+        pass
+
+
+def test_normalize_and_parse_symbols():
+    assert normalize_symbol("btc") == "BTCUSDT"
+    assert normalize_symbol("btcusdt") == "BTCUSDT"
+    assert normalize_symbol(" ETHUSDT ") == "ETHUSDT"
+    assert normalize_symbol("all") == WILDCARD
+    assert parse_symbols("btc,eth,,BTCUSDT") == ["BTCUSDT", "ETHUSDT"]
+
+
+def test_registry_routes_by_symbol_and_wildcard():
+    registry = SubscriptionRegistry()
+    registry.subscribe("a", "btc")
+    registry.subscribe_many("b", ["btc", "eth"])
+    registry.subscribe("w", WILDCARD)
+    registry.subscribe("w", "btc")
+
+    assert list(registry.subscribers("BTCUSDT")) == ["a", "b", "w"]
+    assert list(registry.subscribers("ETHUSDT")) == ["b", "w"]
+    assert list(registry.subscribers("XRPUSDT")) == ["w"]
+
+    registry.unsubscribe("b", "btc")
+    assert list(registry.subscribers("BTCUSDT")) == ["a", "w"]
+    registry.unsubscribe_all("w")
+    assert list(registry.subscribers("XRPUSDT")) == []
+    assert registry.symbols() == {"BTCUSDT", "ETHUSDT"}
+    assert registry.symbols_of("b") == {"ETHUSDT"}
+
+
+def test_ticks_reach_only_symbol_subscribers():
+    async def scenario():
+        feed = BinanceWebSocket()
+        btc_only, multi, everything = FakeClient(), FakeClient(), FakeClient()
+        await feed.register(btc_only, symbols=["btc"])
+        await feed.register(multi, symbols=parse_symbols("eth,xrp"))
+        await feed.register(everything)
+        callback_prices = []
+        feed.add_price_callback("ETH", lambda symbol, price: callback_prices.append((symbol, price)))
+
+        feed.handle_message({"s": "BTCUSDT", "p": "52000"})
+        feed.handle_message({"s": "ETHUSDT", "p": "3200"})
+        await asyncio.sleep(0.01)
+        await feed.handle_client_message(multi, json.dumps({"method": "UNSUBSCRIBE", "params": ["eth"]}))
+        feed.handle_message({"s": "ETHUSDT", "p": "3300"})
+        await asyncio.sleep(0.01)
+        return btc_only, multi, everything, callback_prices
+
+    btc_only, multi, everything, callback_prices = asyncio.run(scenario())
+    assert btc_only.received == [{"s": "BTCUSDT", "p": "52000.0"}]
+    assert multi.received == [{"s": "ETHUSDT", "p": "3200.0"}]
+    assert [m["s"] for m in everything.received] == ["BTCUSDT", "ETHUSDT", "ETHUSDT"]
+    assert callback_prices == [("ETHUSDT", 3200.0), ("ETHUSDT", 3300.0)]
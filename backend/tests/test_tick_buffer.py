@@ -0,0 +1,41 @@
+import numpy as np
+from app.services.tick_buffer import TickRingBuffer, TickStore
+
+
+def filled(capacity, n):
+    buffer = TickRingBuffer(capacity)
+    for i in range(n):
+        buffer.append(1000 + i, float(i))
+    return buffer
+
+
+def test_buffer_keeps_latest_ticks_after_wrap():
+    buffer = filled(5, 8)
+    ticks = buffer.since().to_dict()
+    assert ticks["ts"] == [1003, 1004, 1005, 1006, 1007]
+    assert ticks["price"] == [3.0, 4.0, 5.0, 6.0, 7.0]
+    assert buffer.ts.nbytes == 5 * 8
+
+
+def test_since_returns_views_across_the_wrap_point():
+    buffer = filled(5, 8)
+    ticks = buffer.since(1004)
+    assert ticks.to_dict()["ts"] == [1004, 1005, 1006, 1007]
+    assert len(ticks.segments) == 2
+    assert all(np.shares_memory(ts, buffer.ts) for ts, _ in ticks.segments)
+
+
+def test_since_and_latest_respect_limit():
+    buffer = filled(5, 8)
+    assert buffer.since(1003, limit=3).to_dict()["ts"] == [1003, 1004, 1005]
+    assert buffer.since(limit=2).to_dict()["ts"] == [1006, 1007]
+    assert len(buffer.since(2000)) == 0
+
+
+def test_store_keeps_one_buffer_per_symbol():
+    store = TickStore(capacity=3)
+    store.record("BTCUSDT", 1, 52000.0)
+    store.record("ETHUSDT", 1, 3200.0)
+    store.record("BTCUSDT", 2, 52001.0)
+    assert store.get("BTCUSDT").since().to_dict() == {"ts": [1, 2], "price": [52000.0, 52001.0]}
+    assert store.get("XRPUSDT") is None
@@ -0,0 +1,89 @@
+import asyncio
+import json
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.models.trading import Base, TradingSignal
+from app.schemas import TradingSignal as TradingSignalSchema
+from app.services.binance_ws import binance_ws
+from app.services.feed_recorder import FeedRecorder, ReplaySource
+from app.services.position_index import OpenPosition, position_index
+from app.services.signal_lanes import signal_lanes
+from app.services.trading_service import TradingService
+from app.services.trigger_engine import STOP_LOSS, TAKE_PROFIT, TriggerBook, TriggerEngine
+
+
+def test_book_fires_crossed_levels_once():
+    book = TriggerBook()
+    book.add(OpenPosition(1, "long", None, "BTCUSDT", "buy", 100.0, stop_loss=90.0, take_profit=120.0))
+    book.add(OpenPosition(2, "short", None, "BTCUSDT", "sell", 100.0, stop_loss=110.0, take_profit=80.0))
+    book.add(OpenPosition(3, "gone", None, "BTCUSDT", "buy", 100.0, stop_loss=99.0))
+    book.remove("gone")
+
+    assert book.crossed(100.0) == []
+    assert book.crossed(115.0) == [("short", 2, STOP_LOSS, 110.0)]
+    assert book.crossed(125.0) == [("long", 1, TAKE_PROFIT, 120.0)]
+    assert book.crossed(50.0) == []
+    assert book.live == {}
+
+
+def mark_price(price, event_time):
+    return json.dumps({"stream": "trigusdt@markPrice@1s",
+                       "data": {"e": "markPriceUpdate", "E": event_time, "s": "TRIGUSDT", "p": str(price)}})
+
+
+def opened(trade_id, side, stop_loss, take_profit):
+    return TradingSignalSchema(is_close="0", trade_id=trade_id, title="trigger", currentcy="TRIGUSDT", side=side,
+                               zs_tp_trigger_px=str(stop_loss), zy_tp_trigger_px=str(take_profit))
+
+
+def test_replayed_feed_closes_positions_at_the_triggering_tick(tmp_path):
+    recorder = FeedRecorder(str(tmp_path / "feed"))
+    path = [100, 102, 104, 106, 103, 108, 111, 109, 112]
+    for i, price in enumerate(path):
+        recorder.record(mark_price(price, 1_700_000_000_000 + i * 1000), (1_700_000_000 + i) * 10**9)
+    recorder.close()
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/trigger.sqlite")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with factory() as db:
+            await position_index.load(db)
+            binance_ws.handle_message({"s": "TRIGUSDT", "p": "100"})
+            for signal in (opened("long", "buy", 95, 110), opened("short", "sell", 105, 90),
+                           opened("wide", "buy", 80, 130)):
+                await TradingService.create_signal(db, signal)
+
+        triggers = TriggerEngine()
+        signal_lanes.start(factory)
+        triggers.start()
+        try:
+            await ReplaySource(str(tmp_path / "feed"), speed=0).run(binance_ws)
+            while triggers.closing:
+                await asyncio.gather(*triggers.closing)
+            async with factory() as db:
+                rows = {row.trade_id: (row.is_close, row.close_price)
+                        for row in await db.scalars(select(TradingSignal))}
+        finally:
+            triggers.stop()
+            await signal_lanes.stop()
+            await engine.dispose()
+        return rows, sorted(position_index.positions)
+
+    rows, still_open = asyncio.run(scenario())
+    assert rows == {"long": (True, 111.0), "short": (True, 106.0), "wide": (False, None)}
+    assert still_open == ["wide"]
+
+
+def test_only_the_feed_owner_fires(monkeypatch):
+    class FollowerTable:
+        is_owner = False
+
+    triggers = TriggerEngine()
+    book = triggers.books["TRIGUSDT"] = TriggerBook()
+    book.add(OpenPosition(1, "long", None, "TRIGUSDT", "buy", 100.0, stop_loss=90.0))
+    monkeypatch.setattr(binance_ws, "shared_table", FollowerTable())
+    triggers.on_tick("TRIGUSDT", 80.0)
+    # 非所有者保留触发价，接管行情后由它触发
+    assert not triggers.closing and book.live == {"long": 1}
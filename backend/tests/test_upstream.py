@@ -0,0 +1,169 @@
+import asyncio
+import json
+import time
+import websockets
+from app.services.upstream import UpstreamConnectionManager
+
+
+class FakeExchange:
+    """本地替身：接受 SUBSCRIBE 帧，按订阅推送 combined-stream 格式的 markPrice"""
+
+    def __init__(self):
+        self.connections = {}  # websocket -> 已订阅的 stream
+        self.frames = []       # (websocket, frame)
+        self.server = None
+        self.url = None
+
+    async def start(self):
+        self.server = await websockets.serve(self._handler, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = f"ws://127.0.0.1:{port}/stream"
+        self._pusher = asyncio.create_task(self._push())
+
+    async def stop(self):
+        self._pusher.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handler(self, websocket):
+        self.connections[websocket] = set()
+        try:
+            async for raw in websocket:
+                frame = json.loads(raw)
+                self.frames.append((websocket, frame))
+                if frame["method"] == "SUBSCRIBE":
+                    self.connections[websocket].update(frame["params"])
+                await websocket.send(json.dumps({"result": None, "id": frame["id"]}))
+        finally:
+            self.connections.pop(websocket, None)
+
+    async def _push(self):
+        while True:
+            event_time = int(time.time() * 1000)
+            for websocket, streams in list(self.connections.items()):
+                for stream in streams:
+                    symbol = stream.split("@")[0].upper()
+                    message = {"stream": stream, "data": {"e": "markPriceUpdate", "E": event_time, "s": symbol, "p": "1.0"}}
+                    try:
+                        await websocket.send(json.dumps(message))
+                    except websockets.ConnectionClosed:
+                        pass
+            await asyncio.sleep(0.02)
+
+    async def kill(self, websocket):
+        await websocket.close()
+
+
+async def wait_until(predicate, timeout=3):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.01)
+
+
+def stream(symbol):
+    return f"{symbol}@markPrice@1s"
+
+
+def test_streams_are_sharded_within_connection_limit():
+    async def scenario():
+        exchange = FakeExchange()
+        await exchange.start()
+        received = set()
+        manager = UpstreamConnectionManager(exchange.url, lambda raw, data: received.add(data["s"]),
+                                            max_streams=2, min_connections=1, batch_window=0.05, reconnect_delay=0.05)
+        symbols = ["btcusdt", "ethusdt", "xrpusdt", "solusdt", "runeusdt"]
+        runner = asyncio.create_task(manager.run([stream(s) for s in symbols]))
+        await wait_until(lambda: len(received) == 5)
+        subscribed = [streams for streams in exchange.connections.values()]
+        frames = list(exchange.frames)
+        await manager.stop()
+        await runner
+        await exchange.stop()
+        return subscribed, frames
+
+    subscribed, frames = asyncio.run(scenario())
+    assert len(subscribed) == 3
+    assert all(len(streams) <= 2 for streams in subscribed)
+    # 每条连接建立时只发一个 SUBSCRIBE 帧，且 id 各不相同
+    assert len(frames) == 3
+    assert len({frame["id"] for _, frame in frames}) == 3
+
+
+def test_new_subscriptions_are_batched_into_one_frame():
+    async def scenario():
+        exchange = FakeExchange()
+        await exchange.start()
+        received = set()
+        manager = UpstreamConnectionManager(exchange.url, lambda raw, data: received.add(data["s"]),
+                                            max_streams=10, min_connections=1, batch_window=0.05, reconnect_delay=0.05)
+        runner = asyncio.create_task(manager.run([stream("btcusdt")]))
+        await wait_until(lambda: "BTCUSDT" in received)
+        for symbol in ["ethusdt", "xrpusdt", "solusdt"]:
+            manager.subscribe([stream(symbol)])
+            await asyncio.sleep(0.005)
+        await wait_until(lambda: len(received) == 4)
+        frames = [frame for _, frame in exchange.frames]
+        await manager.stop()
+        await runner
+        await exchange.stop()
+        return frames
+
+    frames = asyncio.run(scenario())
+    assert len(frames) == 2
+    assert sorted(frames[1]["params"]) == [stream("ethusdt"), stream("solusdt"), stream("xrpusdt")]
+    assert frames[0]["id"] != frames[1]["id"]
+
+
+def test_streams_move_to_live_shard_when_a_connection_drops():
+    async def scenario():
+        exchange = FakeExchange()
+        await exchange.start()
+        last_seen = {}
+        manager = UpstreamConnectionManager(exchange.url, lambda raw, data: last_seen.__setitem__(data["s"], time.monotonic()),
+                                            max_streams=10, min_connections=2, batch_window=0.05, reconnect_delay=5)
+        symbols = ["btcusdt", "ethusdt", "xrpusdt", "solusdt"]
+        runner = asyncio.create_task(manager.run([stream(s) for s in symbols]))
+        await wait_until(lambda: len(last_seen) == 4 and len(exchange.connections) == 2)
+
+        victim, victim_streams = next(iter(exchange.connections.items()))
+        victim_streams = set(victim_streams)
+        await exchange.kill(victim)
+        killed_at = time.monotonic()
+        # 原连接 5 秒后才会重连，这期间行情必须由另一条连接继续推送
+        await wait_until(lambda: all(last_seen[s.split("@")[0].upper()] > killed_at + 0.05 for s in victim_streams), timeout=1)
+        survivors = [streams for streams in exchange.connections.values()]
+        await manager.stop()
+        await runner
+        await exchange.stop()
+        return survivors
+
+    survivors = asyncio.run(scenario())
+    assert len(survivors) == 1
+    assert survivors[0] == {stream(s) for s in ["btcusdt", "ethusdt", "xrpusdt", "solusdt"]}
+
+
+def test_rotation_opens_replacement_before_closing():
+    async def scenario():
+        exchange = FakeExchange()
+        await exchange.start()
+        events = []
+        manager = UpstreamConnectionManager(exchange.url, lambda raw, data: events.append((data["s"], data["E"])),
+                                            max_streams=10, min_connections=1, batch_window=0.05, reconnect_delay=0.05)
+        runner = asyncio.create_task(manager.run([stream("btcusdt")]))
+        await wait_until(lambda: len(events) > 2)
+        await manager.rotate(manager.shards[0])
+        count = len(events)
+        await wait_until(lambda: len(events) > count + 2)
+        shards = len(manager.shards)
+        await manager.stop()
+        await runner
+        await exchange.stop()
+        return events, shards
+
+    events, shards = asyncio.run(scenario())
+    assert shards == 1
+    times = [e for _, e in events]
+    # 重叠期间的重复推送按事件时间去重
+    assert times == sorted(set(times))
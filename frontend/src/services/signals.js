@@ -0,0 +1,16 @@
+export const SIGNAL_PAGE_SIZE = 100;
+export const SIGNAL_PAGE_MAX = 1000; // 与后端 /api/signals 的 limit 上限一致
+
+// 每个 trade_id 的最新记录，按 id 倒序分页；下一页游标在 X-Next-Cursor 响应头里，没有更多时为 null
+export async function fetchSignalPage(url, { limit = SIGNAL_PAGE_SIZE, after = null, ...options } = {}) {
+    const params = new URLSearchParams({ limit: String(Math.min(limit, SIGNAL_PAGE_MAX)) });
+    if (after !== null) {
+        params.set('after', String(after));
+    }
+    const response = await fetch(`${url}?${params}`, options);
+    if (!response.ok) {
+        throw new Error(`Failed to fetch signals: ${response.status}`);
+    }
+    const cursor = response.headers.get('X-Next-Cursor');
+    return { signals: await response.json(), nextCursor: cursor === null ? null : Number(cursor) };
+}